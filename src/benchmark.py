@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Dict, List, TypedDict
+
+import pandas as pd
+from carbon import get_carbon_models, CarbonModel
+from task import read_task_trace
+from run import prepare_experiment
+from profiler import PROFILER
+from scheduling import ScheduleCache, SOLVERS, default_solver_options
+from sweep import WORK_PHASES
+
+# jobs of the bundled traces that are benchmarked with --scale 1, the first ones by arrival
+BENCHMARK_TRACES: Dict[str, int] = {
+    "pai_200": 200,
+    "pai_1k": 1000,
+    "pai-100k": 10000,
+    "evaluation_jobs": 6,
+}
+# phased jobs need lengths that are multiples of their phases, on the pai traces the timeslots
+# of the LP would be a few seconds long, so suspend-resume-dynamic-power only runs on these
+DYNAMIC_POWER_TRACES = ["evaluation_jobs"]
+# suspend-resume-dynamic-power is suspend-resume with phased jobs, scheduled by the LP (or --solver dp)
+SCHEDULING_POLICIES = ["carbon", "carbon-cost", "suspend-resume", "suspend-resume-threshold", "suspend-resume-batch", "suspend-resume-dynamic-power"]
+CARBON_POLICIES = ["oracle", "lowest", "waiting", "cst_oracle", "cst_average"]
+# only these policies use the carbon policy to pick start times, the others are run once with oracle
+CARBON_POLICY_SCHEDULERS = ["carbon", "carbon-cost"]
+DYNAMIC_POWER_PHASES = f"{{'startup':[{{'name': 'startup','duration': 300, 'power': 200}}],'work':{WORK_PHASES[0]}}}"
+# profiler timers reported per case
+STAGES = [
+    "tasks.load",
+    "trace.tasks.create",
+    "simulate",
+    "scheduler.submit",
+    "scheduler.execute",
+    "compute_carbon_consumption",
+    "lp.build",
+    "lp.solve",
+    "dp.solve",
+    "batch.plan",
+    "cluster.save_results",
+]
+
+# loaded once by the parent, each case runs in a fresh forked process
+_carbon_model: CarbonModel | None = None
+_task_traces: Dict[str, pd.DataFrame] = {}
+
+
+class BenchmarkCase(TypedDict):
+    name: str
+    task_trace: str
+    jobs: int
+    scheduling_policy: str
+    carbon_policy: str
+
+
+class BenchmarkResult(TypedDict):
+    name: str
+    task_trace: str
+    jobs: int
+    scheduling_policy: str
+    carbon_policy: str
+    seconds: float
+    jobs_per_second: float
+    peak_rss_mb: float
+    stages: Dict[str, float]
+
+
+def expand_cases(task_traces: List[str], scale: float, scheduling_policies: List[str], carbon_policies: List[str]) -> List[BenchmarkCase]:
+    """Every scheduling policy with every carbon policy it uses, on a subset of each trace. Phased jobs
+    with dynamic power are benchmarked on DYNAMIC_POWER_TRACES, the other policies on the remaining traces.
+
+    Args:
+        task_traces (List[str]): names of BENCHMARK_TRACES
+        scale (float): factor of the benchmarked jobs per trace
+        scheduling_policies (List[str]): scheduling algorithms of SCHEDULING_POLICIES
+        carbon_policies (List[str]): carbon waiting policies
+
+    Returns:
+        List[BenchmarkCase]: one entry per run
+    """
+    cases = []
+    for task_trace in task_traces:
+        jobs = max(int(BENCHMARK_TRACES[task_trace] * scale), 1)
+        for scheduling_policy in scheduling_policies:
+            if (scheduling_policy == "suspend-resume-dynamic-power") != (task_trace in DYNAMIC_POWER_TRACES):
+                continue
+            policies = carbon_policies if scheduling_policy in CARBON_POLICY_SCHEDULERS else ["oracle"]
+            for carbon_policy in policies:
+                cases.append(BenchmarkCase(
+                    name=f"{task_trace}_{jobs}_{scheduling_policy}_{carbon_policy}",
+                    task_trace=task_trace,
+                    jobs=jobs,
+                    scheduling_policy=scheduling_policy,
+                    carbon_policy=carbon_policy,
+                ))
+    return cases
+
+
+def run_case(case: BenchmarkCase, args: argparse.Namespace) -> BenchmarkResult:
+    """Run and time a single case, called in a fresh process so the peak RSS is its own
+
+    Args:
+        case (BenchmarkCase): benchmark case
+        args (argparse.Namespace): parameters shared by all cases
+
+    Returns:
+        BenchmarkResult: throughput, peak RSS and time per stage
+    """
+    assert _carbon_model is not None
+    PROFILER.enabled = True
+    dynamic_power = case["scheduling_policy"] == "suspend-resume-dynamic-power"
+    trace = _task_traces[case["task_trace"]]
+    tasks = trace.iloc[trace["arrival_time"].to_numpy().argsort(kind="stable")[:case["jobs"]]]
+
+    start = time.perf_counter()
+    prepare_experiment(
+        args.start_index,
+        args.carbon_trace,
+        case["task_trace"],
+        "suspend-resume" if dynamic_power else case["scheduling_policy"],
+        case["carbon_policy"],
+        args.reserved_instances,
+        args.waiting_times,
+        "queue1",
+        True,
+        dynamic_power,
+        "periodic-phases" if dynamic_power else None,
+        DYNAMIC_POWER_PHASES if dynamic_power else None,
+        os.path.join(args.output, case["name"]),
+        args.event_driven,
+        carbon_model=_carbon_model,
+        task_trace_df=tasks,
+        solver_options=default_solver_options(args.solver),
+        schedule_cache=ScheduleCache(),
+    )
+    seconds = time.perf_counter() - start
+
+    return BenchmarkResult(
+        **case,
+        seconds=seconds,
+        jobs_per_second=case["jobs"] / seconds,
+        # kilobytes on Linux, the pages shared with the parent are included
+        peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        stages={stage: PROFILER.timers[stage]["total"] for stage in STAGES if stage in PROFILER.timers},
+    )
+
+
+def run_isolated(case: BenchmarkCase, args: argparse.Namespace) -> BenchmarkResult:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as executor:
+        return executor.submit(run_case, case, args).result()
+
+
+def compare(results: List[BenchmarkResult], baseline: Dict[str, BenchmarkResult], tolerance: float) -> List[str]:
+    """Cases that are slower or use more memory than their baseline
+
+    Args:
+        results (List[BenchmarkResult]): results of this benchmark
+        baseline (Dict[str, BenchmarkResult]): stored results by case name
+        tolerance (float): allowed relative change, e.g. 0.2 for 20%
+
+    Returns:
+        List[str]: description of each regression
+    """
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["name"])
+        if previous is None:
+            continue
+        if result["jobs_per_second"] < previous["jobs_per_second"] * (1 - tolerance):
+            regressions.append(f"{result['name']}: {result['jobs_per_second']:.1f} jobs/s, baseline {previous['jobs_per_second']:.1f} jobs/s")
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{result['name']}: {result['peak_rss_mb']:.0f} MB peak RSS, baseline {previous['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def results_table(results: List[BenchmarkResult]) -> pd.DataFrame:
+    rows = []
+    for result in results:
+        row = {key: value for key, value in result.items() if key != "stages"}
+        row.update({stage: result["stages"].get(stage, 0.0) for stage in STAGES})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the scheduling and carbon policies on subsets of the bundled traces"
+    )
+    parser.add_argument("-t", "--task-traces", nargs="+", default=list(BENCHMARK_TRACES), choices=list(BENCHMARK_TRACES), dest="task_traces", help="Task traces")
+    parser.add_argument("--scale", type=float, default=1.0, dest="scale", help=f"Factor of the benchmarked jobs per trace, {BENCHMARK_TRACES} at 1")
+    parser.add_argument("--scheduling-policies", nargs="+", default=SCHEDULING_POLICIES, choices=SCHEDULING_POLICIES, dest="scheduling_policies")
+    parser.add_argument("--carbon-policies", nargs="+", default=CARBON_POLICIES, choices=CARBON_POLICIES, dest="carbon_policies")
+    parser.add_argument("-c", "--carbon-trace", default="DE-hourly-start-july", type=str, dest="carbon_trace", help="Carbon Trace")
+    parser.add_argument("-i", "--start-index", type=int, default=0, dest="start_index", help="carbon start index")
+    parser.add_argument("-r", "--reserved-instances", type=int, default=9, dest="reserved_instances", help="Reserved Instances")
+    parser.add_argument("-w", "--waiting-times", default="6x24", dest="waiting_times", help="Waiting times per queue `x` separated")
+    parser.add_argument("--solver", default="dp", dest="solver", choices=SOLVERS, help="Scheduler of suspend-resume-dynamic-power, the LP solvers take seconds to minutes per job")
+    parser.add_argument(
+        "--event-driven",
+        default=True,
+        dest="event_driven",
+        action=argparse.BooleanOptionalAction,
+        help="Jump between events instead of simulating every second"
+    )
+    parser.add_argument("--output", default="results/benchmark", dest="output", help="Directory of the results and the benchmark report")
+    parser.add_argument("--baseline", default="results/benchmark/baseline.json", dest="baseline", help="Stored results to compare with")
+    parser.add_argument("--save-baseline", default=False, dest="save_baseline", action=argparse.BooleanOptionalAction, help="Store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, dest="tolerance", help="Allowed relative loss of throughput and growth of peak RSS")
+    args = parser.parse_args()
+
+    cases = expand_cases(args.task_traces, args.scale, args.scheduling_policies, args.carbon_policies)
+    print(f"Running {len(cases)} benchmarks")
+
+    os.makedirs(args.output, exist_ok=True)
+    global _carbon_model
+    _carbon_model = get_carbon_models(args.carbon_trace, [args.start_index])[args.start_index]
+    for task_trace in args.task_traces:
+        # the runtime of each run is saved next to the simulation results
+        os.makedirs(f"results/simulation/{task_trace}", exist_ok=True)
+        _task_traces[task_trace] = read_task_trace(task_trace)
+
+    results = []
+    for i, case in enumerate(cases, start=1):
+        result = run_isolated(case, args)
+        results.append(result)
+        print(f"[{i}/{len(cases)}] {case['name']}: {result['jobs_per_second']:.1f} jobs/s, {result['peak_rss_mb']:.0f} MB")
+
+    table = results_table(results)
+    table.to_csv(os.path.join(args.output, "benchmark.csv"), index=False)
+    with open(os.path.join(args.output, "benchmark.json"), "w") as file:
+        json.dump(dict(results={result["name"]: result for result in results}), file, indent=2)
+    print(table[["name", "jobs_per_second", "peak_rss_mb", "simulate", "scheduler.submit"]].to_string(index=False))
+
+    regressions: List[str] = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        compared = sum(result["name"] in baseline for result in results)
+        print(f"Compared {compared} benchmarks with {args.baseline}, {len(regressions)} regressions")
+        for regression in regressions:
+            print(f"  {regression}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(dict(results={result["name"]: result for result in results}), file, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
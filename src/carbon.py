@@ -1,61 +1,191 @@
 from __future__ import annotations
+from functools import cached_property
+from typing import Dict, Iterable, Tuple
 import numpy as np
 import pandas as pd
 from pandas.core.frame import DataFrame
+from trace_cache import read_trace
+from profiler import PROFILER
 import os
 
 
 class CarbonModel():
+    """Carbon intensity trace. Only the values of the original (hourly) trace are stored,
+    each value covers `factor` samples of the model. Samples are mapped onto the stored
+    values arithmetically, so extending, slicing and reindexing the model never copies the trace.
+    """
 
-    def __init__(self, name: str, df: DataFrame, carbon_start_index: int, carbon_error: str) -> None:
+    def __init__(self, name: str, intensity: np.ndarray, carbon_start_index: int, carbon_error: str, factor: int = 1, offset: int = 0, length: int | None = None, extra: DataFrame | None = None, prefix_sum: np.ndarray | None = None) -> None:
+        """
+        Args:
+            name (str): carbon trace name
+            intensity (np.ndarray): carbon intensity per sample of a value
+            carbon_start_index (int): carbon trace start time
+            carbon_error (str): carbon error model
+            factor (int): amount of samples each value of intensity covers
+            offset (int): first sample of the model, relative to the first value of intensity
+            length (int | None): amount of samples in the model, by default all samples after offset
+            extra (DataFrame | None): additional columns, one row per value of intensity
+            prefix_sum (np.ndarray | None): shared prefix sums of a model with the same intensity and factor
+        """
         self.name = name
-        self.df = df
+        self.intensity = intensity
         self.carbon_start_index = carbon_start_index
         self.carbon_error = carbon_error
-        self.mean = self.df["carbon_intensity_avg"].mean()
-        self.std = self.df["carbon_intensity_avg"].std()
+        self.factor = factor
+        self.offset = offset
+        self.length = max(intensity.shape[0] * factor - offset, 0) if length is None else length
+        self.extra = extra
+        # sum of all samples before each value of intensity
+        self.prefix_sum = np.concatenate(([0.0], np.cumsum(intensity * factor))) if prefix_sum is None else prefix_sum
+
+    @cached_property
+    def mean(self) -> float:
+        return float(self.sum(0, self.length) / self.length) if self.length > 0 else float("nan")
+
+    @cached_property
+    def std(self) -> float:
+        return float(np.std(self.values(), ddof=1)) if self.length > 1 else float("nan")
+
+    def _view(self, start_index: int, end_index: int) -> CarbonModel:
+        start_index = min(max(start_index, 0), self.length)
+        end_index = min(max(end_index, start_index), self.length)
+        return CarbonModel(
+            self.name, self.intensity, self.carbon_start_index, self.carbon_error,
+            self.factor, self.offset + start_index, end_index - start_index, self.extra, self.prefix_sum
+        )
 
     def reindex(self, index: int) -> CarbonModel:
-        df = self.df[index:].copy().reset_index()
-        model = CarbonModel(self.name, df, self.carbon_start_index, self.carbon_error)
-        return model
+        return self._view(index, self.length)
 
     def subtrace(self, start_index: int, end_index: int) -> CarbonModel:
-        df = self.df[start_index: end_index].copy().reset_index()
-        model = CarbonModel(self.name, df,self.carbon_start_index, self.carbon_error)
-        return model
-    
+        return self._view(start_index, end_index)
+
     def extend(self, factor: int, extra_columns: bool = False) -> CarbonModel:
         # right now this is not interpolated between sample points, perhaps
         # chaning this could be cool.
-        df = self.df.loc[self.df.index.repeat(factor)].reset_index(drop=True)
-        df["carbon_intensity_avg"] /= factor
-        model = CarbonModel(self.name, df,self.carbon_start_index, self.carbon_error)
-        return model     
-        
-    def __getitem__(self, index: int) -> np.Series:
-        return self.df.iloc[index]['carbon_intensity_avg']
+        return CarbonModel(
+            self.name, self.intensity / factor, self.carbon_start_index, self.carbon_error,
+            self.factor * factor, self.offset * factor, self.length * factor, self.extra
+        )
+
+    def values(self, start_index: int = 0, end_index: int | None = None, step: int = 1) -> np.ndarray:
+        """Carbon intensity of every step-th sample in [start_index, end_index)
+
+        Args:
+            start_index (int): first sample
+            end_index (int | None): end of the range (exclusive), by default the end of the model
+            step (int): distance between samples
+
+        Returns:
+            np.ndarray: carbon intensities
+        """
+        end_index = self.length if end_index is None else min(end_index, self.length)
+        samples = np.arange(self.offset + start_index, self.offset + end_index, step)
+        return self.intensity[samples // self.factor]
+
+    def sum(self, start_index: int | np.ndarray, end_index: int | np.ndarray) -> float | np.ndarray:
+        """Sum of the carbon intensity of all samples in [start_index, end_index), works on arrays of ranges too
+
+        Args:
+            start_index (int | np.ndarray): first sample
+            end_index (int | np.ndarray): end of the range (exclusive)
+
+        Returns:
+            float | np.ndarray: summed carbon intensity
+        """
+        return self._cumulative(end_index) - self._cumulative(start_index)
+
+    def _cumulative(self, index: int | np.ndarray) -> float | np.ndarray:
+        sample = np.minimum(np.maximum(np.asarray(index), 0), self.length) + self.offset
+        value_index = np.minimum(sample // self.factor, self.intensity.shape[0] - 1)
+        return self.prefix_sum[value_index] + (sample - value_index * self.factor) * self.intensity[value_index]
+
+    def argmin(self, start_index: int, end_index: int) -> int:
+        """First sample with the lowest carbon intensity in [start_index, end_index)
+
+        Returns:
+            int: sample index relative to the model
+        """
+        end_index = min(end_index, self.length)
+        first_value = (self.offset + start_index) // self.factor
+        last_value = (self.offset + end_index - 1) // self.factor
+        lowest_value = first_value + int(np.argmin(self.intensity[first_value:last_value + 1]))
+        return max(lowest_value * self.factor - self.offset, start_index)
+
+    def blocks(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """The model as blocks of consecutive samples that share a stored value
+
+        Returns:
+            np.ndarray: first sample of each block, relative to the model
+            np.ndarray: amount of samples in each block
+            np.ndarray: carbon intensity of the samples in each block
+        """
+        if self.length == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        first_value = self.offset // self.factor
+        last_value = (self.offset + self.length - 1) // self.factor
+        edges = np.arange(first_value, last_value + 2) * self.factor - self.offset
+        edges = np.clip(edges, 0, self.length)
+        return edges[:-1], np.diff(edges), self.intensity[first_value:last_value + 1]
+
+    def quantile(self, q: float, start_index: int = 0, end_index: int | None = None) -> float:
+        return float(pd.Series(self.values(start_index, end_index)).quantile(q))
+
+    @property
+    def df(self) -> DataFrame:
+        """The model as one row per sample. This materializes the whole trace and is only meant for analysis."""
+        rows = (self.offset + np.arange(self.length)) // self.factor
+        df = pd.DataFrame({"carbon_intensity_avg": self.intensity[rows]})
+        if self.extra is not None:
+            for column in self.extra.columns:
+                df[column] = self.extra[column].to_numpy()[rows]
+        return df
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> float:
+        return self.intensity[(self.offset + index) // self.factor]
 
 
 def get_carbon_model(carbon_trace: str, carbon_start_index: int, carbon_error:str = "ORACLE", extra_columns: bool = False) -> CarbonModel:
+    return get_carbon_models(carbon_trace, [carbon_start_index], carbon_error, extra_columns)[carbon_start_index]
+
+
+@PROFILER.timed("trace.carbon.read")
+def get_carbon_models(carbon_trace: str, carbon_start_indices: Iterable[int], carbon_error: str = "ORACLE", extra_columns: bool = False) -> Dict[int, CarbonModel]:
+    """Carbon models of a trace at several start indices, the trace is read once and the models share its values
+
+    Args:
+        carbon_trace (str): carbon trace name
+        carbon_start_indices (Iterable[int]): carbon trace start times
+        carbon_error (str): carbon error model
+        extra_columns (bool): keep the datetime column
+
+    Returns:
+        Dict[int, CarbonModel]: carbon model per start index
+    """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     relative_path = f"traces/{carbon_trace}.csv"
     absolute_path = os.path.join(script_dir, relative_path)
-    df = pd.read_csv(absolute_path)
+    df = read_trace(absolute_path)
+    intensity = df["carbon_intensity_avg"].to_numpy(dtype=float) / 1000
 
-    # 17544 is 2 years
-    # 720 is 24 * 30, so a whole month
+    models = {}
+    for carbon_start_index in carbon_start_indices:
+        # 17544 is 2 years
+        # 720 is 24 * 30, so a whole month
 
-    # change this to 720 * 2 for two months, as some traces are longer than a month
+        # change this to 720 * 2 for two months, as some traces are longer than a month
 
-    # TODO: this does not quite work well yet.
-    # the first implementation did an implicit +2 years on the start index,
-    # which doesn't work for the DE trace
+        # TODO: this does not quite work well yet.
+        # the first implementation did an implicit +2 years on the start index,
+        # which doesn't work for the DE trace
 
-    # df = df[17544+carbon_start_index:17544+carbon_start_index+(720*2)]
-    df = df[carbon_start_index:carbon_start_index+(720*2)]
-    #df = pd.concat([df.copy(), df[:1000].copy()]).reset_index()
-    df = df[["carbon_intensity_avg", *(["datetime"] if extra_columns else [])]]
-    df["carbon_intensity_avg"] /= 1000
-    c = CarbonModel(carbon_trace, df, carbon_start_index, carbon_error)
-    return c
+        # df = df[17544+carbon_start_index:17544+carbon_start_index+(720*2)]
+        rows = slice(carbon_start_index, carbon_start_index+(720*2))
+        #df = pd.concat([df.copy(), df[:1000].copy()]).reset_index()
+        extra = df[["datetime"]][rows].reset_index(drop=True) if extra_columns else None
+        models[carbon_start_index] = CarbonModel(carbon_trace, intensity[rows], carbon_start_index, carbon_error, extra=extra)
+    return models
@@ -2,9 +2,11 @@ from carbon import CarbonModel
 from .simulation_cluster import SimulationCluster
 from .base_cluster import BaseCluster
 from .base_cluster import ON_DEMAND_COST_HOUR
+from .runtime_allocation import RuntimeAllocation
+from .results_sink import RESULT_FORMATS, ResultsSink, create_results_sink
 
 
-def create_cluster(scheduling_policy: str, carbon_model: CarbonModel, reserved_instances: int, experiment_name: str, waiting_times_str: str, cluster_partition: str):
+def create_cluster(scheduling_policy: str, carbon_model: CarbonModel, reserved_instances: int, experiment_name: str, waiting_times_str: str, cluster_partition: str, set_filename: str | None = None, results_format: str = "csv"):
     """Create Cluster Instance (Simulation and Real)
 
     Args:
@@ -14,6 +16,8 @@ def create_cluster(scheduling_policy: str, carbon_model: CarbonModel, reserved_i
         experiment_name (str): Hashed Configuration of tracking slurm tasks
         waiting_times_str (str): waiting times per queue
         cluster_partition (str): used cluster partition (queue), only for slurm experiments
+        set_filename (str | None): results file, the details are written next to it
+        results_format (str): file format of the details and runtime, one of RESULT_FORMATS
 
     Raises:
         Exception: Wrong Configuration
@@ -21,4 +25,4 @@ def create_cluster(scheduling_policy: str, carbon_model: CarbonModel, reserved_i
     Returns:
         _type_: Cluster
     """
-    return SimulationCluster(reserved_instances, carbon_model, experiment_name, "spot" in scheduling_policy)
+    return SimulationCluster(reserved_instances, carbon_model, experiment_name, "spot" in scheduling_policy, set_filename, results_format)
@@ -5,8 +5,10 @@ import pandas as pd
 from carbon import CarbonModel
 from task import Task, TIME_FACTOR
 from threading import Lock
+from .results_sink import create_results_sink
+from .runtime_allocation import RuntimeAllocation
 
-from typing import List, TypedDict
+from typing import TypedDict, get_type_hints
 
 ON_DEMAND_COST_HOUR = 0.0624
 SPOT_COST_HOUR = 0.01248  # 0.0341
@@ -41,6 +43,8 @@ class BaseCluster(ABC):
         carbon_model: CarbonModel,
         experiment_name: str,
         allow_spot: bool,
+        set_filename: str | None = None,
+        results_format: str = "csv",
     ) -> None:
         """Common Cluster Configurations
 
@@ -49,6 +53,8 @@ class BaseCluster(ABC):
             carbon_model (CarbonModel): Carbon Intensity Model
             experiment_name (str): Hashed Configuration of tracking slurm tasks
             allow_spot (bool): Allow using Spot Instances
+            set_filename (str | None): results file, the details are written next to it while the tasks are logged
+            results_format (str): file format of the details and runtime, one of RESULT_FORMATS
         """
         self.total_carbon_cost: float = 0.0
         self.total_dollar_cost: float = 0.0
@@ -59,9 +65,10 @@ class BaseCluster(ABC):
         self.total_reserved_instances = reserved_instances
         self.available_reserved_instances = reserved_instances
         self.carbon_model = carbon_model
-        self.details: List[TaskDetails] = []
+        self.results_format = results_format
+        self.details = create_results_sink(f"{set_filename}_details", results_format, get_type_hints(TaskDetails))
         self.experiment_name = experiment_name
-        self.runtime_allocation = [0] * carbon_model.df.shape[0]
+        self.runtime_allocation = RuntimeAllocation(len(carbon_model))
         self.lock = Lock()
         self.allow_spot = allow_spot
 
@@ -84,12 +91,28 @@ class BaseCluster(ABC):
         """
         pass
 
+    @abstractmethod
+    def next_release_time(self, current_time: int) -> int | None:
+        """Earliest time from current_time on at which resources are released, Only used in simulation
+
+        Args:
+            current_time (int): time index
+        """
+        pass
+
+    def allocated_cpus(self, current_time: int) -> int:
+        """CPUs in use by the tasks logged so far, cheap when queried with increasing time
+
+        Args:
+            current_time (int): time index
+        """
+        return self.runtime_allocation.allocated_cpus(current_time)
+
     def log_task(self, start_time: int, task: Task, dollar_cost: float, carbon: float, reason: str= "completed") -> None:
         waiting_time = start_time - task.arrival_time
         exit_time = start_time + task.task_length
         self.max_time = max(self.max_time, start_time)
-        for i in range(start_time, exit_time + 1):
-            self.runtime_allocation[i] += task.CPUs
+        self.runtime_allocation.add(start_time, exit_time, task.CPUs)
 
 
         # okay lets try something crazy, instead of just logging the task, we'll also log each phase 
@@ -155,39 +178,21 @@ class BaseCluster(ABC):
             exit_time = 0,
             reason = '',
         ))
-        df = pd.DataFrame(
-            self.details,
-            columns=[
-                "ID",
-                "arrival_time",
-                "length",
-                "cpus",
-                "length_class",
-                "resource_class",
-                "carbon_cost",
-                "dollar_cost",
-                "start_time",
-                "waiting_time",
-                "exit_time",
-                "reason",
-            ],
-        )
         # os.makedirs(f"results/{cluster_type}/{task_trace}/", exist_ok=True)
 
-        details_filename = f"{set_filename}_details"
         # details_filename = f"{task_trace}/details-{scheduling_policy}-{self.carbon_model.carbon_start_index}-{carbon_policy}-{carbon_trace}-{self.total_reserved_instances}-{waiting_times_str}.csv"
         
         # file_name = f"results/{cluster_type}/{details_filename}"
-        print(f"Saving details to {details_filename}")
-        df.to_csv(details_filename, index=False)
-        runtime_df = pd.DataFrame(self.runtime_allocation, columns=["cpus"])
-        runtime_df["time"] = range(self.carbon_model.df.shape[0])
-        runtime_df["time"] //= 60
-        runtime_df = runtime_df.groupby("time").mean().reset_index()
+        print(f"Saving details to {self.details.path}")
+        self.details.close()
+        # average allocation per minute
+        cpus_per_minute = self.runtime_allocation.mean_per(60)
+        runtime_df = pd.DataFrame({"time": range(len(cpus_per_minute)), "cpus": cpus_per_minute})
         runtime_filename = f"{task_trace}/runtime-{scheduling_policy}-{self.carbon_model.carbon_start_index}-{carbon_policy}-{carbon_trace}-{self.total_reserved_instances}-{waiting_times_str}.csv"
-        file_name = f"results/{cluster_type}/{runtime_filename}"
-        print(f"Saving runtime to {file_name}")
-        runtime_df.to_csv(file_name, index=False)
+        runtime = create_results_sink(f"results/{cluster_type}/{runtime_filename}", self.results_format, {"time": int, "cpus": float})
+        print(f"Saving runtime to {runtime.path}")
+        runtime.write(runtime_df)
+        runtime.close()
 
     # @abstractmethod
     # def sleep(self):
@@ -0,0 +1,154 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Mapping
+
+import pandas as pd
+
+RESULT_FORMATS: List[str] = ["csv", "parquet", "feather"]
+
+# records kept in memory before they are written
+BATCH_SIZE = 10000
+
+
+class ResultsSink(ABC):
+    """Table that is written in batches while records are appended, so memory stays bounded"""
+
+    def __init__(self, path: str, columns: Mapping[str, type], batch_size: int = BATCH_SIZE) -> None:
+        """
+        Args:
+            path (str): file the table is written to
+            columns (Mapping[str, type]): int, float or str per column, in order
+            batch_size (int): records kept in memory before they are written
+        """
+        self.path = path
+        self.columns = dict(columns)
+        self.batch_size = batch_size
+        self.records: List[Dict[str, Any]] = []
+        self.closed = False
+
+    def append(self, record: Mapping[str, Any]) -> None:
+        self.records.append(dict(record))
+        if len(self.records) >= self.batch_size:
+            self.flush()
+
+    def write(self, df: pd.DataFrame) -> None:
+        """Append all rows of a DataFrame
+
+        Args:
+            df (pd.DataFrame): rows with the columns of the table
+        """
+        self.flush()
+        for start in range(0, len(df), self.batch_size):
+            self._write(self._typed(df.iloc[start:start + self.batch_size]))
+
+    def flush(self) -> None:
+        if len(self.records) > 0:
+            self._write(self._typed(pd.DataFrame(self.records, columns=list(self.columns))))
+            self.records = []
+
+    def close(self) -> None:
+        """Write the remaining records and finish the file, an empty table is written as well"""
+        if self.closed:
+            return
+        self.flush()
+        self._close()
+        self.closed = True
+
+    def _typed(self, df: pd.DataFrame) -> pd.DataFrame:
+        # every batch has the same types, e.g. a cost of 0 is still a float
+        return df[list(self.columns)].astype({
+            column: object if column_type is str else column_type for column, column_type in self.columns.items()
+        })
+
+    @abstractmethod
+    def _write(self, df: pd.DataFrame) -> None:
+        pass
+
+    @abstractmethod
+    def _close(self) -> None:
+        pass
+
+
+class CsvSink(ResultsSink):
+    def __init__(self, path: str, columns: Mapping[str, type], batch_size: int = BATCH_SIZE) -> None:
+        super().__init__(path, columns, batch_size)
+        self.header_written = False
+
+    def _write(self, df: pd.DataFrame) -> None:
+        df.to_csv(self.path, mode="a" if self.header_written else "w", header=not self.header_written, index=False)
+        self.header_written = True
+
+    def _close(self) -> None:
+        if not self.header_written:
+            self._write(pd.DataFrame(columns=list(self.columns)))
+
+
+class ArrowSink(ResultsSink):
+    """Parquet or Feather (Arrow IPC) file, written one record batch at a time. Needs pyarrow."""
+
+    def __init__(self, path: str, columns: Mapping[str, type], file_format: str, batch_size: int = BATCH_SIZE) -> None:
+        """
+        Args:
+            path (str): file the table is written to
+            columns (Mapping[str, type]): int, float or str per column, in order
+            file_format (str): parquet or feather
+            batch_size (int): records kept in memory before they are written
+
+        Raises:
+            ValueError: pyarrow is not installed
+        """
+        super().__init__(path, columns, batch_size)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError(f"Results format {file_format} needs pyarrow, install it with pip3 install pyarrow")
+        self.pa = pa
+        arrow_types = {int: pa.int64(), float: pa.float64(), str: pa.string()}
+        self.schema = pa.schema([(column, arrow_types[column_type]) for column, column_type in self.columns.items()])
+        if file_format == "parquet":
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def _write(self, df: pd.DataFrame) -> None:
+        self.writer.write_table(self.pa.Table.from_pandas(df, schema=self.schema, preserve_index=False))
+
+    def _close(self) -> None:
+        self.writer.close()
+
+
+def results_path(path: str, file_format: str) -> str:
+    """Path of a result in the format, CSV results keep their path
+
+    Args:
+        path (str): path of the CSV result
+        file_format (str): one of RESULT_FORMATS
+
+    Returns:
+        str: path
+    """
+    if file_format == "csv":
+        return path
+    return f"{path.removesuffix('.csv')}.{file_format}"
+
+
+def create_results_sink(path: str, file_format: str, columns: Mapping[str, type], batch_size: int = BATCH_SIZE) -> ResultsSink:
+    """Create the sink for a result table
+
+    Args:
+        path (str): path of the CSV result, the extension is changed for other formats
+        file_format (str): one of RESULT_FORMATS
+        columns (Mapping[str, type]): int, float or str per column, in order
+        batch_size (int): records kept in memory before they are written
+
+    Raises:
+        ValueError: unknown format
+
+    Returns:
+        ResultsSink: sink
+    """
+    if file_format == "csv":
+        return CsvSink(path, columns, batch_size)
+    elif file_format in ("parquet", "feather"):
+        return ArrowSink(results_path(path, file_format), columns, file_format, batch_size)
+    raise ValueError(f"Unknown results format {file_format}, use one of {RESULT_FORMATS}")
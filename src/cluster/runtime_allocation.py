@@ -0,0 +1,73 @@
+import numpy as np
+
+
+class RuntimeAllocation:
+    """CPUs allocated in every second of the simulation. Only the changes are stored, +CPUs in the
+    first second of a task and -CPUs in the second after its last one, the allocation per second is
+    their cumulative sum.
+    """
+
+    def __init__(self, length: int) -> None:
+        """
+        Args:
+            length (int): amount of seconds
+        """
+        self.length = length
+        self.changes = np.zeros(length + 1, dtype=np.int64)
+        # allocation at current_time, advanced by allocated_cpus
+        self.current_time = 0
+        self.current_cpus = 0
+
+    def add(self, start_time: int, end_time: int, cpus: int) -> None:
+        """Allocate CPUs in every second from start_time to end_time
+
+        Args:
+            start_time (int): first second
+            end_time (int): last second (inclusive)
+            cpus (int): number of CPUs
+        """
+        if start_time < 0 or end_time >= self.length:
+            raise IndexError(f"Allocation from {start_time} to {end_time} is outside of the {self.length} seconds")
+        if end_time < start_time:
+            return
+        self.changes[start_time] += cpus
+        self.changes[end_time + 1] -= cpus
+        if start_time <= self.current_time <= end_time:
+            self.current_cpus += cpus
+
+    def allocated_cpus(self, time: int) -> int:
+        """CPUs allocated in a second. Querying seconds in increasing order only sums the changes in between.
+
+        Args:
+            time (int): time index
+
+        Returns:
+            int: number of CPUs
+        """
+        if time < self.current_time:
+            return int(self.changes[:time + 1].sum())
+        self.current_cpus += int(self.changes[self.current_time + 1:time + 1].sum())
+        self.current_time = time
+        return self.current_cpus
+
+    def per_second(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: CPUs allocated in every second
+        """
+        return np.cumsum(self.changes[:-1])
+
+    def mean_per(self, seconds: int) -> np.ndarray:
+        """Average allocation of consecutive periods, the last one may be shorter
+
+        Args:
+            seconds (int): length of a period
+
+        Returns:
+            np.ndarray: average CPUs allocated in each period
+        """
+        period_starts = np.arange(0, self.length, seconds)
+        if len(period_starts) == 0:
+            return np.zeros(0)
+        sums = np.add.reduceat(self.per_second(), period_starts)
+        return sums / np.diff(np.append(period_starts, self.length))
@@ -7,13 +7,16 @@ from .base_cluster import BaseCluster
 
 class SimulationCluster(BaseCluster):
     def __init__(
-        self, reserved_instances: int, carbon_model: CarbonModel, experiment_name: str, allow_spot: True
+        self, reserved_instances: int, carbon_model: CarbonModel, experiment_name: str, allow_spot: True,
+        set_filename: str | None = None, results_format: str = "csv"
     ) -> None:
         super().__init__(
             reserved_instances=reserved_instances,
             carbon_model=carbon_model,
             experiment_name=experiment_name,
             allow_spot=allow_spot,
+            set_filename=set_filename,
+            results_format=results_format,
         )
         self.release_instance: Dict[int, int] = {}
 
@@ -74,6 +77,17 @@ class SimulationCluster(BaseCluster):
         ), "Available Reserved greater thant Total"
         assert self.available_reserved_instances >= 0, "Greater than zero"
 
+    def next_release_time(self, current_time: int) -> int | None:
+        """Earliest time from current_time on at which reserved instances are released
+
+        Args:
+            current_time (int): time index
+
+        Returns:
+            int | None: time index or None if no reserved instances are in use
+        """
+        return min((time for time in self.release_instance if time >= current_time), default=None)
+
     def done(self) -> bool:
         return True
 
@@ -1,6 +1,8 @@
 from __future__ import annotations
-from typing import List, Tuple, TypedDict, Any, Iterable, NotRequired
-from functools import reduce
+from typing import Callable, Dict, List, Tuple, TypedDict, Any, NotRequired
+from functools import cached_property, reduce
+from bisect import bisect_left, bisect_right
+import math
 import numpy as np
 
 class Stawp(TypedDict):
@@ -21,6 +23,23 @@ class PowerFunction:
         self.duration_work: float = np.sum([phase['duration'] for phase in phases['work']])
         self.duration = self.duration_startup + self.duration_work
 
+        # compiled phase table, the end of each phase relative to the start of its phase group.
+        # A phase starts where the previous one ends. The power lists have a trailing 0 W entry
+        # for times after the last phase.
+        self.startup_ends, self.startup_powers = compile_phases(phases['startup'])
+        self.work_ends, self.work_powers = compile_phases(phases['work'])
+        self.work_starts = [0.0, *self.work_ends[:-1]]
+
+        # after having worked for a while, a job restarts after the last checkpoint it has reached.
+        # restart_index[n] is the work phase to restart at once n work phases have been started
+        self.restart_index = [0]
+        for phase in phases['work']:
+            restart = phases['work'].index(phase) + 1 if phase.get('is_checkpoint', False) else self.restart_index[-1]
+            self.restart_index.append(restart)
+
+        # compiled tables of the work phases from a restart phase on, keyed by the restart phase
+        self.restart_tables: Dict[int, Tuple[List[float], List[float]]] = {}
+
     def __call__(self, time: float, time_worked: float = 0) -> float:
         '''
         :param time: current time since resume or execution start
@@ -29,39 +48,88 @@ class PowerFunction:
         '''
         
         if (time < self.duration_startup):
-            return self.get_power_in_phases(self.phases['startup'], time)
+            return self.startup_powers[bisect_right(self.startup_ends, time)]
         
         time_until_end = self.duration_startup + self.duration_work - time_worked
 
         if (time >= self.duration_startup and time < time_until_end):
-            # find the last checkpoint we have reached
-            remaining_time_worked: float = float(time_worked)             
-            last_checkpoint: None | Phase = None
-            for phase in self.phases['work']:
-                if remaining_time_worked <= 0:
-                    break
-                remaining_time_worked -= phase['duration']
-                if (phase.get('is_checkpoint', False)):
-                    last_checkpoint = phase
+            ends, powers = self.restart_table(self.restart_phase(time_worked))
+            return powers[bisect_right(ends, time - self.duration_startup)]
+        
+        return 0
 
+    def restart_phase(self, time_worked: float) -> int:
+        '''
+        :param time_worked: seconds of work the job has had so far
+        :return: index of the work phase after the last checkpoint that has been reached
+        '''
+        return self.restart_index[bisect_left(self.work_starts, time_worked)] if time_worked > 0 else 0
 
-            start_index_of_phase = self.phases['work'].index(last_checkpoint) + 1 if last_checkpoint is not None else 0
+    def restart_table(self, restart_phase: int) -> Tuple[List[float], List[float]]:
+        '''
+        :param restart_phase: index of the work phase the job restarts at
+        :return: compiled ends and powers of the work phases from restart_phase on
+        '''
+        if restart_phase not in self.restart_tables:
+            self.restart_tables[restart_phase] = (self.work_ends, self.work_powers) if restart_phase == 0 else compile_phases(self.phases['work'][restart_phase:])
+        return self.restart_tables[restart_phase]
 
-            return self.get_power_in_phases(self.phases['work'][start_index_of_phase: ], time - self.duration_startup)
-        
-        return 0
-    
-    def get_power_in_phases(self, phases: Iterable[Phase], time: float) -> float:
-
-        time_in_program = 0.0
-        for phase in phases:
-            start_of_this_phase = time_in_program
-            end_of_this_phase = time_in_program + phase['duration']
-            if start_of_this_phase <= time and time < end_of_this_phase:
-                return phase['power']
-            time_in_program += phase['duration']
- 
-        return 0
+    @cached_property
+    def power_segments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        The power draw of a job that runs without interruption as constant segments, i.e. __call__(time)
+        for all whole seconds. Seconds that are not covered by a segment draw no power.
+        :return: first second, end second (exclusive) and power of each segment
+        '''
+        starts: List[float] = []
+        ends: List[float] = []
+        powers: List[float] = []
+
+        # the boundaries are computed with the same floating point operations as __call__,
+        # so that the segments contain exactly the seconds that __call__ assigns to each phase
+        startup_end = first_second(lambda time: not time < self.duration_startup, self.duration_startup)
+        for start_of_this_phase, end_of_this_phase, power in zip([0.0, *self.startup_ends[:-1]], self.startup_ends, self.startup_powers):
+            starts.append(min(first_second(lambda time: time >= start_of_this_phase, start_of_this_phase), startup_end))
+            ends.append(min(first_second(lambda time: not time < end_of_this_phase, end_of_this_phase), startup_end))
+            powers.append(power)
+
+        duration_startup = self.duration_startup
+        work_end = first_second(lambda time: not time < self.duration_startup + self.duration_work, self.duration_startup + self.duration_work)
+        for start_of_this_phase, end_of_this_phase, power in zip(self.work_starts, self.work_ends, self.work_powers):
+            starts.append(min(max(first_second(lambda time: time - duration_startup >= start_of_this_phase, duration_startup + start_of_this_phase), startup_end), work_end))
+            ends.append(min(max(first_second(lambda time: not time - duration_startup < end_of_this_phase, duration_startup + end_of_this_phase), startup_end), work_end))
+            powers.append(power)
+
+        segments = np.array([starts, ends, powers], dtype=float)
+        segments = segments[:, segments[1] > segments[0]]
+        return segments[0], segments[1], segments[2]
+
+def compile_phases(phases: List[Phase]) -> Tuple[List[float], List[float]]:
+    '''
+    :param phases: consecutive phases
+    :return: end of each phase since the start of the first one, power of each phase followed by 0 W
+    '''
+    ends: List[float] = []
+    time_in_program = 0.0
+    for phase in phases:
+        time_in_program += phase['duration']
+        ends.append(time_in_program)
+    return ends, [*[phase['power'] for phase in phases], 0]
+
+def first_second(is_reached: Callable[[int], bool], estimate: float) -> float:
+    '''
+    :param is_reached: condition on whole seconds that holds from some second on
+    :param estimate: approximation of that second
+    :return: first whole second for which is_reached holds
+    '''
+    if not math.isfinite(estimate):
+        return estimate
+    second = math.ceil(estimate)
+    while is_reached(second - 1):
+        second -= 1
+    while not is_reached(second):
+        second += 1
+    return second
 
 class PeriodicPowerFunction(PowerFunction):
     def __init__(self, phases: Stawp, name: str | None = None, length: int = None):
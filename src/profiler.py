@@ -0,0 +1,179 @@
+from __future__ import annotations
+import csv
+import functools
+import json
+import time
+from typing import Any, Callable, Dict, List, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class _NoTimer:
+    def __enter__(self) -> None:
+        pass
+
+    def __exit__(self, *exception: Any) -> None:
+        pass
+
+
+_NO_TIMER = _NoTimer()
+
+
+class _Timer:
+    def __init__(self, statistic: Dict[str, float]) -> None:
+        self.statistic = statistic
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception: Any) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.statistic["count"] += 1
+        self.statistic["total"] += elapsed
+        self.statistic["max"] = max(self.statistic["max"], elapsed)
+
+
+class Profiler:
+    """Opt-in timers, counters and observed values of a process. While disabled, nothing is recorded
+    and the timers do nothing, hot paths are only wrapped by instrument once profiling is enabled.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.timers: Dict[str, Dict[str, float]] = {}
+        self.counters: Dict[str, float] = {}
+        self.values: Dict[str, Dict[str, float]] = {}
+        self.kept: Dict[str, Any] = self._copy()
+
+    def timer(self, name: str) -> _Timer | _NoTimer:
+        """Time a block: `with PROFILER.timer("lp.solve"):`
+
+        Args:
+            name (str): name of the timer
+
+        Returns:
+            _Timer | _NoTimer: context manager
+        """
+        if not self.enabled:
+            return _NO_TIMER
+        statistic = self.timers.get(name)
+        if statistic is None:
+            statistic = self.timers[name] = dict(count=0, total=0.0, max=0.0)
+        return _Timer(statistic)
+
+    def timed(self, name: str) -> Callable[[F], F]:
+        """Decorator that times every call of a function, for functions that are not called per second
+
+        Args:
+            name (str): name of the timer
+        """
+        def decorator(function: F) -> F:
+            @functools.wraps(function)
+            def wrapper(*args: Any, **kwargs: Any) -> Any:
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.timer(name):
+                    return function(*args, **kwargs)
+            return wrapper  # type: ignore[return-value]
+        return decorator
+
+    def instrument(self, obj: Any, method: str, name: str, after: Callable[[], None] | None = None) -> None:
+        """Time a method of one object by replacing it on the instance, so it costs nothing while profiling is disabled
+
+        Args:
+            obj (Any): object
+            method (str): name of the method
+            name (str): name of the timer
+            after (Callable[[], None] | None): called after each call, e.g. to observe a queue length
+        """
+        function = getattr(obj, method)
+        statistic = self.timers.setdefault(name, dict(count=0, total=0.0, max=0.0))
+        timer = _Timer(statistic)
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timer:
+                result = function(*args, **kwargs)
+            if after is not None:
+                after()
+            return result
+        setattr(obj, method, wrapper)
+
+    def count(self, name: str, amount: float = 1) -> None:
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float) -> None:
+        """Record a value, e.g. a queue length, its count, mean and maximum are reported
+
+        Args:
+            name (str): name of the value
+            value (float): value
+        """
+        if not self.enabled:
+            return
+        statistic = self.values.get(name)
+        if statistic is None:
+            statistic = self.values[name] = dict(count=0, total=0.0, max=value)
+        statistic["count"] += 1
+        statistic["total"] += value
+        statistic["max"] = max(statistic["max"], value)
+
+    def _copy(self) -> Dict[str, Any]:
+        return dict(
+            timers={name: dict(statistic) for name, statistic in self.timers.items()},
+            counters=dict(self.counters),
+            values={name: dict(statistic) for name, statistic in self.values.items()},
+        )
+
+    def keep(self) -> None:
+        """Keep everything recorded so far, e.g. loading the traces once for all runs, in the profile of every run"""
+        self.kept = self._copy()
+
+    def reset(self) -> None:
+        """Start the profile of the next run"""
+        kept = self.kept
+        self.timers = {name: dict(statistic) for name, statistic in kept["timers"].items()}
+        self.counters = dict(kept["counters"])
+        self.values = {name: dict(statistic) for name, statistic in kept["values"].items()}
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """
+        Returns:
+            List[Dict[str, Any]]: one row per timer, counter and value with its kind, count, total, mean and max
+        """
+        rows = []
+        for kind, statistics in (("timer", self.timers), ("value", self.values)):
+            for name, statistic in sorted(statistics.items()):
+                rows.append(dict(
+                    name=name, kind=kind, count=statistic["count"], total=statistic["total"],
+                    mean=statistic["total"] / statistic["count"] if statistic["count"] > 0 else 0.0, max=statistic["max"],
+                ))
+        for name, value in sorted(self.counters.items()):
+            rows.append(dict(name=name, kind="counter", count=value, total=value, mean=None, max=None))
+        return rows
+
+    def save(self, path: str, run: Dict[str, Any] | None = None) -> str:
+        """Write the profile next to a results file, as {path}_profile.json and {path}_profile.csv like its details,
+        so results files that only differ in their extension, e.g. of several start indices, keep their own profile
+
+        Args:
+            path (str): results file
+            run (Dict[str, Any] | None): parameters of the run, stored in the JSON
+
+        Returns:
+            str: path of the JSON profile
+        """
+        base = f"{path}_profile"
+        rows = self.rows()
+        with open(f"{base}.json", "w") as file:
+            json.dump(dict(run=run or {}, **self._copy()), file, indent=2, default=str)
+        with open(f"{base}.csv", "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=["name", "kind", "count", "total", "mean", "max"])
+            writer.writeheader()
+            writer.writerows(rows)
+        return f"{base}.json"
+
+
+# profiler of this process, forked workers start with the state of the parent
+PROFILER = Profiler()
@@ -1,19 +1,104 @@
 #!/usr/bin/env python3
 import argparse
-from typing import List
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+from typing import Callable, Dict, Iterable, List, TypeVar
 import pandas as pd
-from carbon import get_carbon_model, CarbonModel
-from task import Task, set_waiting_times, load_tasks, TIME_FACTOR
-from scheduling import create_scheduler
-from cluster import create_cluster
+from carbon import get_carbon_model, get_carbon_models, CarbonModel
+from task import Task, TaskTable, set_waiting_times, stream_tasks, create_task_table, read_task_trace, TIME_FACTOR
+from scheduling import create_scheduler, ScheduleCache, SolverOptions, SOLVERS, default_solver_options, BatchOptions, default_batch_options
+from cluster import create_cluster, RESULT_FORMATS
+from profiler import PROFILER
 import hashlib
+import heapq
+import multiprocessing
 import os
+import sys
+
+# carbon start indices of --start-index -1
+START_INDICES = range(0, 8500, 500)
+
+# loaded once by the parent before the pool is forked, workers share them copy-on-write
+_carbon_models: Dict[int, CarbonModel] = {}
+_task_trace: pd.DataFrame | None = None
+_task_table: TaskTable | None = None
+_schedule_cache = ScheduleCache()
+
+T = TypeVar("T")
+
+
+def simulate_ticks(scheduler, cluster, tasks: Iterable[Task], end_time: int) -> None:
+    """Simulate the cluster by stepping through every second of the carbon trace
+
+    Args:
+        scheduler: scheduling policy
+        cluster: simulated cluster
+        tasks (Iterable[Task]): tasks ordered by arrival time, consumed as they arrive
+        end_time (int): length of the carbon trace
+    """
+    tasks = iter(tasks)
+    next_task = next(tasks, None)
+    for i in range(0, end_time):
+        current_time = i
+        while next_task is not None and next_task.arrival_time <= current_time:
+            if next_task.task_length > 0:
+                scheduler.submit(current_time, next_task)
+            next_task = next(tasks, None)
+        with cluster.lock:
+            scheduler.execute(current_time)
+        cluster.sleep()
+        if next_task is None and scheduler.next_start_time() is None and cluster.done():
+            break
+
+
+def simulate_events(scheduler, cluster, tasks: Iterable[Task], end_time: int) -> None:
+    """Simulate the cluster by jumping from event to event. Nothing changes in between
+    task arrivals, queued jobs becoming due and reserved instances being released, so the
+    results are the same as simulate_ticks.
+
+    Args:
+        scheduler: scheduling policy
+        cluster: simulated cluster
+        tasks (Iterable[Task]): tasks ordered by arrival time, consumed as they arrive
+        end_time (int): length of the carbon trace
+    """
+    events: List[int] = [0]
+    tasks = iter(tasks)
+    next_task = next(tasks, None)
+    while len(events) > 0:
+        current_time = heapq.heappop(events)
+        while len(events) > 0 and events[0] == current_time:
+            heapq.heappop(events)
+        if current_time >= end_time:
+            break
+
+        while next_task is not None and next_task.arrival_time <= current_time:
+            if next_task.task_length > 0:
+                scheduler.submit(current_time, next_task)
+            next_task = next(tasks, None)
+
+        # instances are released after the scheduler ran, so work conserving policies
+        # can only make use of them in the following second
+        releasing = cluster.next_release_time(current_time) == current_time
+        with cluster.lock:
+            scheduler.execute(current_time)
+        cluster.sleep()
+        if next_task is None and scheduler.next_start_time() is None and cluster.done():
+            break
+
+        if releasing:
+            heapq.heappush(events, current_time + 1)
+        if next_task is not None:
+            heapq.heappush(events, next_task.arrival_time)
+        for event in (scheduler.next_start_time(), cluster.next_release_time(current_time + 1)):
+            if event is not None:
+                heapq.heappush(events, event)
 
 
 def run_experiment(
     carbon_start_index: int,
     carbon_model: CarbonModel,
-    tasks: List[Task],
+    tasks: Iterable[Task],
     scheduling_policy: str,
     carbon_policy: str,
     reserved_instances: int,
@@ -21,12 +106,18 @@ def run_experiment(
     waiting_times_str: str,
     cluster_partition: str,
     dynamic_power: bool,
-    set_filename: str | None
+    set_filename: str | None,
+    event_driven: bool = False,
+    solver_options: SolverOptions | None = None,
+    schedule_cache: ScheduleCache | None = None,
+    results_format: str = "csv",
+    batch_options: BatchOptions | None = None
 ) -> List[float]:
     """Run Experiments
 
     Args:
         carbon_start_index (int): carbon trace start time
+        tasks (Iterable[Task]): tasks ordered by arrival time, e.g. streamed from the trace
         scheduling_policy (str): scheduling algorithm
         carbon_policy (str): carbon waiting policy
         reserved_instances (int): number of reserved instances
@@ -34,6 +125,11 @@ def run_experiment(
         task_trace (str): Task Trace
         waiting_times_str (str): waiting times per queue
         cluster_partition (str): used cluster partition (queue), only for slurm experiment.
+        event_driven (bool): jump between events instead of simulating every second
+        solver_options (SolverOptions | None): LP solver of the suspend-resume scheduler for dynamic power
+        schedule_cache (ScheduleCache | None): cache of suspend-resume schedules, shared between experiments
+        results_format (str): file format of the details and runtime, one of RESULT_FORMATS
+        batch_options (BatchOptions | None): planning window and on-demand penalty of the suspend-resume-batch scheduler
 
     Returns:
         List: Results
@@ -48,10 +144,17 @@ def run_experiment(
         experiment_name,
         waiting_times_str,
         cluster_partition,
+        set_filename,
+        results_format,
     )
     scheduler = create_scheduler(
-        cluster, scheduling_policy, carbon_policy, carbon_model, dynamic_power
+        cluster, scheduling_policy, carbon_policy, carbon_model, dynamic_power, solver_options, schedule_cache, batch_options
     )
+    if PROFILER.enabled:
+        # the methods are only wrapped when profiling, so the simulation loops stay as fast as before otherwise
+        PROFILER.instrument(scheduler, "submit", "scheduler.submit")
+        PROFILER.instrument(scheduler, "execute", "scheduler.execute", lambda: PROFILER.observe("scheduler.queue_length", len(scheduler.queue)))
+        PROFILER.instrument(cluster, "save_results", "cluster.save_results")
 
     # for task in tasks:
     #     current_time = task.arrival_time
@@ -61,21 +164,11 @@ def run_experiment(
     #         scheduler.execute(current_time)
     #     cluster.sleep()    
 
-    # previous implementation of submitting all jobs?
-    for i in range(0, carbon_model.df.shape[0]):
-        current_time = i
-        while len(tasks) > 0:
-            if tasks[0].arrival_time <= current_time:
-                if tasks[0].task_length > 0:
-                    scheduler.submit(current_time, tasks[0])
-                del tasks[0]
-            else:
-                break
-        with cluster.lock:
-            scheduler.execute(current_time)
-        cluster.sleep()
-        if len(tasks) == 0 and scheduler.queue.empty() and cluster.done():
-            break
+    with PROFILER.timer("simulate"):
+        if event_driven:
+            simulate_events(scheduler, cluster, tasks, len(carbon_model))
+        else:
+            simulate_ticks(scheduler, cluster, tasks, len(carbon_model))
 
     cluster.save_results(
         "simulation",
@@ -89,6 +182,38 @@ def run_experiment(
     return [cluster.total_carbon_cost, cluster.total_dollar_cost]
 
 
+def results_file_name(
+    carbon_start_index: int,
+    carbon_trace: str,
+    task_trace: str,
+    scheduling_policy: str,
+    carbon_policy: str,
+    reserved_instances: int,
+    waiting_times_str: str,
+    dynamic_power: bool,
+    set_filename: str | None,
+) -> str:
+    """Results file of an experiment, the details and profile are written next to it
+
+    Args:
+        carbon_start_index (int): carbon trace start time
+        carbon_trace (str): carbon trace name
+        task_trace (str): task trace name
+        scheduling_policy (str): scheduling algorithm
+        carbon_policy (str): carbon waiting policy
+        reserved_instances (int): number of reserved instances
+        waiting_times_str (str): waiting times per queue
+        dynamic_power (bool): wether jobs use constant or dynamic power over their execution
+        set_filename (str | None): provided filename, generated if not given
+
+    Returns:
+        str: results file
+    """
+    if set_filename is not None:
+        return set_filename
+    return f"results/simulation/{task_trace}/{scheduling_policy}-{carbon_start_index}-{carbon_policy}-{carbon_trace}-{reserved_instances}-{waiting_times_str}-{dynamic_power}.csv"
+
+
 def prepare_experiment(
     carbon_start_index: int,
     carbon_trace: str,
@@ -102,7 +227,15 @@ def prepare_experiment(
     dynamic_power: bool,
     dynamic_power_type: str | None,
     dynamic_power_phases: str | None,
-    set_filename: str | None
+    set_filename: str | None,
+    event_driven: bool = False,
+    carbon_model: CarbonModel | None = None,
+    task_trace_df: pd.DataFrame | None = None,
+    task_table: TaskTable | None = None,
+    solver_options: SolverOptions | None = None,
+    schedule_cache: ScheduleCache | None = None,
+    results_format: str = "csv",
+    batch_options: BatchOptions | None = None
 ) -> None:
     """Prepare and Run Experiment
 
@@ -116,10 +249,19 @@ def prepare_experiment(
         waiting_times_str (str): waiting times per queue
         cluster_partition (str): used cluster partition (queue), only for slurm experiment.
         dynamic_power (bool): wether jobs use constant or dynamic power over their execution
+        event_driven (bool): jump between events instead of simulating every second
+        carbon_model (CarbonModel | None): already loaded carbon model of carbon_trace at carbon_start_index, loaded if not given
+        task_trace_df (pd.DataFrame | None): already read task trace of task_trace, read if not given
+        task_table (TaskTable | None): already created tasks of task_trace with these waiting times and power settings
+        solver_options (SolverOptions | None): LP solver of the suspend-resume scheduler for dynamic power
+        schedule_cache (ScheduleCache | None): cache of suspend-resume schedules, shared between experiments
+        results_format (str): file format of the details and runtime, one of RESULT_FORMATS
+        batch_options (BatchOptions | None): planning window and on-demand penalty of the suspend-resume-batch scheduler
     """
 
-    default_file_name = f"results/simulation/{task_trace}/{scheduling_policy}-{carbon_start_index}-{carbon_policy}-{carbon_trace}-{reserved_instances}-{waiting_times_str}-{dynamic_power}.csv"
-    file_name = set_filename if set_filename is not None else default_file_name
+    file_name = results_file_name(
+        carbon_start_index, carbon_trace, task_trace, scheduling_policy, carbon_policy, reserved_instances, waiting_times_str, dynamic_power, set_filename
+    )
 
     if os.path.exists(file_name) and repeat == False:
         print(f"Skipping Experiments {task_trace} - {carbon_trace}-{scheduling_policy}-{carbon_policy}-{waiting_times_str}, and {reserved_instances} reserved because the results already exists and repeat parameter not set")
@@ -127,10 +269,22 @@ def prepare_experiment(
     
 
     print(f"Start Experiments {file_name}")
+    PROFILER.reset()
     
     set_waiting_times(waiting_times_str)
-    carbon_model = get_carbon_model(carbon_trace, carbon_start_index)
-    tasks = load_tasks(task_trace, dynamic_power, dynamic_power_type, dynamic_power_phases)
+    if carbon_model is None:
+        carbon_model = get_carbon_model(carbon_trace, carbon_start_index)
+    # reading, ordering and the power profiles of the trace are timed as tasks.load, the tasks are
+    # created chunk by chunk while the simulation consumes them, timed as trace.tasks.create
+    with PROFILER.timer("tasks.load"):
+        if task_table is not None:
+            tasks: Iterable[Task] = iter(task_table)
+            PROFILER.count("tasks", len(task_table))
+        else:
+            if task_trace_df is None:
+                task_trace_df = read_task_trace(task_trace)
+            tasks = stream_tasks(task_trace_df, dynamic_power, dynamic_power_type, dynamic_power_phases)
+            PROFILER.count("tasks", len(task_trace_df))
     carbon_model = carbon_model.extend(int(3600 / TIME_FACTOR))
     results = []
 
@@ -145,7 +299,12 @@ def prepare_experiment(
         waiting_times_str,
         cluster_partition,
         dynamic_power,
-        set_filename
+        set_filename,
+        event_driven,
+        solver_options,
+        schedule_cache,
+        results_format,
+        batch_options
     )
     results.append(result)
 
@@ -154,6 +313,21 @@ def prepare_experiment(
         f"Saving Results to {file_name}"
     )
     results_df.to_csv(file_name, index=False)
+    if PROFILER.enabled:
+        profile_file_name = PROFILER.save(file_name, dict(
+            carbon_start_index=carbon_start_index,
+            carbon_trace=carbon_trace,
+            task_trace=task_trace,
+            scheduling_policy=scheduling_policy,
+            carbon_policy=carbon_policy,
+            reserved_instances=reserved_instances,
+            waiting_times=waiting_times_str,
+            dynamic_power=dynamic_power,
+            event_driven=event_driven,
+            solver=solver_options["name"] if solver_options is not None else None,
+            solver_max_timeslots=solver_options["max_timeslots"] if solver_options is not None else None,
+        ))
+        print(f"Saving Profile to {profile_file_name}")
     print(
         f"Finish Experiments {task_trace} - {carbon_trace}-{scheduling_policy}-{carbon_policy}-{waiting_times_str}-{dynamic_power}, and {reserved_instances} reserved"
     )
@@ -205,6 +379,7 @@ def main() -> None:
             "cost",
             "suspend-resume",
             "suspend-resume-threshold",
+            "suspend-resume-batch",
         ],
     )
 
@@ -250,6 +425,94 @@ def main() -> None:
         help="Use provided filename instead of generating one"
     )
 
+    parser.add_argument(
+        "--event-driven",
+        default=False,
+        dest="event_driven",
+        action=argparse.BooleanOptionalAction,
+        help="Jump between task arrivals, job starts and resource releases instead of simulating every second. Gives the same results."
+    )
+
+    parser.add_argument(
+        "--solver",
+        default="cbc",
+        dest="solver",
+        choices=SOLVERS,
+        help="LP solver of the suspend-resume scheduler for dynamic power"
+    )
+
+    parser.add_argument(
+        "--solver-threads",
+        default=None,
+        dest="solver_threads",
+        type=int,
+        help="Threads per LP solve, by default 1 for cbc and highs and 4 for gurobi"
+    )
+
+    parser.add_argument(
+        "--solver-timelimit",
+        default=20 * 60,
+        dest="solver_timelimit",
+        type=int,
+        help="Time limit per LP solve in seconds"
+    )
+
+    parser.add_argument(
+        "--solver-max-timeslots",
+        default=0,
+        dest="solver_max_timeslots",
+        type=int,
+        help="Timeslots per LP or dynamic program, e.g. 2000. Longer jobs are solved on coarse timeslots first and refined around their blocks, their schedules are no longer optimal. 0 always solves on the finest timeslots"
+    )
+
+    parser.add_argument(
+        "--batch-window",
+        default=0.25,
+        dest="batch_window",
+        type=float,
+        help="Hours of arrivals that suspend-resume-batch plans together, tasks are planned when the window ends so their starts are delayed by up to that long"
+    )
+
+    parser.add_argument(
+        "--on-demand-penalty",
+        default=0.5,
+        dest="on_demand_penalty",
+        type=float,
+        help="Weight of a CPU-second on on-demand instances in suspend-resume-batch, as a multiple of the mean carbon intensity. Higher values keep more work on the reserved instances, 0 ignores them"
+    )
+
+    parser.add_argument(
+        "--schedule-cache-dir",
+        default=None,
+        dest="schedule_cache_dir",
+        type=str,
+        help="Also store suspend-resume schedules in this directory, so they are reused by later runs"
+    )
+
+    parser.add_argument(
+        "--workers",
+        default=1,
+        dest="workers",
+        type=int,
+        help="Run the start indices of --start-index -1 in this many parallel processes"
+    )
+
+    parser.add_argument(
+        "--results-format",
+        default="csv",
+        dest="results_format",
+        choices=RESULT_FORMATS,
+        help="File format of the per task details and the runtime, parquet and feather need pyarrow"
+    )
+
+    parser.add_argument(
+        "--profile",
+        default=False,
+        dest="profile",
+        action=argparse.BooleanOptionalAction,
+        help="Time trace loading, scheduling, LP solves and saving and count cache hits, written as _profile.json and _profile.csv next to the results"
+    )
+
     parser.add_argument(
         "--carbon-policy",
         default="oracle",
@@ -267,27 +530,134 @@ def main() -> None:
         help='Repeat experiments that are saved already')
 
     args = parser.parse_args()
-    carbon_start_index = []
     if args.start_index == -1:
-        carbon_starts = range(0, 8500, 500)
+        carbon_starts = list(START_INDICES)
     else:
         carbon_starts = [args.start_index]
-    for carbon_start_index in carbon_starts:
-        prepare_experiment(
-            carbon_start_index,
-            args.carbon_trace,
-            args.task_trace,
-            args.scheduling_policy,
-            args.carbon_policy,
-            args.reserved_instances,
-            args.waiting_times_str,
-            args.cluster_partition,
-            args.repeat,
-            args.dynamic_power_draw,
-            args.dynamic_power_draw_type,
-            args.dynamic_power_draw_phases,
-            args.filename
+    several = len(carbon_starts) > 1
+
+    if not args.repeat:
+        # start indices whose results already exist are skipped before the traces are loaded
+        finished = [
+            carbon_start_index for carbon_start_index in carbon_starts
+            if os.path.exists(results_file_name(
+                carbon_start_index,
+                args.carbon_trace,
+                args.task_trace,
+                args.scheduling_policy,
+                args.carbon_policy,
+                args.reserved_instances,
+                args.waiting_times_str,
+                args.dynamic_power_draw,
+                start_index_filename(carbon_start_index, args, several),
+            ))
+        ]
+        for carbon_start_index in finished:
+            print(f"Skipping start index {carbon_start_index} because the results already exist and repeat parameter not set")
+        carbon_starts = [carbon_start_index for carbon_start_index in carbon_starts if carbon_start_index not in finished]
+        if len(carbon_starts) == 0:
+            return
+
+    # the traces are read once for all start indices, with several the tasks are created once as well,
+    # a single run streams them from the trace instead
+    global _carbon_models, _task_trace, _task_table, _schedule_cache
+    PROFILER.enabled = args.profile
+    _schedule_cache = ScheduleCache(directory=args.schedule_cache_dir)
+    _carbon_models = get_carbon_models(args.carbon_trace, carbon_starts)
+    set_waiting_times(args.waiting_times_str)
+    _task_trace = read_task_trace(args.task_trace)
+    if len(carbon_starts) > 1:
+        _task_table = create_task_table(
+            _task_trace, args.dynamic_power_draw, args.dynamic_power_draw_type, args.dynamic_power_draw_phases
         )
+    # loading is shared by all start indices, it is part of each of their profiles
+    PROFILER.keep()
+
+    if args.workers > 1 and len(carbon_starts) > 1:
+        failed = run_parallel(partial(run_start_index, args=args, several=several), carbon_starts, args.workers, lambda start: f"start index {start}")
+        if len(failed) > 0:
+            print(f"{len(failed)} experiments failed: {', '.join(failed)}")
+            sys.exit(1)
+    else:
+        for carbon_start_index in carbon_starts:
+            run_start_index(carbon_start_index, args, several)
+
+
+def start_index_filename(carbon_start_index: int, args: argparse.Namespace, several: bool) -> str | None:
+    """Provided filename of main at a carbon start index. With several start indices the start index is
+    inserted before its extension, e.g. results.csv becomes results_500.csv
+
+    Args:
+        carbon_start_index (int): carbon trace start time
+        args (argparse.Namespace): command line arguments
+        several (bool): if several start indices are run
+
+    Returns:
+        str | None: provided filename, None to generate one
+    """
+    if not several or args.filename is None:
+        return args.filename
+    root, extension = os.path.splitext(args.filename)
+    return f"{root}_{carbon_start_index}{extension}"
+
+
+def run_start_index(carbon_start_index: int, args: argparse.Namespace, several: bool) -> None:
+    """Run the experiment of main at a carbon start index, with the carbon model and tasks loaded by main
+
+    Args:
+        carbon_start_index (int): carbon trace start time
+        args (argparse.Namespace): command line arguments
+        several (bool): if several start indices are run, each gets its own results file then
+    """
+    prepare_experiment(
+        carbon_start_index,
+        args.carbon_trace,
+        args.task_trace,
+        args.scheduling_policy,
+        args.carbon_policy,
+        args.reserved_instances,
+        args.waiting_times_str,
+        args.cluster_partition,
+        args.repeat,
+        args.dynamic_power_draw,
+        args.dynamic_power_draw_type,
+        args.dynamic_power_draw_phases,
+        start_index_filename(carbon_start_index, args, several),
+        args.event_driven,
+        carbon_model=_carbon_models[carbon_start_index],
+        task_trace_df=_task_trace,
+        task_table=_task_table,
+        solver_options=default_solver_options(args.solver, args.solver_threads, args.solver_timelimit, args.solver_max_timeslots or None),
+        schedule_cache=_schedule_cache,
+        results_format=args.results_format,
+        batch_options=default_batch_options(args.batch_window, args.on_demand_penalty)
+    )
+
+
+def run_parallel(function: Callable[[T], object], items: List[T], workers: int, describe: Callable[[T], str]) -> List[str]:
+    """Call function for every item in a pool of forked processes, they share the loaded traces of the parent copy-on-write
+
+    Args:
+        function (Callable[[T], object]): called in the worker processes, a module level function
+        items (List[T]): arguments
+        workers (int): number of processes
+        describe (Callable[[T], str]): name of an item for the progress output
+
+    Returns:
+        List[str]: names of the failed items
+    """
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork")) as executor:
+        futures = {executor.submit(function, item): item for item in items}
+        for done, future in enumerate(as_completed(futures), start=1):
+            item = futures[future]
+            try:
+                future.result()
+                print(f"[{done}/{len(items)}] Finished {describe(item)}")
+            except Exception as e:
+                failed.append(describe(item))
+                print(f"[{done}/{len(items)}] Failed {describe(item)}: {e!r}")
+    return failed
 
 
 if __name__ == "__main__":
@@ -2,11 +2,15 @@ from carbon import CarbonModel
 from cluster import BaseCluster
 from scheduling.suspend_phases_scheduling_policy import SuspendSchedulingDynamicPowerPolicy
 from .scheduling_policy import SchedulingPolicy
+from .interval_schedule import IntervalSchedule
+from .schedule_cache import ScheduleCache
+from .solvers import SolverOptions, SOLVERS, default_solver_options
 from .suspend_scheduling_policy import SuspendSchedulingPolicy
+from .batch_scheduling_policy import BatchSchedulingPolicy, BatchOptions, default_batch_options
 from .carbon_waiting_policy import best_waiting_time, lowest_carbon_slot, oracle_carbon_slot,oracle_carbon_slot_waiting,average_carbon_slot_waiting
 
 
-def create_scheduler(cluster: BaseCluster, scheduling_policy: str, carbon_policy: str, carbon_model: CarbonModel, dynamic_power: bool) -> SchedulingPolicy | SuspendSchedulingPolicy | SuspendSchedulingDynamicPowerPolicy:
+def create_scheduler(cluster: BaseCluster, scheduling_policy: str, carbon_policy: str, carbon_model: CarbonModel, dynamic_power: bool, solver_options: SolverOptions | None = None, schedule_cache: ScheduleCache | None = None, batch_options: BatchOptions | None = None) -> SchedulingPolicy | SuspendSchedulingPolicy | SuspendSchedulingDynamicPowerPolicy:
     if (dynamic_power and carbon_policy != 'oracle' and (scheduling_policy != 'carbon' or scheduling_policy != "suspend-resume")):
         raise ValueError("Dynamic power profile not supported for {carbon_policy} and {scheduling_policy}")
     
@@ -38,13 +42,15 @@ def create_scheduler(cluster: BaseCluster, scheduling_policy: str, carbon_policy
         return SchedulingPolicy(cluster, carbon_model, start_time_policy, False, True, False)
     elif scheduling_policy == "suspend-resume":
         if dynamic_power:
-            return SuspendSchedulingDynamicPowerPolicy(cluster, carbon_model)
-        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=True)
+            return SuspendSchedulingDynamicPowerPolicy(cluster, carbon_model, solver_options, schedule_cache)
+        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=True, schedule_cache=schedule_cache)
+    elif scheduling_policy == "suspend-resume-batch":
+        return BatchSchedulingPolicy(cluster, carbon_model, batch_options, schedule_cache)
     elif scheduling_policy == "suspend-resume-spot":
-        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=True)
+        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=True, schedule_cache=schedule_cache)
     elif scheduling_policy == "suspend-resume-threshold": 
-        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=False)
+        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=False, schedule_cache=schedule_cache)
     elif scheduling_policy == "suspend-resume-spot-threshold":
-        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=False)
+        return SuspendSchedulingPolicy(cluster, carbon_model, optimal=False, schedule_cache=schedule_cache)
     else:
         raise Exception("Unknown Experiment Type")
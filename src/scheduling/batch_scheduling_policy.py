@@ -0,0 +1,290 @@
+from __future__ import annotations
+from carbon import CarbonModel
+from task import TIME_FACTOR, Task
+from cluster import BaseCluster
+from profiler import PROFILER
+from scheduling.interval_schedule import IntervalSchedule
+from scheduling.schedule_cache import ScheduleCache
+from scheduling.suspend_scheduling_policy import SuspendSchedulingPolicy
+from typing import List, Tuple, TypedDict
+import numpy as np
+
+# the tasks of a batch are planned on hourly slots, the resolution of the carbon traces
+SLOT = 3600 // TIME_FACTOR
+
+
+class BatchOptions(TypedDict):
+    window: int
+    on_demand_penalty: float
+    iterations: int
+
+
+def default_batch_options(window_hours: float = 0.25, on_demand_penalty: float = 0.5, iterations: int = 50) -> BatchOptions:
+    """Options of the batch scheduler
+
+    Args:
+        window_hours (float): tasks arriving within this many hours are planned together, once the window ended,
+            so a task may start up to this long after its arrival
+        on_demand_penalty (float): weight of a CPU-second on on-demand instances as a multiple of the mean carbon
+            intensity, moving work to hours whose intensity is higher by more than that is not worth keeping it on
+            reserved instances. 0 ignores the reserved capacity.
+        iterations (int): price updates per batch
+
+    Returns:
+        BatchOptions: options
+    """
+    return BatchOptions(window=int(window_hours * 3600 / TIME_FACTOR), on_demand_penalty=on_demand_penalty, iterations=iterations)
+
+
+class BatchSchedulingPolicy(SuspendSchedulingPolicy):
+    """Suspend-resume policy that plans the tasks arriving within a planning window together, so their
+    schedules share the reserved instances instead of each task taking the lowest carbon hours on its own.
+
+    The joint plan is decomposed per task (dual decomposition): the reserved CPUs of every hourly slot get a
+    price, each task runs in its cheapest slots by carbon intensity plus price, and the prices rise in the
+    slots where the tasks need more reserved CPUs than are left. Prices are capped at the on-demand penalty,
+    above it running on on-demand instances is cheaper than moving work. The best plan of all price updates is
+    used. The reserved CPUs planned by earlier batches are kept per second, so every batch plans around them
+    (rolling horizon). A task runs in a slot it only partly needs where the least planned CPUs go over the
+    reserved instances, so the tasks of a slot do not all start at its beginning. The best plan is checked per
+    second against the reserved instances and only used if it is cheaper than the tasks' own cheapest slots.
+    """
+
+    def __init__(self, cluster: BaseCluster, carbon_model: CarbonModel, options: BatchOptions | None = None, schedule_cache: ScheduleCache | None = None) -> None:
+        super().__init__(cluster, carbon_model, optimal=True, schedule_cache=schedule_cache)
+        self.options: BatchOptions = options if options is not None else default_batch_options()
+        self.reserved_instances: int = cluster.total_reserved_instances
+        # submitted tasks of the current window and the time they were submitted at
+        self.pending: List[Tuple[int, Task]] = []
+        self.flush_time: int | None = None
+        # reserved CPUs that planned tasks use per second, from planned_start on
+        self.planned_load = np.zeros(0, dtype=np.int64)
+        self.planned_start = 0
+        self.mean_intensity = carbon_model.mean
+
+    def submit(self, current_time: int, task: Task) -> None:
+        """Collect the task, it is planned with the other tasks of its planning window
+
+        Args:
+            current_time (int): time index
+            task (Task): Task
+        """
+        if self.flush_time is None:
+            self.flush_time = current_time + self.options["window"]
+        self.pending.append((current_time, task))
+
+    def execute(self, current_time: int) -> None:
+        """Plan the tasks of the window once it ended, then submit ready jobs/subjobs to the cluster
+
+        Args:
+            current_time (int): time index
+        """
+        if self.flush_time is not None and current_time >= self.flush_time:
+            self.flush(current_time)
+        super().execute(current_time)
+
+    def next_start_time(self) -> int | None:
+        """Earliest time at which a queued job/subjob becomes due or the planning window ends
+
+        Returns:
+            int | None: time index or None if no task is queued or collected
+        """
+        start_time = self.queue.next_start_time()
+        if self.flush_time is not None and (start_time is None or self.flush_time < start_time):
+            return self.flush_time
+        return start_time
+
+    def flush(self, current_time: int) -> None:
+        """Plan and queue the collected tasks
+
+        Args:
+            current_time (int): time index, the schedules start here
+        """
+        submitted = self.pending
+        self.pending = []
+        self.flush_time = None
+        with PROFILER.timer("batch.plan"):
+            schedules = self.plan(current_time, submitted)
+        PROFILER.observe("batch.size", len(submitted))
+        for (_, task), schedule in zip(submitted, schedules):
+            self.put_schedule(current_time, task, schedule)
+
+    def plan(self, current_time: int, submitted: List[Tuple[int, Task]]) -> List[IntervalSchedule]:
+        """Suspend-resume schedules of a batch of tasks that share the remaining reserved instances
+
+        Args:
+            current_time (int): time index the schedules start at
+            submitted (List[Tuple[int, Task]]): submission time and task
+
+        Returns:
+            List[IntervalSchedule]: schedule of each task relative to current_time
+        """
+        lengths = np.array([task.task_length for _, task in submitted], dtype=np.int64)
+        cpus = np.array([task.CPUs for _, task in submitted], dtype=np.int64)
+        deadlines = np.array([submit_time + task.task_length + task.waiting_time for submit_time, task in submitted], dtype=np.int64)
+        # tasks that waited for the batch longer than their waiting time run right away
+        deadlines = np.maximum(deadlines, current_time + lengths)
+
+        first_slot = current_time // SLOT
+        slots = np.arange(first_slot, int(deadlines.max() - 1) // SLOT + 1)
+        load = self.reserve_load(current_time, int((slots[-1] + 1) * SLOT))
+        # seconds of each slot within the window of each task and their mean carbon intensity
+        starts = np.maximum(slots * SLOT, current_time)[np.newaxis, :]
+        ends = np.minimum((slots + 1) * SLOT, deadlines[:, np.newaxis])
+        capacity = np.maximum(ends - starts, 0)
+        carbon = self.carbon_model.sum(starts, np.maximum(ends, starts))
+        intensity = np.divide(carbon, capacity, out=np.zeros(capacity.shape), where=capacity > 0)
+        # the means of slots with the same intensity differ in the last bits of the prefix sums,
+        # rounded to 9 significant digits they stay equal and the earlier slot is used first
+        peak = np.abs(intensity).max()
+        if peak > 0:
+            intensity = np.round(intensity, 9 - int(np.floor(np.log10(peak))))
+
+        # tasks with more CPUs than reserved instances always run on on-demand instances
+        fits = cpus <= self.reserved_instances
+        slot_seconds = np.diff(np.concatenate((starts[0], [(slots[-1] + 1) * SLOT])))
+        planned = np.add.reduceat(load, starts[0] - current_time) / slot_seconds
+        free = np.maximum(self.reserved_instances - planned, 0)
+        penalty = self.options["on_demand_penalty"] * self.mean_intensity
+        prices = np.zeros(len(slots))
+        own_used, best_used, best_cost = None, None, np.inf
+        for iteration in range(max(self.options["iterations"], 1)):
+            used = cheapest_slots(intensity + np.where(fits[:, np.newaxis], prices, 0), capacity, lengths)
+            slot_load = (cpus[fits, np.newaxis] * used[fits]).sum(axis=0) / slot_seconds
+            overflow = np.maximum(slot_load - free, 0)
+            cost = (cpus[:, np.newaxis] * used * intensity).sum() + penalty * (overflow * slot_seconds).sum()
+            if iteration == 0:
+                own_used = used
+            if cost < best_cost:
+                best_used, best_cost = used, cost
+            if penalty <= 0 or (iteration == 0 and overflow.sum() == 0):
+                # the tasks' own cheapest slots fit on the reserved instances
+                break
+            # subgradient step with a diminishing step size, a price is never higher than the penalty
+            step = penalty / max(self.reserved_instances, 1) / np.sqrt(iteration + 1)
+            prices = np.clip(prices + step * (slot_load - free), 0, penalty)
+
+        assert own_used is not None and best_used is not None
+        horizons = deadlines - current_time
+        segment_starts = np.repeat(starts - current_time, len(submitted), axis=0)
+        if penalty <= 0:
+            return [IntervalSchedule.from_segments(*schedule, horizon) for *schedule, horizon in zip(segment_starts, own_used, horizons)]
+
+        # the mean load of a slot hides when its tasks run and a task only gets reserved instances if they are free
+        # for its whole run, so the plan is checked per second against the tasks' own cheapest slots
+        best_schedules, best_load, best_cost = None, load, np.inf
+        for used in ([own_used] if best_used is own_used else [own_used, best_used]):
+            schedules, reserved_load, on_demand = self.place(load, used, segment_starts, capacity, cpus, fits, horizons)
+            cost = (cpus[:, np.newaxis] * used * intensity).sum() + penalty * on_demand
+            if cost < best_cost:
+                best_schedules, best_load, best_cost = schedules, reserved_load, cost
+        assert best_schedules is not None
+        load[:] = best_load
+        return best_schedules
+
+    def place(
+        self, load: np.ndarray, used: np.ndarray, segment_starts: np.ndarray, capacity: np.ndarray,
+        cpus: np.ndarray, fits: np.ndarray, horizons: np.ndarray,
+    ) -> Tuple[List[IntervalSchedule], np.ndarray, int]:
+        """Schedules of a plan and the reserved instances they get. Full slots are fixed, the slots a task only
+        partly needs are placed around the planned CPUs, the largest ones first. The runs of the tasks then get
+        reserved instances in order of their start if these are free for the whole run.
+
+        Args:
+            load (np.ndarray): planned reserved CPUs per second from the start of the plan on
+            used (np.ndarray): seconds per task and slot
+            segment_starts (np.ndarray): first second of each slot per task, relative to the start of the plan
+            capacity (np.ndarray): seconds of each slot a task may run in
+            cpus (np.ndarray): CPUs per task
+            fits (np.ndarray): if a task fits on the reserved instances
+            horizons (np.ndarray): length of the schedule of each task
+
+        Returns:
+            Tuple[List[IntervalSchedule], np.ndarray, int]: schedules, planned reserved CPUs per second including
+                the tasks and CPU-seconds on on-demand instances
+        """
+        segment_starts = segment_starts.copy()
+        tentative = load.copy()
+        for i, k in np.argwhere(fits[:, np.newaxis] & (used > 0) & (used == capacity)).tolist():
+            tentative[segment_starts[i, k]:segment_starts[i, k] + capacity[i, k]] += cpus[i]
+        partial = np.argwhere(fits[:, np.newaxis] & (used > 0) & (used < capacity))
+        for i, k in sorted(partial.tolist(), key=lambda index: -cpus[index[0]] * used[index[0], index[1]]):
+            segment_starts[i, k] = place_partial(
+                tentative, self.reserved_instances, cpus[i], int(segment_starts[i, k]), int(capacity[i, k]), int(used[i, k]),
+                k > 0 and used[i, k - 1] > 0, k + 1 < used.shape[1] and used[i, k + 1] > 0,
+            )
+            tentative[segment_starts[i, k]:segment_starts[i, k] + used[i, k]] += cpus[i]
+        schedules = [IntervalSchedule.from_segments(*schedule, horizon) for *schedule, horizon in zip(segment_starts, used, horizons)]
+
+        reserved_load = load.copy()
+        on_demand = int((cpus[~fits] * used[~fits].sum(axis=1)).sum())
+        runs = sorted((start, length, cpus[i]) for i in np.flatnonzero(fits) for start, length in schedules[i])
+        for start, length, task_cpus in runs:
+            if reserved_load[start:start + length].max() + task_cpus <= self.reserved_instances:
+                reserved_load[start:start + length] += task_cpus
+            else:
+                on_demand += task_cpus * length
+        return schedules, reserved_load, on_demand
+
+    def reserve_load(self, current_time: int, end: int) -> np.ndarray:
+        """Planned reserved CPUs per second in [current_time, end), seconds before current_time are dropped
+
+        Args:
+            current_time (int): time index
+            end (int): end of the planning horizon (exclusive)
+
+        Returns:
+            np.ndarray: view of the planned load, planned tasks are added to it
+        """
+        self.planned_load = self.planned_load[max(current_time - self.planned_start, 0):]
+        self.planned_start = max(current_time, self.planned_start)
+        if end - self.planned_start > len(self.planned_load):
+            self.planned_load = np.pad(self.planned_load, (0, end - self.planned_start - len(self.planned_load)))
+        return self.planned_load[current_time - self.planned_start:end - self.planned_start]
+
+
+def place_partial(load: np.ndarray, reserved: int, cpus: int, start: int, capacity: int, length: int, after_previous: bool, before_next: bool) -> int:
+    """Start of a task in a slot it only partly needs: where the least CPU-seconds go over the reserved
+    instances, continuing the task in the previous or next slot if that is as good, otherwise as early as possible
+
+    Args:
+        load (np.ndarray): planned CPUs per second
+        reserved (int): reserved instances
+        cpus (int): CPUs of the task
+        start (int): first second of the slot in load
+        capacity (int): seconds of the slot the task may run in
+        length (int): seconds the task runs in the slot
+        after_previous (bool): the task runs in the previous slot
+        before_next (bool): the task runs in the next slot
+
+    Returns:
+        int: first second of the task in load
+    """
+    excess = np.concatenate(([0], np.cumsum(np.maximum(load[start:start + capacity] + cpus - reserved, 0))))
+    overflow = excess[length:] - excess[:-length]
+    best = overflow.min()
+    if after_previous and overflow[0] == best:
+        return start
+    if before_next and overflow[-1] == best:
+        return start + capacity - length
+    return start + int(np.argmax(overflow == best))
+
+
+def cheapest_slots(prices: np.ndarray, capacity: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Seconds each task runs in each slot, filling its cheapest slots first. Earlier slots come first
+    between equal prices and a slot that is only partly needed is used from its beginning.
+
+    Args:
+        prices (np.ndarray): price per task and slot
+        capacity (np.ndarray): seconds of each slot a task may run in
+        lengths (np.ndarray): seconds each task runs
+
+    Returns:
+        np.ndarray: seconds per task and slot
+    """
+    order = np.argsort(prices, axis=1, kind="stable")
+    sorted_capacity = np.take_along_axis(capacity, order, axis=1)
+    used_before = np.cumsum(sorted_capacity, axis=1) - sorted_capacity
+    used = np.zeros_like(capacity)
+    np.put_along_axis(used, order, np.clip(lengths[:, np.newaxis] - used_before, 0, sorted_capacity), axis=1)
+    return used
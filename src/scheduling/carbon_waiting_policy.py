@@ -1,6 +1,6 @@
-from typing import List
-from task import Task, TIME_FACTOR
+from task import SubTask, Task, TIME_FACTOR
 from carbon import CarbonModel
+from profiler import PROFILER
 import numpy as np
 
 class Schedule:
@@ -19,9 +19,13 @@ class Schedule:
         return current_time + self.finish_time
 
 
+@PROFILER.timed("compute_carbon_consumption")
 def compute_carbon_consumption(task: Task, start_time: int, carbon_trace: CarbonModel) -> Schedule:
     """Compute Carbon Consumption
 
+    Instead of looking up the power and carbon intensity of every second, the constant power segments
+    of the job are multiplied with the summed carbon intensity of the seconds they cover.
+
     Args:
         task (Task): Task
         start_time (int): start time index
@@ -31,23 +35,47 @@ def compute_carbon_consumption(task: Task, start_time: int, carbon_trace: Carbon
         Schedule: Execution Schedule
     """
 
+    carbon = carbon_cost_curve(task, np.array([start_time]), carbon_trace)[0]
+    return Schedule(start_time, start_time + task.task_length, carbon)
+
+
+def carbon_cost_curve(task: Task, start_times: np.ndarray, carbon_trace: CarbonModel) -> np.ndarray:
+    """Carbon cost of executing the task without interruption from each of the start times
+
+    Each power segment of the task covers the same seconds relative to every start time, so all
+    start times are scored at once from range sums of the carbon trace. For a constant power draw this
+    is a sliding window sum, for phases it is a correlation of the power profile with the trace.
+
+    Args:
+        task (Task): Task
+        start_times (np.ndarray): start time indices
+        carbon_trace (CarbonModel):  Carbon Sub-trace of the permissible execution period
+
+    Returns:
+        np.ndarray: carbon cost per start time
+    """
+
     # the unit of the carbon_intensity is gCO₂eq/kWh
-    execution_carbon = carbon_trace.df["carbon_intensity_avg"][start_time : start_time + task.task_length]
-    assert len(execution_carbon) == task.task_length, "Trace is shorter than task"
+    assert len(carbon_trace) - np.max(start_times) >= task.task_length, "Trace is shorter than task"
 
-    # in comparison to base GAIA, our jobs now cost a variable amount of energy over
-    # their execution, the amount of energy required at a time is calculated by
-    # the power consumption function.
+    segment_starts, segment_ends, powers = task.power_consumption_function.power_segments
+    first_seconds = np.clip(segment_starts - task.total_execution_time, 0, task.task_length).astype(int)
+    end_seconds = np.clip(segment_ends - task.total_execution_time, 0, task.task_length).astype(int)
+    segment_carbon = carbon_trace.sum(start_times[:, np.newaxis] + first_seconds, start_times[:, np.newaxis] + end_seconds)
 
+    return segment_carbon @ powers * task.CPUs
 
-    carbon_times_power_draw = np.empty_like(execution_carbon)
-    for i in range (execution_carbon.shape[0]):
-        time_in_job = task.total_execution_time + i
-        # should check wether we need the task.CPUs or if they should go into the function anyway
-        carbon_times_power_draw[i] = task.power_consumption_function(time_in_job) * execution_carbon.iloc[i] * task.CPUs
 
-    carbon = carbon_times_power_draw.sum()
-    return Schedule(start_time, start_time + task.task_length, carbon)
+def oracle_start_times(task: Task) -> np.ndarray:
+    """Start times considered by the oracle policies, one per hour of the waiting time
+
+    Args:
+        task (Task): current Task
+
+    Returns:
+        np.ndarray: start time indices
+    """
+    return np.arange(0, task.waiting_time + 1, 3600//TIME_FACTOR)
 
 
 def lowest_carbon_slot(task: Task, carbon_trace: CarbonModel) -> Schedule:
@@ -61,7 +89,7 @@ def lowest_carbon_slot(task: Task, carbon_trace: CarbonModel) -> Schedule:
         Schedule: Execution Schedule
     """
     if task.waiting_time != 0:
-        start_time = int(carbon_trace.df[:task.waiting_time + 1]["carbon_intensity_avg"].idxmin())
+        start_time = carbon_trace.argmin(0, task.waiting_time + 1)
     else:
         start_time = 0
     return compute_carbon_consumption(task, start_time, carbon_trace)
@@ -77,10 +105,11 @@ def oracle_carbon_slot(task: Task, carbon_trace: CarbonModel) -> Schedule:
     Returns:
         Schedule: Execution Schedule
     """
-    schedules: List[Schedule] = [compute_carbon_consumption(task, i, carbon_trace) for i in range(0, task.waiting_time + 1, 3600//TIME_FACTOR)]
+    start_times = oracle_start_times(task)
+    carbon_costs = carbon_cost_curve(task, start_times, carbon_trace)
 
-    best_schedule = min(schedules, key=lambda x: x.carbon_cost)
-    return best_schedule
+    best = int(np.argmin(carbon_costs))
+    return Schedule(int(start_times[best]), int(start_times[best]) + task.task_length, carbon_costs[best])
 
 def oracle_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedule:
     """Oracle Carbon Saving per waiting time policy that uses the actual job length
@@ -92,18 +121,13 @@ def oracle_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedul
     Returns:
         Schedule: Execution Schedule
     """
-    schedules = []
-    CA = None
-    for i in range(0, task.waiting_time + 1, 3600//TIME_FACTOR):
-        s = compute_carbon_consumption(task, i, carbon_trace)
-        schedules.append(s)            
-        if i == 0:
-            CA = s.carbon_cost
-
-    if CA is None:
-        raise BaseException('No CA')
-    schedule = max(schedules, key=lambda x: (CA - x.carbon_cost)/(x.start_time+ task.task_length))
-    return schedule
+    start_times = oracle_start_times(task)
+    carbon_costs = carbon_cost_curve(task, start_times, carbon_trace)
+
+    # carbon saved compared to starting right away, per time until the job is done
+    CA = carbon_costs[0]
+    best = int(np.argmax((CA - carbon_costs) / (start_times + task.task_length)))
+    return Schedule(int(start_times[best]), int(start_times[best]) + task.task_length, carbon_costs[best])
 
 def average_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedule:
     """Carbon Saving per waiting time policy that uses the average job length
@@ -115,8 +139,7 @@ def average_carbon_slot_waiting(task: Task, carbon_trace: CarbonModel) -> Schedu
     Returns:
         Schedule: Execution Schedule
     """
-    common_task = Task(task.ID, task.arrival_time,
-                       task.expected_time, task.CPUs, 0, task.power_consumption_function)
+    common_task = SubTask(task, task.arrival_time, task.expected_time, 0)
     common_schedule = oracle_carbon_slot_waiting(common_task, carbon_trace)
     schedule = compute_carbon_consumption(
         task, common_schedule.start_time, carbon_trace)
@@ -133,8 +156,7 @@ def best_waiting_time(task: Task, carbon_trace: CarbonModel) -> Schedule:
     Returns:
         Schedule: Execution Schedule
     """
-    common_task = Task(task.ID, task.arrival_time,
-                       task.expected_time, task.CPUs, 0, task.power_consumption_function)
+    common_task = SubTask(task, task.arrival_time, task.expected_time, 0)
     common_schedule = oracle_carbon_slot(common_task, carbon_trace)
     schedule = compute_carbon_consumption(
         task, common_schedule.start_time, carbon_trace)
@@ -0,0 +1,283 @@
+from __future__ import annotations
+from typing import Dict, List, TypedDict
+
+import numpy as np
+from power_consumption_profiles import Phase
+
+# bound on the states of a dynamic program, 2 bits per state are 128 MiB
+MAX_STATES = 2 ** 29
+
+
+class LinearizedPhase(TypedDict):
+    variable: np.ndarray
+    power: float
+
+
+class DynamicProgrammingSchedule(TypedDict):
+    """
+    Solution of schedule_dynamic_programming, one entry per timeslot in the arrays
+    """
+    feasible: bool
+    objective: float
+    starting: np.ndarray
+    startup_finished: np.ndarray
+    work: np.ndarray
+    startup_time_progressed: np.ndarray
+    work_time_progressed: np.ndarray
+
+
+def timeslots(duration: float, seconds_per_timeslot: int, round_up: bool = False) -> int:
+    """Timeslots a phase of whole seconds takes. The timeslots of a job divide the whole seconds of its phases,
+    only the coarser timeslots of a multi-resolution solve round up a phase that does not fill its last timeslot.
+
+    Args:
+        duration (float): duration in seconds, fractions of a second are dropped
+        seconds_per_timeslot (int): seconds per timeslot
+        round_up (bool): round up instead of down
+
+    Returns:
+        int: amount of timeslots
+    """
+    if round_up:
+        return -(-int(duration) // seconds_per_timeslot)
+    return int(duration) // seconds_per_timeslot
+
+
+def phases_timeslots(phases: List[Phase], seconds_per_timeslot: int, round_up: bool = False) -> int:
+    """Timeslots a group of phases takes, rounded down as a whole or rounded up per phase
+
+    Args:
+        phases (List[Phase]): phases, e.g. the work phases of a job
+        seconds_per_timeslot (int): seconds per timeslot
+        round_up (bool): round up each phase instead of rounding down their sum
+
+    Returns:
+        int: amount of timeslots
+    """
+    if round_up:
+        return sum(timeslots(phase['duration'], seconds_per_timeslot, True) for phase in phases)
+    return int(np.sum([phase['duration'] for phase in phases])) // seconds_per_timeslot
+
+
+def power_by_progress(phases: List[Phase], length: int, seconds_per_timeslot: int, round_up: bool = False) -> np.ndarray:
+    """Power of the timeslot in which a phase group reaches progress 1..length, the same bounds the LP uses
+
+    Args:
+        phases (List[Phase]): startup or work phases
+        length (int): amount of timeslots of the phase group
+        seconds_per_timeslot (int): seconds per timeslot
+        round_up (bool): round up phases that do not fill their last timeslot, see timeslots
+
+    Returns:
+        np.ndarray: power per timeslot of progress
+    """
+    progress = np.arange(1, length + 1)
+    powers = np.zeros(length)
+    lower_bound = 0
+    for phase in phases:
+        if phase['duration'] == 0:
+            continue
+        upper_bound = lower_bound + 1 + phase['duration'] / seconds_per_timeslot
+        powers += phase['power'] * ((progress > lower_bound) & (progress < upper_bound))
+        lower_bound += timeslots(phase['duration'], seconds_per_timeslot, round_up)
+    return powers
+
+
+def linearized_phases(phases: List[Phase], progress: np.ndarray, active: np.ndarray, seconds_per_timeslot: int, running_index: int) -> Dict[str, LinearizedPhase]:
+    """Timeslots in which each phase is active, named like the phase variables of the LP
+
+    Args:
+        phases (List[Phase]): startup or work phases
+        progress (np.ndarray): progress of the phase group per timeslot
+        active (np.ndarray): if the phase group is running per timeslot
+        seconds_per_timeslot (int): seconds per timeslot
+        running_index (int): index of the first phase across both phase groups
+
+    Returns:
+        Dict[str, LinearizedPhase]: activity and power per phase
+    """
+    linearized = {}
+    lower_bound = 0
+    for phase in phases:
+        if phase['duration'] == 0:
+            continue
+        upper_bound = lower_bound + 1 + phase['duration'] / seconds_per_timeslot
+        linearized[phase['name'] + str(running_index)] = LinearizedPhase(
+            variable=(active & (progress > lower_bound) & (progress < upper_bound)).astype(int),
+            power=phase['power'],
+        )
+        running_index += 1
+        lower_bound += int(phase['duration']) // seconds_per_timeslot
+    return linearized
+
+
+def dynamic_programming_states(deadline: int, starts: int, work_length: int) -> int:
+    """States of schedule_dynamic_programming, its memory grows with 2 bits per state
+
+    Args:
+        deadline (int): timeslots until the deadline
+        starts (int): amount of starts that are told apart, 1 without a limit
+        work_length (int): timeslots of work
+
+    Returns:
+        int: amount of states
+    """
+    return (deadline + 1) * starts * (work_length + 1)
+
+
+def schedule_dynamic_programming(
+    carbon: np.ndarray,
+    work_power: np.ndarray,
+    startup_power: np.ndarray,
+    earliest_work: int,
+    max_starts: int | None,
+    blocked: np.ndarray | None = None,
+) -> DynamicProgrammingSchedule:
+    """Cheapest suspend-resume schedule of a single job, solved exactly by dynamic programming
+    over (timeslot, starts, work progress, working in the previous timeslot).
+
+    Every block of work has to be preceded directly by a startup of len(startup_power) timeslots.
+    A block of work that begins after the first timeslot counts as a start.
+
+    Only the costs of the current timeslot and of the last len(startup_power) timeslots are kept, how each
+    state was reached is stored as bits for the backtracking, so memory grows with 2 bits per state.
+
+    Args:
+        carbon (np.ndarray): carbon intensity per timeslot, the deadline is its length
+        work_power (np.ndarray): power of the timeslot with work progress 1..len(work_power)
+        startup_power (np.ndarray): power of the timeslot with startup progress 1..len(startup_power)
+        earliest_work (int): no work can be done before this timeslot
+        max_starts (int | None): maximum amount of starts, None for no limit
+        blocked (np.ndarray | None): timeslots in which the job can neither start up nor work
+
+    Raises:
+        ValueError: the problem has more than MAX_STATES states
+
+    Returns:
+        DynamicProgrammingSchedule: schedule
+    """
+    deadline = len(carbon)
+    work_length = len(work_power)
+    startup_length = len(startup_power)
+    starts = 1 if max_starts is None else max_starts + 1
+    start_increment = 0 if max_starts is None else 1
+
+    starting = np.zeros(deadline, dtype=int)
+    startup_finished = np.zeros(deadline, dtype=int)
+    work = np.zeros(deadline, dtype=int)
+    if work_length > deadline:
+        return DynamicProgrammingSchedule(
+            feasible=False, objective=np.inf, starting=starting, startup_finished=startup_finished, work=work,
+            startup_time_progressed=np.zeros(deadline, dtype=int), work_time_progressed=np.zeros(deadline, dtype=int),
+        )
+    if dynamic_programming_states(deadline, starts, work_length) > MAX_STATES:
+        raise ValueError(f"{deadline} timeslots with {work_length} timeslots of work have more than {MAX_STATES} states, use coarser timeslots")
+
+    # idle[s, p]: cheapest cost at the beginning of the current timeslot t with s starts and p work done,
+    # not working in timeslot t-1. working[s, p] likewise, but working in timeslot t-1
+    idle = np.full((starts, work_length + 1), np.inf)
+    working = np.full((starts, work_length + 1), np.inf)
+    idle[0, 0] = 0
+    # min(idle, working) of the last startup_length + 1 timeslots, for a startup that begins in one of them
+    ready = np.full((startup_length + 1, starts, work_length + 1), np.inf)
+    # how each state was reached, for the backtracking, as bits along the work progress:
+    # work_cheaper[t, s, p] if working[s, p] < idle[s, p] at the beginning of timeslot t,
+    # work_after_start[t, s, p] if the block of work that reached working[s, p] began in timeslot t-1
+    packed_shape = (deadline + 1, starts, (work_length + 8) // 8)
+    work_cheaper = np.zeros(packed_shape, dtype=np.uint8)
+    work_after_start = np.zeros(packed_shape, dtype=np.uint8)
+    take_start = np.zeros((starts, work_length + 1), dtype=bool)
+
+    # cost of a startup that begins in timeslot t
+    startup_costs = np.convolve(carbon, startup_power[::-1], mode='valid') if startup_length > 0 else np.zeros(0)
+    if blocked is not None and startup_length > 0:
+        startup_costs[np.convolve(blocked.astype(int), np.ones(startup_length, dtype=int), mode='valid') > 0] = np.inf
+
+    for t in range(deadline):
+        work_cheaper[t] = np.packbits(working < idle, axis=-1)
+        previous_idle = idle
+        idle = np.minimum(idle, working)
+        ready[t % (startup_length + 1)] = idle
+        previous_working = working
+        working = np.full((starts, work_length + 1), np.inf)
+
+        if t < earliest_work or work_length == 0 or (blocked is not None and blocked[t]):
+            continue
+        work_cost = work_power * carbon[t]
+
+        working[:, 1:] = previous_working[:, :-1] + work_cost
+
+        if startup_length == 0:
+            # resuming without startup, only a block after the first timeslot counts as a start
+            increment = start_increment if t > 0 else 0
+            start = np.full((starts, work_length), np.inf)
+            start[increment:] = previous_idle[:starts - increment, :-1]
+        elif t - startup_length >= 0:
+            # the startup may directly follow a block of work
+            begin = t - startup_length
+            start = np.full((starts, work_length), np.inf)
+            start[start_increment:] = ready[begin % (startup_length + 1), :starts - start_increment, :-1] + startup_costs[begin]
+        else:
+            continue
+        start += work_cost
+
+        take_start[:, 1:] = start < working[:, 1:]
+        work_after_start[t + 1] = np.packbits(take_start, axis=-1)
+        working[:, 1:] = np.where(take_start[:, 1:], start, working[:, 1:])
+    work_cheaper[deadline] = np.packbits(working < idle, axis=-1)
+
+    final = np.minimum(idle[:, work_length], working[:, work_length])
+    # fewest starts between schedules of the same cost
+    s = int(np.argmin(final))
+    objective = float(final[s])
+
+    if not np.isfinite(objective):
+        return DynamicProgrammingSchedule(
+            feasible=False, objective=objective, starting=starting, startup_finished=startup_finished, work=work,
+            startup_time_progressed=np.zeros(deadline, dtype=int), work_time_progressed=np.zeros(deadline, dtype=int),
+        )
+
+    def bit(bits: np.ndarray, t: int, s: int, p: int) -> bool:
+        return bool(bits[t, s, p >> 3] >> (7 - (p & 7)) & 1)
+
+    t = deadline
+    p = work_length
+    is_working = bit(work_cheaper, t, s, p)
+    while t > 0:
+        if not is_working:
+            is_working = bit(work_cheaper, t - 1, s, p)
+            t -= 1
+            continue
+        work[t - 1] = 1
+        if not bit(work_after_start, t, s, p):
+            t -= 1
+            p -= 1
+            continue
+        # the block of work began in timeslot t-1
+        if startup_length == 0:
+            if t - 1 > 0:
+                startup_finished[t - 2] = 1
+                s -= start_increment
+            t -= 1
+            p -= 1
+            is_working = False
+        else:
+            begin = t - 1 - startup_length
+            starting[begin:t - 1] = 1
+            startup_finished[t - 2] = 1
+            s -= start_increment
+            p -= 1
+            is_working = bit(work_cheaper, begin, s, p)
+            t = begin
+
+    # progress within each startup and of the work so far, as in the LP
+    startup_time_progressed = np.zeros(deadline, dtype=int)
+    for t in range(deadline):
+        if starting[t]:
+            startup_time_progressed[t] = startup_time_progressed[t - 1] + 1 if t > 0 else 1
+    work_time_progressed = np.cumsum(work)
+
+    return DynamicProgrammingSchedule(
+        feasible=True, objective=objective, starting=starting, startup_finished=startup_finished, work=work,
+        startup_time_progressed=startup_time_progressed, work_time_progressed=work_time_progressed,
+    )
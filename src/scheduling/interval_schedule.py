@@ -0,0 +1,100 @@
+from __future__ import annotations
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+
+class IntervalSchedule:
+    """Run-length encoded execution schedule: the job runs for lengths[i] seconds from starts[i] on.
+    Segments are sorted, do not overlap and are not adjacent.
+    """
+
+    def __init__(self, starts: np.ndarray, lengths: np.ndarray, horizon: int) -> None:
+        """
+        Args:
+            starts (np.ndarray): first second of each segment, relative to the start of the schedule
+            lengths (np.ndarray): length of each segment in seconds
+            horizon (int): length of the whole schedule in seconds
+        """
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.horizon = horizon
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray | List[int]) -> IntervalSchedule:
+        """Schedule from one entry per second, 1 if the job runs
+
+        Args:
+            mask (np.ndarray | List[int]): schedule with one entry per second
+
+        Returns:
+            IntervalSchedule: run-length encoded schedule
+        """
+        mask = np.asarray(mask, dtype=np.int8)
+        edges = np.diff(np.concatenate(([0], mask, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1)
+        return cls(starts, ends - starts, len(mask))
+
+    @classmethod
+    def from_segments(cls, starts: np.ndarray, lengths: np.ndarray, horizon: int) -> IntervalSchedule:
+        """Schedule from sorted, non-overlapping segments, adjacent segments are merged
+
+        Args:
+            starts (np.ndarray): first second of each segment
+            lengths (np.ndarray): length of each segment
+            horizon (int): length of the whole schedule in seconds
+
+        Returns:
+            IntervalSchedule: run-length encoded schedule
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        starts, lengths = starts[lengths > 0], lengths[lengths > 0]
+        if len(starts) == 0:
+            return cls(starts, lengths, horizon)
+        ends = starts + lengths
+        # a new segment begins wherever a segment does not continue the previous one
+        begins = np.concatenate(([True], starts[1:] != ends[:-1]))
+        merged_starts = starts[begins]
+        merged_ends = ends[np.concatenate((begins[1:], [True]))]
+        return cls(merged_starts, merged_ends - merged_starts, horizon)
+
+    def scale(self, factor: int) -> IntervalSchedule:
+        """Schedule on a timescale with factor times as many steps, e.g. from timeslots to seconds
+
+        Args:
+            factor (int): seconds per step of this schedule
+
+        Returns:
+            IntervalSchedule: scaled schedule
+        """
+        return IntervalSchedule(self.starts * factor, self.lengths * factor, self.horizon * factor)
+
+    def to_mask(self) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: one entry per second, 1 if the job runs
+        """
+        mask = np.zeros(self.horizon, dtype=np.int8)
+        for start, length in self:
+            mask[start:start + length] = 1
+        return mask
+
+    @property
+    def duration(self) -> int:
+        return int(self.lengths.sum())
+
+    def __len__(self) -> int:
+        return self.horizon
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts.tolist(), self.lengths.tolist())
+
+    def __eq__(self, other: object) -> bool:
+        return (
+            isinstance(other, IntervalSchedule)
+            and self.horizon == other.horizon
+            and np.array_equal(self.starts, other.starts)
+            and np.array_equal(self.lengths, other.lengths)
+        )
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from typing import List, Tuple
+
+import numpy as np
+from carbon import CarbonModel
+
+# coarse timeslots before and after each block of the coarse schedule that are solved again on finer timeslots
+REFINE_MARGIN = 1
+
+
+def coarse_timeslot(scaled_deadline: int, seconds_per_timeslot: int, max_timeslots: int) -> int:
+    """Smallest multiple of the timeslot that divides the deadline into at most max_timeslots timeslots
+
+    Args:
+        scaled_deadline (int): deadline in timeslots
+        seconds_per_timeslot (int): seconds per timeslot
+        max_timeslots (int): bound of the model size
+
+    Returns:
+        int: seconds per coarse timeslot
+    """
+    return seconds_per_timeslot * -(-scaled_deadline // max_timeslots)
+
+
+def mean_carbon(carbon_trace: CarbonModel, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Mean carbon intensity of each range [starts, ends), a timeslot may cover several hours of the trace
+
+    Args:
+        carbon_trace (CarbonModel): carbon intensity from the arrival of the job on
+        starts (np.ndarray): first second of each range
+        ends (np.ndarray): end of each range (exclusive)
+
+    Returns:
+        np.ndarray: carbon intensity per range
+    """
+    return carbon_trace.sum(starts, ends) / (ends - starts)
+
+
+def refinement_windows(running: np.ndarray, coarse: int, deadline: int, margin: int = REFINE_MARGIN) -> List[Tuple[int, int]]:
+    """Seconds around the blocks of a coarse schedule, windows that overlap or touch are merged
+
+    Args:
+        running (np.ndarray): if the job runs, per coarse timeslot
+        coarse (int): seconds per coarse timeslot
+        deadline (int): deadline in seconds, the last coarse timeslot also covers the rest of it
+        margin (int): coarse timeslots added on both sides of each block
+
+    Returns:
+        List[Tuple[int, int]]: first second and end (exclusive) of each window
+    """
+    edges = np.diff(np.concatenate(([0], np.asarray(running, dtype=np.int8), [0])))
+    starts = np.maximum(np.flatnonzero(edges == 1) - margin, 0)
+    ends = np.minimum(np.flatnonzero(edges == -1) + margin, len(running))
+    windows: List[Tuple[int, int]] = []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        if len(windows) > 0 and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], end)
+        else:
+            windows.append((start, end))
+    return [(start * coarse, deadline if end == len(running) else end * coarse) for start, end in windows]
+
+
+def compressed_size(windows: List[Tuple[int, int]], seconds_per_timeslot: int) -> int:
+    """Timeslots of the windows one after another, with a blocked timeslot in between
+
+    Args:
+        windows (List[Tuple[int, int]]): windows in seconds, starting at multiples of the timeslot
+        seconds_per_timeslot (int): seconds per timeslot
+
+    Returns:
+        int: amount of timeslots
+    """
+    return sum(end // seconds_per_timeslot - start // seconds_per_timeslot for start, end in windows) + len(windows) - 1
+
+
+def refined_timeslot(windows: List[Tuple[int, int]], coarse: int, seconds_per_timeslot: int, max_timeslots: int) -> int:
+    """Finest timeslot for the windows within the bound, a multiple of the fine timeslot that divides the coarse one
+
+    Args:
+        windows (List[Tuple[int, int]]): windows in seconds
+        coarse (int): seconds per coarse timeslot
+        seconds_per_timeslot (int): seconds per fine timeslot
+        max_timeslots (int): bound of the model size
+
+    Returns:
+        int: seconds per timeslot
+    """
+    ratio = coarse // seconds_per_timeslot
+    for factor in range(1, ratio):
+        if ratio % factor == 0 and compressed_size(windows, seconds_per_timeslot * factor) <= max_timeslots:
+            return seconds_per_timeslot * factor
+    # the coarse timeslots of the windows are never more than the coarse model
+    return coarse
+
+
+def compressed_timeline(carbon_trace: CarbonModel, windows: List[Tuple[int, int]], seconds_per_timeslot: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Timeslots of the windows one after another, with a blocked timeslot in between so the job can not
+    continue from one window into the next without a startup
+
+    Args:
+        carbon_trace (CarbonModel): carbon intensity from the arrival of the job on
+        windows (List[Tuple[int, int]]): windows in seconds
+        seconds_per_timeslot (int): seconds per timeslot
+
+    Returns:
+        np.ndarray: carbon intensity per timeslot, 0 for the blocked ones
+        np.ndarray: if a timeslot is blocked
+        np.ndarray: timeslot of the whole deadline each timeslot is, -1 for the blocked ones
+    """
+    slots = []
+    for i, (start, end) in enumerate(windows):
+        if i > 0:
+            slots.append(np.array([-1]))
+        slots.append(np.arange(start // seconds_per_timeslot, end // seconds_per_timeslot))
+    timeline = np.concatenate(slots)
+    blocked = timeline < 0
+    carbon = np.zeros(len(timeline))
+    seconds = timeline[~blocked] * seconds_per_timeslot
+    carbon[~blocked] = mean_carbon(carbon_trace, seconds, seconds + seconds_per_timeslot)
+    return carbon, blocked, timeline
+
+
+def rearrangement_bound(carbon: np.ndarray, work_power: np.ndarray, startup_power: np.ndarray) -> float:
+    """Lower bound of the carbon of every schedule: the highest power of the work in the timeslots with the
+    lowest carbon intensity (rearrangement inequality), ignoring their order, plus the cheapest single startup
+
+    Args:
+        carbon (np.ndarray): carbon intensity per timeslot
+        work_power (np.ndarray): power per timeslot of work progress
+        startup_power (np.ndarray): power per timeslot of startup progress
+
+    Returns:
+        float: lower bound
+    """
+    bound = float(np.sort(work_power)[::-1] @ np.sort(carbon)[:len(work_power)])
+    if len(startup_power) > 0:
+        bound += float(np.convolve(carbon, startup_power[::-1], mode='valid').min())
+    return bound
+
+
+def blocks_cost(blocks: List[Tuple[int, int, int]], carbon: np.ndarray, work_power: np.ndarray, startup_power: np.ndarray) -> float:
+    """Carbon of a schedule
+
+    Args:
+        blocks (List[Tuple[int, int, int]]): first timeslot, startup and work timeslots of each block
+        carbon (np.ndarray): carbon intensity per timeslot
+        work_power (np.ndarray): power per timeslot of work progress
+        startup_power (np.ndarray): power per timeslot of startup progress
+
+    Returns:
+        float: carbon
+    """
+    cost = 0.0
+    progress = 0
+    for start, startup, work in blocks:
+        cost += float(startup_power[:startup] @ carbon[start:start + startup])
+        cost += float(work_power[progress:progress + work] @ carbon[start + startup:start + startup + work])
+        progress += work
+    return cost
+
+
+def cheapest_start(carbon: np.ndarray, work_power: np.ndarray, startup_power: np.ndarray) -> int | None:
+    """First timeslot of the cheapest schedule without interruption, the startup directly followed by all work
+
+    Args:
+        carbon (np.ndarray): carbon intensity per timeslot
+        work_power (np.ndarray): power per timeslot of work progress
+        startup_power (np.ndarray): power per timeslot of startup progress
+
+    Returns:
+        int | None: first timeslot, None if the job does not fit the timeslots
+    """
+    power = np.concatenate([startup_power, work_power])
+    if len(power) > len(carbon):
+        return None
+    if len(power) == 0:
+        return 0
+    return int(np.argmin(np.convolve(carbon, power[::-1], mode='valid')))
@@ -0,0 +1,139 @@
+from __future__ import annotations
+from collections import OrderedDict
+import hashlib
+import json
+import os
+from typing import Any, Callable
+
+import numpy as np
+from carbon import CarbonModel
+from profiler import PROFILER
+from scheduling.interval_schedule import IntervalSchedule
+
+
+class ScheduleCache:
+    """Content addressed cache of suspend-resume schedules. Schedules are kept in memory (LRU)
+    and, if a directory is given, also on disk so they can be reused between runs and processes.
+    """
+
+    def __init__(self, maxsize: int = 1024, directory: str | None = None) -> None:
+        """
+        Args:
+            maxsize (int): amount of schedules kept in memory
+            directory (str | None): directory of the on-disk store, None to only cache in memory
+        """
+        self.maxsize = maxsize
+        self.directory = directory
+        self.schedules: OrderedDict[str, IntervalSchedule] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(parameters: Any, carbon: np.ndarray) -> str:
+        """Canonical hash of everything a schedule depends on
+
+        Args:
+            parameters (Any): json serializable parameters, e.g. the phases and deadline
+            carbon (np.ndarray): carbon values the schedule is computed on
+
+        Returns:
+            str: hex digest
+        """
+        digest = hashlib.sha256(json.dumps(parameters, sort_keys=True).encode())
+        digest.update(np.ascontiguousarray(carbon, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        assert self.directory is not None
+        return os.path.join(self.directory, f"{key}.npz")
+
+    def get(self, key: str) -> IntervalSchedule | None:
+        """Cached schedule, the returned schedule is shared and must not be modified
+
+        Args:
+            key (str): key as returned by ScheduleCache.key
+
+        Returns:
+            IntervalSchedule | None: schedule or None if it is not cached
+        """
+        schedule = self.schedules.get(key)
+        if schedule is not None:
+            self.schedules.move_to_end(key)
+        elif self.directory is not None:
+            schedule = self._load(key)
+            if schedule is not None:
+                self._remember(key, schedule)
+
+        if schedule is None:
+            self.misses += 1
+            PROFILER.count("schedule_cache.misses")
+        else:
+            self.hits += 1
+            PROFILER.count("schedule_cache.hits")
+        return schedule
+
+    def put(self, key: str, schedule: IntervalSchedule) -> None:
+        """Cache a schedule
+
+        Args:
+            key (str): key as returned by ScheduleCache.key
+            schedule (IntervalSchedule): schedule
+        """
+        self._remember(key, schedule)
+        if self.directory is not None:
+            self._store(key, schedule)
+
+    def _load(self, key: str) -> IntervalSchedule | None:
+        if not os.path.exists(self._path(key)):
+            return None
+        with np.load(self._path(key)) as segments:
+            return IntervalSchedule(segments["starts"], segments["lengths"], int(segments["horizon"]))
+
+    def _store(self, key: str, schedule: IntervalSchedule) -> None:
+        # write to a temporary file first, other processes might read the same schedule
+        temporary_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            np.savez(file, starts=schedule.starts, lengths=schedule.lengths, horizon=schedule.horizon)
+        os.replace(temporary_path, self._path(key))
+
+    def get_or_compute(self, key: str, compute: Callable[[], IntervalSchedule]) -> IntervalSchedule:
+        """Cached schedule, computed and cached if it is not cached yet
+
+        Args:
+            key (str): key as returned by ScheduleCache.key
+            compute (Callable[[], IntervalSchedule]): computes the schedule
+
+        Returns:
+            IntervalSchedule: schedule, must not be modified
+        """
+        schedule = self.get(key)
+        if schedule is None:
+            schedule = compute()
+            self.put(key, schedule)
+        return schedule
+
+    def _remember(self, key: str, schedule: IntervalSchedule) -> None:
+        self.schedules[key] = schedule
+        self.schedules.move_to_end(key)
+        while len(self.schedules) > self.maxsize:
+            self.schedules.popitem(last=False)
+
+
+def carbon_window(carbon_trace: CarbonModel) -> np.ndarray:
+    """Compact representation of the carbon values of a model, two models with the same
+    representation have the same values. Used as cache key instead of one value per second.
+
+    Args:
+        carbon_trace (CarbonModel): Carbon Intensity model
+
+    Returns:
+        np.ndarray: stored values covered by the model, followed by the position of the model within them
+    """
+    first_value = carbon_trace.offset // carbon_trace.factor
+    last_value = (carbon_trace.offset + carbon_trace.length - 1) // carbon_trace.factor
+    return np.concatenate((
+        carbon_trace.intensity[first_value:last_value + 1],
+        [carbon_trace.offset % carbon_trace.factor, carbon_trace.length, carbon_trace.factor],
+    ))
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import heapq
+from itertools import count
+from typing import Callable, Dict, Iterator, List, Set, Tuple
+from task import Task
+
+
+class QueueObject:
+    sequence_counter = count()
+
+    def __init__(self, task: Task, max_start_time: int, priority: int) -> None:
+        self.task = task
+        self.max_start_time = max_start_time
+        self.priority = priority
+        # ties are broken by submission order, so that the order in which jobs leave the
+        # queue does not depend on how often the queue has been rebuilt. This changed the
+        # results of the per-second loop too, see the README
+        self.sequence = next(QueueObject.sequence_counter)
+
+    def __lt__(self, other: QueueObject) -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+
+class SchedulerQueue:
+    """Queue of the jobs a scheduling policy holds back. Jobs are kept in a heap keyed on the time they are due,
+    so a tick only touches the jobs that are due. Jobs that may start early on free reserved instances
+    (work conserving) are additionally indexed by their amount of CPUs, in order of priority.
+
+    This is not thread-safe, the cluster lock is held while the scheduler executes.
+    """
+
+    def __init__(self, work_conserving: Callable[[Task], bool] | None = None) -> None:
+        """
+        Args:
+            work_conserving (Callable[[Task], bool] | None): which jobs may start before they are due if
+                reserved instances are available, None if no job may
+        """
+        self.work_conserving = work_conserving
+        self.due: List[Tuple[int, int, int, QueueObject]] = []
+        # heaps of (priority, sequence) per amount of CPUs of the work conserving jobs
+        self.by_cpus: Dict[int, List[Tuple[int, int, QueueObject]]] = {}
+        # jobs still in the queue, removed jobs stay in the heaps until they reach the top
+        self.queued: Set[int] = set()
+
+    def put(self, queue_object: QueueObject) -> None:
+        heapq.heappush(self.due, (queue_object.max_start_time, queue_object.priority, queue_object.sequence, queue_object))
+        if self.work_conserving is not None and self.work_conserving(queue_object.task):
+            heapq.heappush(
+                self.by_cpus.setdefault(queue_object.task.CPUs, []),
+                (queue_object.priority, queue_object.sequence, queue_object),
+            )
+        self.queued.add(queue_object.sequence)
+
+    def empty(self) -> bool:
+        return len(self.queued) == 0
+
+    def __len__(self) -> int:
+        return len(self.queued)
+
+    def next_start_time(self) -> int | None:
+        """Earliest time at which a queued job becomes due
+
+        Returns:
+            int | None: time index or None if the queue is empty
+        """
+        while len(self.due) > 0 and self.due[0][2] not in self.queued:
+            heapq.heappop(self.due)
+        return self.due[0][0] if len(self.due) > 0 else None
+
+    def pop_due(self, current_time: int) -> List[QueueObject]:
+        """Remove all jobs that are due
+
+        Args:
+            current_time (int): time index
+
+        Returns:
+            List[QueueObject]: due jobs in order of priority
+        """
+        due = []
+        while len(self.due) > 0 and self.due[0][0] <= current_time:
+            _, _, sequence, queue_object = heapq.heappop(self.due)
+            if sequence in self.queued:
+                self.queued.discard(sequence)
+                due.append(queue_object)
+        due.sort()
+        return due
+
+    def pop_ready(self, current_time: int, available_instances: Callable[[], int]) -> Iterator[QueueObject]:
+        """Remove the jobs that are due and the work conserving jobs that fit on the available reserved instances.
+        Jobs are yielded in order of priority and the available instances are checked again for every job,
+        so they have to be updated before the next job is requested. This is the same as checking every
+        queued job in order of priority.
+
+        Args:
+            current_time (int): time index
+            available_instances (Callable[[], int]): currently available reserved instances
+
+        Yields:
+            QueueObject: ready jobs in order of priority
+        """
+        due = self.pop_due(current_time)
+        i = 0
+        while True:
+            candidate = self._first_fitting(available_instances())
+            if i < len(due) and (candidate is None or due[i] < candidate):
+                yield due[i]
+                i += 1
+            elif candidate is not None:
+                self.queued.discard(candidate.sequence)
+                yield candidate
+            else:
+                return
+
+    def _first_fitting(self, available_instances: int) -> QueueObject | None:
+        # work conserving job of the highest priority that fits on the available instances
+        first = None
+        for cpus, heap in self.by_cpus.items():
+            if cpus > available_instances:
+                continue
+            while len(heap) > 0 and heap[0][1] not in self.queued:
+                heapq.heappop(heap)
+            if len(heap) > 0 and (first is None or heap[0][2] < first):
+                first = heap[0][2]
+        return first
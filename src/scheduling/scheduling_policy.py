@@ -3,30 +3,27 @@ from typing import Callable
 from carbon import CarbonModel
 from task import Task
 from .carbon_waiting_policy import Schedule
-from queue import PriorityQueue
+from .scheduler_queue import QueueObject, SchedulerQueue
 from cluster import BaseCluster
 
-class QueueObject:
-    def __init__(self, task: Task, max_start_time: int, priority: int) -> None:
-        self.task = task
-        self.max_start_time = max_start_time
-        self.priority = priority
-
-    def __lt__(self, other: QueueObject) -> bool:
-        return self.priority < other.priority
-
-    # def __str__(self) -> str:
-    #     return str(self.x)
-
 class SchedulingPolicy():
     def __init__(self, cluster:BaseCluster, carbon_model: CarbonModel, compute_start_time: Callable[[Task, CarbonModel], Schedule], carbon_aware: bool, cost_aware: bool, spot_aware: bool) -> None:
         self.cluster = cluster
         self.carbon_model = carbon_model
         self.compute_start_time  = compute_start_time        
-        self.queue: PriorityQueue[QueueObject] = PriorityQueue()
         self.carbon_aware = carbon_aware
         self.cost_aware = cost_aware
         self.spot_aware = spot_aware
+        self.queue = SchedulerQueue(self.is_work_conserving if cost_aware else None)
+
+    def is_work_conserving(self, task: Task) -> bool:
+        """If the task may start before its start time when reserved instances are available
+
+        Args:
+            task (Task): Task
+        """
+        # partial work conserving (long jobs only) with spot instances
+        return self.cost_aware and (not self.spot_aware or task.task_length_class != "0-2")
 
     def submit(self, current_time: int, task: Task) -> None:
         """Submit Job to GAIA Queue
@@ -58,22 +55,17 @@ class SchedulingPolicy():
             current_time (int): time index
         """
 
-        # tasks whose start time is not yet
-        waiting_tasks: PriorityQueue[QueueObject] = PriorityQueue()
-        while not self.queue.empty():
-            queue_object = self.queue.get()
-            if current_time >= queue_object.max_start_time:
-                # Submit if ready
-                self.cluster.submit(current_time, queue_object.task)
-            elif self.cost_aware and not self.spot_aware and self.cluster.available_reserved_instances >= queue_object.task.CPUs:
-                # Submit if work conserving (not spot) and available resources
-                self.cluster.submit(current_time, queue_object.task)
-            elif self.cost_aware and self.spot_aware and queue_object.task.task_length_class != "0-2" and self.cluster.available_reserved_instances >= queue_object.task.CPUs:
-                # Submit if partial work conserving (long jobs only) and available resources
-                self.cluster.submit(current_time, queue_object.task)
-            else:
-                waiting_tasks.put(queue_object)
+        # Submit if ready, or if work conserving and resources are available
+        for queue_object in self.queue.pop_ready(current_time, lambda: self.cluster.available_reserved_instances):
+            self.cluster.submit(current_time, queue_object.task)
 
-        self.queue = waiting_tasks
         self.cluster.refresh_data(current_time)
+
+    def next_start_time(self) -> int | None:
+        """Earliest time at which a queued job becomes due, used by the event-driven simulation
+
+        Returns:
+            int | None: time index or None if the queue is empty
+        """
+        return self.queue.next_start_time()
         
\ No newline at end of file
@@ -0,0 +1,84 @@
+from typing import Dict, List, TypedDict
+
+import pulp
+
+# dp is not an LP solver, the scheduler solves the same problem by dynamic programming instead
+SOLVERS: List[str] = ["cbc", "highs", "gurobi", "dp"]
+
+
+class SolverOptions(TypedDict):
+    """
+    LP solver used by the suspend-resume scheduler for dynamic power, each solve gets this many threads and seconds.
+    Jobs with more timeslots than max_timeslots are solved coarse to fine, so no model gets bigger than that,
+    without max_timeslots every job is solved optimally on its finest timeslots.
+    """
+    name: str
+    threads: int | None
+    timelimit: int | None
+    max_timeslots: int | None
+
+
+# CBC and HiGHS run one solve per core, so a process pool can use every core.
+# Gurobi keeps the previous 4 threads, as the license limits the number of parallel sessions anyway
+DEFAULT_THREADS: Dict[str, int] = {
+    "cbc": 1,
+    "highs": 1,
+    "gurobi": 4,
+    "dp": 1,
+}
+
+DEFAULT_TIMELIMIT = 20 * 60
+
+
+def default_solver_options(name: str = "cbc", threads: int | None = None, timelimit: int | None = DEFAULT_TIMELIMIT, max_timeslots: int | None = None) -> SolverOptions:
+    """Solver options, threads defaults to the per solver setting
+
+    Args:
+        name (str): one of SOLVERS
+        threads (int | None): threads per solve
+        timelimit (int | None): seconds per solve, None for no limit
+        max_timeslots (int | None): timeslots per model, None to always solve on the finest timeslots
+
+    Returns:
+        SolverOptions: solver options
+    """
+    if name not in SOLVERS:
+        raise ValueError(f"Unknown solver {name}, use one of {SOLVERS}")
+    return SolverOptions(
+        name=name,
+        threads=threads if threads is not None else DEFAULT_THREADS[name],
+        timelimit=timelimit,
+        max_timeslots=max_timeslots,
+    )
+
+
+def get_solver(options: SolverOptions, warm_start: bool = False) -> pulp.LpSolver:
+    """Create the pulp solver for the options
+
+    Args:
+        options (SolverOptions): solver options
+        warm_start (bool): start from the initial values of the variables, the HiGHS python bindings ignore this
+
+    Raises:
+        ValueError: the solver is unknown or not installed
+
+    Returns:
+        pulp.LpSolver: solver that can be passed to LpProblem.solve
+    """
+    name = options["name"]
+    arguments = dict(msg=False, timeLimit=options["timelimit"], threads=options["threads"])
+    if name == "cbc":
+        solver = pulp.PULP_CBC_CMD(**arguments, warmStart=warm_start)
+    elif name == "highs":
+        # prefer the python bindings (highspy), fall back to the executable
+        solver = pulp.HiGHS(**arguments)
+        if not solver.available():
+            solver = pulp.HiGHS_CMD(**arguments, warmStart=warm_start)
+    elif name == "gurobi":
+        solver = pulp.GUROBI_CMD(**arguments, warmStart=warm_start)
+    else:
+        raise ValueError(f"Unknown solver {name}, use one of {SOLVERS}")
+
+    if not solver.available():
+        raise ValueError(f"Solver {name} is not available, installed solvers are {pulp.listSolvers(onlyAvailable=True)}")
+    return solver
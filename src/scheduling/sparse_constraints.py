@@ -0,0 +1,105 @@
+from __future__ import annotations
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pulp
+
+
+class SparseConstraints:
+    """Linear constraints in coordinate (COO) form. Constraints of the same shape, e.g. one per timeslot,
+    are added at once as arrays of variable indices, the problem is built from the matrix in one pass.
+    """
+
+    def __init__(self) -> None:
+        self.rows: List[np.ndarray] = []
+        self.columns: List[np.ndarray] = []
+        self.values: List[np.ndarray] = []
+        self.senses: List[np.ndarray] = []
+        self.rhs: List[np.ndarray] = []
+        self.names: Dict[int, str] = {}
+        self.count = 0
+
+    def add(self, terms: Sequence[Tuple[np.ndarray, float | np.ndarray]], sense: int, rhs: float | np.ndarray, names: Sequence[str] | None = None) -> None:
+        """Add one constraint per entry of the index arrays: sum(coefficient * variable) sense rhs
+
+        Args:
+            terms (Sequence[Tuple[np.ndarray, float | np.ndarray]]): variable indices and their coefficients, one entry per constraint
+            sense (int): pulp.LpConstraintLE, pulp.LpConstraintEQ or pulp.LpConstraintGE
+            rhs (float | np.ndarray): right hand side, one per constraint or the same for all
+            names (Sequence[str] | None): names of the constraints, None to number them
+        """
+        amount = len(terms[0][0])
+        if amount == 0:
+            return
+        rows = np.arange(self.count, self.count + amount)
+        for columns, coefficients in terms:
+            assert len(columns) == amount
+            self.rows.append(rows)
+            self.columns.append(np.asarray(columns, dtype=np.int64))
+            self.values.append(np.broadcast_to(np.asarray(coefficients, dtype=np.float64), (amount,)))
+        self.senses.append(np.full(amount, sense, dtype=np.int8))
+        self.rhs.append(np.broadcast_to(np.asarray(rhs, dtype=np.float64), (amount,)))
+        if names is not None:
+            self.names.update(zip(rows.tolist(), names))
+        self.count += amount
+
+    def add_row(self, columns: np.ndarray, coefficients: float | np.ndarray, sense: int, rhs: float, name: str | None = None) -> None:
+        """Add a single constraint over many variables, it may also be empty
+
+        Args:
+            columns (np.ndarray): variable indices
+            coefficients (float | np.ndarray): coefficient per variable or the same for all
+            sense (int): pulp.LpConstraintLE, pulp.LpConstraintEQ or pulp.LpConstraintGE
+            rhs (float): right hand side
+            name (str | None): name of the constraint, None to number it
+        """
+        self.rows.append(np.full(len(columns), self.count))
+        self.columns.append(np.asarray(columns, dtype=np.int64))
+        self.values.append(np.broadcast_to(np.asarray(coefficients, dtype=np.float64), (len(columns),)))
+        self.senses.append(np.array([sense], dtype=np.int8))
+        self.rhs.append(np.array([rhs], dtype=np.float64))
+        if name is not None:
+            self.names[self.count] = name
+        self.count += 1
+
+    def matrix(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Constraint matrix, duplicate entries are summed
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: rows, columns and values, sorted by row and column
+        """
+        if len(self.rows) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        rows = np.concatenate(self.rows)
+        columns = np.concatenate(self.columns)
+        values = np.concatenate(self.values)
+        width = int(columns.max(initial=0)) + 1
+        entries, index = np.unique(rows * width + columns, return_inverse=True)
+        return entries // width, entries % width, np.bincount(index, weights=values, minlength=len(entries))
+
+    def bounds(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: sense and right hand side of each constraint
+        """
+        if self.count == 0:
+            return np.zeros(0, dtype=np.int8), np.zeros(0)
+        return np.concatenate(self.senses), np.concatenate(self.rhs)
+
+    def add_to(self, prob: pulp.LpProblem, variables: Sequence[pulp.LpVariable]) -> None:
+        """Add all constraints to a pulp problem
+
+        Args:
+            prob (pulp.LpProblem): problem
+            variables (Sequence[pulp.LpVariable]): variable of each index
+        """
+        rows, columns, values = self.matrix()
+        senses, rhs = self.bounds()
+        row_starts = np.searchsorted(rows, np.arange(self.count + 1)).tolist()
+        column_variables = [variables[column] for column in columns.tolist()]
+        values_list = values.tolist()
+        for row, (sense, right_hand_side) in enumerate(zip(senses.tolist(), rhs.tolist())):
+            start, end = row_starts[row], row_starts[row + 1]
+            # the constraint is built from its terms directly, an expression would be copied
+            constraint = pulp.LpConstraint(zip(column_variables[start:end], values_list[start:end]), sense, rhs=right_hand_side)
+            prob.addConstraint(constraint, self.names.get(row, f"_C{row + 1}"))
@@ -1,13 +1,23 @@
 from __future__ import annotations
 from carbon import CarbonModel
 from power_consumption_profiles import PowerFunction
-from task import TIME_FACTOR, Task
-from queue import PriorityQueue
+from profiler import PROFILER
+from task import TIME_FACTOR, SubTask, Task
 from cluster import BaseCluster
-from typing import Dict, List, TypedDict, Any
-
+from scheduling.dynamic_programming import MAX_STATES, DynamicProgrammingSchedule, dynamic_programming_states, linearized_phases, phases_timeslots, power_by_progress, schedule_dynamic_programming, timeslots
+from scheduling.multi_resolution import blocks_cost, cheapest_start, coarse_timeslot, compressed_timeline, mean_carbon, rearrangement_bound, refined_timeslot, refinement_windows
+from scheduling.interval_schedule import IntervalSchedule
+from scheduling.scheduler_queue import QueueObject, SchedulerQueue
+from scheduling.schedule_cache import ScheduleCache
+from scheduling.solvers import SolverOptions, default_solver_options, get_solver
+from scheduling.sparse_constraints import SparseConstraints
+from typing import Dict, List, Tuple, TypedDict, Any
+
+import numpy as np
 import pulp
+import json
 import math
+from collections import OrderedDict
 from functools import reduce
 
 class SchedulerDebug(TypedDict):
@@ -34,14 +44,39 @@ class SchedulerDebugOptions(TypedDict):
     timelimit: int | None  
     scale_time: bool
 
-class QueueObject:
-    def __init__(self, task: Task, max_start_time: int, priority: int):
-        self.task = task
-        self.max_start_time = max_start_time
-        self.priority = priority
 
-    def __lt__(self, other: QueueObject) -> bool:
-        return self.priority < other.priority
+class LpModel(TypedDict):
+    """
+    LP of jobs with the same phases and deadline, the last solution is kept to warm start the next solve
+    """
+    prob: pulp.LpProblem
+    starting: Dict[int, pulp.LpVariable]
+    startup_finished: Dict[int, pulp.LpVariable]
+    work: Dict[int, pulp.LpVariable]
+    work_time_progressed: Dict[int, pulp.LpVariable]
+    startup_time_progressed: Dict[int, pulp.LpVariable]
+    lin_function_dicts: Dict[str, Dict[str, Dict[str, pulp.LpVariable | float]]]
+    cost: List[Tuple[Dict[int, pulp.LpVariable], float]]
+    timeslot_variables: Dict[str, Tuple[Dict[int, pulp.LpVariable], bool]]
+    solution: Dict[str, np.ndarray] | None
+    solution_arrival_time: int | None
+
+
+class TimeslotSolution(TypedDict):
+    """
+    Schedule of the LP or the dynamic program, one entry per timeslot
+    """
+    starting: np.ndarray
+    work: np.ndarray
+    optimal: bool
+
+
+# at most this many restarts of a job, this keeps the search space of the LP small
+MAX_STARTS = 5
+
+# LPs kept per policy, each job structure (phases and deadline) has its own
+LP_MODELS = 8
+
 
 class SuspendSchedulingDynamicPowerPolicy:
     """Scheduling policy that takes into account that jobs may have a startup phase on resuming,
@@ -50,10 +85,17 @@ class SuspendSchedulingDynamicPowerPolicy:
     This uses a linear programming approach to optimize the emitted carbon.
     """
 
-    def __init__(self, cluster: BaseCluster, carbon_model: CarbonModel) -> None:
+    def __init__(self, cluster: BaseCluster, carbon_model: CarbonModel, solver_options: SolverOptions | None = None, schedule_cache: ScheduleCache | None = None) -> None:
         self.cluster: BaseCluster = cluster
         self.carbon_model: CarbonModel = carbon_model
-        self.queue: PriorityQueue[QueueObject] = PriorityQueue()
+        self.queue = SchedulerQueue()
+        self.solver_options: SolverOptions = solver_options if solver_options is not None else default_solver_options()
+        # fail before the simulation starts if the solver is not installed
+        if self.solver_options["name"] != "dp":
+            get_solver(self.solver_options)
+        self.schedule_cache: ScheduleCache = schedule_cache if schedule_cache is not None else ScheduleCache()
+        # LPs of recent job structures, solved again with the objective of the next job
+        self.lp_models: OrderedDict[str, LpModel] = OrderedDict()
 
     def submit(self, current_time: int, task: Task) -> None:
         """Split Task to multiple jobs (suspend-resume) and submit them to GAIA Queue
@@ -65,25 +107,16 @@ class SuspendSchedulingDynamicPowerPolicy:
         sub_tasks = []
         start_times = []
         tasks = 0
-        i = 0
         total_execution_time = 0
 
         max_timeslot = task.waiting_time + task.task_length + task.arrival_time
 
         carbon_model_beginning_at_job_arrival = self.carbon_model.subtrace(task.arrival_time, max_timeslot + 3600)
 
-        schedule = self.find_execution_times(carbon_model_beginning_at_job_arrival, task.waiting_time + task.task_length, task.power_consumption_function)
+        schedule = self.find_execution_times(carbon_model_beginning_at_job_arrival, task.waiting_time + task.task_length, task.power_consumption_function, arrival_time=task.arrival_time)
 
-        while i < len(schedule):
-            if schedule[i] == 0:
-                i += 1
-                continue
-            start = i
-            while i < len(schedule) and schedule[i] == 1:
-                i = i + 1
-            
-            task_length = i - start
-            subtask = Task(task.ID, current_time, task_length, task.CPUs, total_execution_time, task.power_consumption_function)
+        for start, task_length in schedule:
+            subtask = SubTask(task, current_time, task_length, total_execution_time)
             
             # we need to keep track of how long each task has run so far, so we can properly call the power consumption
             total_execution_time += task_length
@@ -111,17 +144,19 @@ class SuspendSchedulingDynamicPowerPolicy:
         Args:
             current_time (int): time index
         """
-        queue: PriorityQueue[QueueObject] = PriorityQueue()
-        while not self.queue.empty():
-            queue_object = self.queue.get()
-            if current_time >= queue_object.max_start_time:
-                self.cluster.submit(current_time, queue_object.task)
-            else:
-                queue.put(queue_object)
-        self.queue = queue
+        for queue_object in self.queue.pop_due(current_time):
+            self.cluster.submit(current_time, queue_object.task)
         self.cluster.refresh_data(current_time)
 
-    def find_execution_times(self, carbon_trace: CarbonModel, DEADLINE: int, model: PowerFunction, debugOptions: SchedulerDebugOptions | None = None) -> List[int] | SchedulerDebug:
+    def next_start_time(self) -> int | None:
+        """Earliest time at which a queued job/subjob becomes due, used by the event-driven simulation
+
+        Returns:
+            int | None: time index or None if the queue is empty
+        """
+        return self.queue.next_start_time()
+
+    def find_execution_times(self, carbon_trace: CarbonModel, DEADLINE: int, model: PowerFunction, debugOptions: SchedulerDebugOptions | None = None, arrival_time: int | None = None) -> IntervalSchedule | SchedulerDebug:
         # Using a second-based timescale means that we need too much to the model
         # instead, try to find a better timescale. This attempt uses the biggest common divisor
         # between the seconds-based-timescale (each data point is repeated 3600 being one hour)
@@ -132,7 +167,7 @@ class SuspendSchedulingDynamicPowerPolicy:
                 dynamic_power=True, 
                 use_progress=True, 
                 linearize=True,
-                timelimit=20*60,
+                timelimit=self.solver_options["timelimit"],
                 scale_time=True,
         )
 
@@ -147,21 +182,322 @@ class SuspendSchedulingDynamicPowerPolicy:
 
         print(f"scaled deadlines is: {SCALED_DEADLINE}, spt: {seconds_per_timeslot}")
 
-        # Define the problem
-        prob = pulp.LpProblem("StopResumeCarbonAwareScheduling", pulp.LpMinimize)
-        
-        seconds_carbon_trace = carbon_trace.df.iloc[::seconds_per_timeslot].reset_index(drop=True) if options["scale_time"] else carbon_trace.df
-        
+        seconds_carbon_trace = carbon_trace.values(0, SCALED_DEADLINE * seconds_per_timeslot, seconds_per_timeslot)
+
+        # jobs with the same phases, deadline and carbon values get the same schedule, debug runs always solve
+        cache_key: str | None = None
+        if debugOptions is None:
+            cache_key = ScheduleCache.key(
+                ["lp", model.phases, SCALED_DEADLINE, seconds_per_timeslot, self.solver_options],
+                seconds_carbon_trace,
+            )
+            cached_schedule = self.schedule_cache.get(cache_key)
+            if cached_schedule is not None:
+                return cached_schedule
+
+        max_timeslots = self.solver_options["max_timeslots"]
+        if debugOptions is None and self.solver_options["name"] == "dp":
+            starts = MAX_STARTS + 1 if options["use_startup"] else 1
+            if dynamic_programming_states(SCALED_DEADLINE, starts, phases_timeslots(model.phases['work'], seconds_per_timeslot)) > MAX_STATES:
+                # the work of a schedule fits its timeslots, so coarse to fine solves stay within the states of the dynamic program
+                dp_max_timeslots = math.isqrt(MAX_STATES // starts) - 1
+                max_timeslots = dp_max_timeslots if max_timeslots is None else min(max_timeslots, dp_max_timeslots)
+        if debugOptions is None and max_timeslots is not None and SCALED_DEADLINE > max_timeslots:
+            return self.find_execution_times_multi_resolution(carbon_trace, DEADLINE, seconds_per_timeslot, seconds_carbon_trace, model, options, cache_key, arrival_time, max_timeslots)
+
+        if self.solver_options["name"] == "dp":
+            return self.find_execution_times_dp(seconds_carbon_trace, seconds_per_timeslot, model, options, cache_key)
+
+        lp = self.solve_lp(seconds_carbon_trace, seconds_per_timeslot, model, options, debugOptions is None, arrival_time)
+        prob = lp["prob"]
+        starting = lp["starting"]
+        work = lp["work"]
+
+        # solvers return binaries only up to their integrality tolerance, e.g. HiGHS reports 1e-13 instead of 0
+        running = [
+            (pulp.value(starting[t]) is not None and pulp.value(starting[t]) > 0.5)
+            or (pulp.value(work[t]) is not None and pulp.value(work[t]) > 0.5)
+            for t in range(SCALED_DEADLINE)
+        ]
+        # need to scale it back to the seconds-timescale
+        schedule = IntervalSchedule.from_mask(running).scale(seconds_per_timeslot)
+
+        if (debugOptions is not None):
+            return SchedulerDebug(
+                carbon_trace = dict(enumerate(seconds_carbon_trace.tolist())),
+                starting = starting,
+                startup_finished = lp["startup_finished"],
+                work = work,
+                work_time_progressed = lp["work_time_progressed"],
+                startup_time_progressed = lp["startup_time_progressed"],
+                lin_function_dicts = lp["lin_function_dicts"]
+            )
+
+        if cache_key is not None and prob.status == pulp.LpStatusOptimal:
+            self.schedule_cache.put(cache_key, schedule)
+        return schedule
 
-        WORK_LENGTH = int(model.duration_work) // seconds_per_timeslot
-        STARTUP_LENGTH = int(model.duration_startup) // seconds_per_timeslot
+    def solve_lp(self, carbon: np.ndarray, seconds_per_timeslot: int, model: PowerFunction, options: SchedulerDebugOptions, reuse: bool, arrival_time: int | None, blocked: np.ndarray | None = None, round_up: bool = False) -> LpModel:
+        """Solve the LP of a job on the carbon intensity of its timeslots
+
+        Args:
+            carbon (np.ndarray): carbon intensity per timeslot, the deadline is its length
+            seconds_per_timeslot (int): seconds per timeslot
+            model (PowerFunction): power consumption of the job
+            options (SchedulerDebugOptions): which parts of the problem are modelled
+            reuse (bool): reuse and warm start the LP of jobs with the same phases and deadline, debug runs build their own
+            arrival_time (int | None): arrival time of the job, to shift the previous solution, None if unknown
+            blocked (np.ndarray | None): timeslots in which the job can neither start up nor work
+            round_up (bool): round up phases that do not fill their last timeslot, for the coarser timeslots of multi-resolution solves
+
+        Returns:
+            LpModel: solved LP
+        """
+        SCALED_DEADLINE = len(carbon)
+
+        # jobs with the same phases and deadline share the constraints, only the objective depends on the carbon values
+        lp_key: str | None = None
+        lp: LpModel | None = None
+        if reuse:
+            lp_key = json.dumps([model.phases, SCALED_DEADLINE, seconds_per_timeslot, round_up], sort_keys=True)
+            lp = self.lp_models.get(lp_key)
+            if lp is not None:
+                self.lp_models.move_to_end(lp_key)
+                PROFILER.count("lp.models_reused")
+        if lp is None:
+            with PROFILER.timer("lp.build"):
+                lp = self.build_lp(SCALED_DEADLINE, seconds_per_timeslot, model, options, round_up)
+            if lp_key is not None:
+                self.lp_models[lp_key] = lp
+                if len(self.lp_models) > LP_MODELS:
+                    self.lp_models.popitem(last=False)
+
+        prob = lp["prob"]
+        starting = lp["starting"]
+        work = lp["work"]
+
+        carbon_cost_at_time = dict(enumerate(carbon.tolist()))
+        objective = pulp.LpAffineExpression(
+            (variables[t], power * carbon_cost_at_time[t]) for t in range(SCALED_DEADLINE) for variables, power in lp["cost"]
+        )
+        if blocked is not None:
+            # more than any schedule without the blocked timeslots costs, so they are only used if nothing else fits
+            blocked_cost = 2 * (np.abs(carbon).sum() * max([power for _, power in lp["cost"]], default=1) + 1)
+            objective += pulp.LpAffineExpression(
+                (variables[t], blocked_cost) for t in np.flatnonzero(blocked).tolist() for variables in (starting, work)
+            )
+        prob.setObjective(objective)
+
+        warm_start = lp_key is not None and self.set_initial_values(lp, arrival_time, seconds_per_timeslot)
+        if warm_start:
+            PROFILER.count("lp.warm_starts")
+
+        solver = get_solver(SolverOptions(
+            name=self.solver_options["name"],
+            threads=self.solver_options["threads"],
+            timelimit=options["timelimit"],
+            max_timeslots=self.solver_options["max_timeslots"],
+        ), warm_start=warm_start)
+
+        with PROFILER.timer("lp.solve"):
+            prob.solve(solver)
+
+        print(f"Status: {pulp.LpStatus[prob.status]}")
+
+        # any solution is a valid start for the next job, e.g. also one found before the time limit
+        if lp_key is not None and prob.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            lp["solution"] = {
+                name: np.round([variables[t].varValue for t in range(SCALED_DEADLINE)])
+                for name, (variables, _) in lp["timeslot_variables"].items()
+            }
+            lp["solution_arrival_time"] = arrival_time
+        return lp
+
+    def solve_timeslots(self, carbon: np.ndarray, seconds_per_timeslot: int, model: PowerFunction, options: SchedulerDebugOptions, arrival_time: int | None, blocked: np.ndarray | None = None) -> TimeslotSolution | None:
+        """Schedule of a job on the coarser timeslots of a multi-resolution solve, with the LP solver or by dynamic
+        programming. Phases that do not fill their last timeslot are rounded up. If the LP solver finds no schedule
+        within its time limit, the timeslots are solved by dynamic programming instead if their states are within MAX_STATES.
+
+        Args:
+            carbon (np.ndarray): carbon intensity per timeslot, the deadline is its length
+            seconds_per_timeslot (int): seconds per timeslot
+            model (PowerFunction): power consumption of the job
+            options (SchedulerDebugOptions): which parts of the problem are modelled
+            arrival_time (int | None): arrival time of the job, to warm start the LP
+            blocked (np.ndarray | None): timeslots in which the job can neither start up nor work
+
+        Returns:
+            TimeslotSolution | None: schedule, None if no schedule was found
+        """
+        if self.solver_options["name"] != "dp":
+            lp = self.solve_lp(carbon, seconds_per_timeslot, model, options, True, arrival_time, blocked, round_up=True)
+            if lp["prob"].sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+                values = {
+                    name: np.array([(pulp.value(lp[name][t]) or 0) > 0.5 for t in range(len(carbon))], dtype=int)
+                    for name in ("starting", "work")
+                }
+                return TimeslotSolution(starting=values["starting"], work=values["work"], optimal=lp["prob"].status == pulp.LpStatusOptimal)
+            if lp["prob"].status == pulp.LpStatusInfeasible:
+                return None
+            # the time limit ended before a schedule was found, the dynamic program solves the same timeslots exactly
+            starts = MAX_STARTS + 1 if options["use_startup"] else 1
+            if dynamic_programming_states(len(carbon), starts, phases_timeslots(model.phases['work'], seconds_per_timeslot, True)) > MAX_STATES:
+                return None
+            print(f"Multi-resolution: no schedule on {seconds_per_timeslot}s timeslots within the time limit, solving them by dynamic programming")
+            PROFILER.count("lp.dp_fallbacks")
+
+        solution = self.solve_dp(carbon, seconds_per_timeslot, model, options, blocked, round_up=True)
+        print(f"Status: {'Optimal' if solution['feasible'] else 'Infeasible'}")
+        if not solution["feasible"]:
+            return None
+        return TimeslotSolution(starting=solution["starting"], work=solution["work"], optimal=True)
+
+    def find_execution_times_multi_resolution(self, carbon_trace: CarbonModel, DEADLINE: int, seconds_per_timeslot: int, fine_carbon: np.ndarray, model: PowerFunction, options: SchedulerDebugOptions, cache_key: str | None, arrival_time: int | None, max_timeslots: int) -> IntervalSchedule:
+        """Schedule a job with more timeslots than max_timeslots coarse to fine. The job is first scheduled on
+        coarse timeslots, then again on the finest timeslots within the bound, but only around the blocks
+        of the coarse schedule. The carbon of the schedule is reported against a lower bound of the fine model.
+
+        Args:
+            carbon_trace (CarbonModel): carbon intensity from the arrival of the job on
+            DEADLINE (int): deadline in seconds
+            seconds_per_timeslot (int): seconds per timeslot of the fine model
+            fine_carbon (np.ndarray): carbon intensity per timeslot of the fine model
+            model (PowerFunction): power consumption of the job
+            options (SchedulerDebugOptions): which parts of the problem are modelled
+            cache_key (str | None): key to cache the schedule with
+            arrival_time (int | None): arrival time of the job, to warm start the coarse LP
+            max_timeslots (int): bound on the timeslots of each solve
+
+        Returns:
+            IntervalSchedule: execution schedule
+        """
+        startup_seconds = int(model.duration_startup) if options["use_startup"] else 0
+        work_seconds = int(model.duration_work)
+
+        work_power, startup_power = self.phase_powers(model, seconds_per_timeslot, options)
+        lower_bound = rearrangement_bound(fine_carbon, work_power, startup_power)
+
+        coarse = coarse_timeslot(len(fine_carbon), seconds_per_timeslot, max_timeslots)
+        edges = np.arange(DEADLINE // coarse + 1) * coarse
+        coarse_solution = self.solve_timeslots(mean_carbon(carbon_trace, edges[:-1], edges[1:]), coarse, model, options, arrival_time)
+        if coarse_solution is None:
+            # the rounded up phases do not fit the coarse timeslots, e.g. the job can hardly wait, or the time limit ended
+            # without a schedule and the timeslots have too many states for the dynamic program,
+            # so the job runs without interruption at its cheapest start
+            start = cheapest_start(fine_carbon, work_power, startup_power)
+            if start is None:
+                print(f"Multi-resolution: no schedule on {coarse}s timeslots, running without interruption")
+                return IntervalSchedule.from_segments(np.array([0]), np.array([startup_seconds + work_seconds]), DEADLINE)
+            cost = blocks_cost([(start, len(startup_power), len(work_power))], fine_carbon, work_power, startup_power)
+            gap = (cost - lower_bound) / cost if cost > 0 else 0.0
+            print(f"Multi-resolution: no schedule on {coarse}s timeslots, running without interruption at {start * seconds_per_timeslot}s, gap to the fine model at most {gap:.2%}")
+            PROFILER.observe("lp.gap", gap)
+            return IntervalSchedule.from_segments(np.array([start * seconds_per_timeslot]), np.array([startup_seconds + work_seconds]), DEADLINE)
+
+        windows = refinement_windows(coarse_solution["starting"] | coarse_solution["work"], coarse, DEADLINE)
+        refined = refined_timeslot(windows, coarse, seconds_per_timeslot, max_timeslots)
+        carbon, blocked, timeline = compressed_timeline(carbon_trace, windows, refined)
+        solution = self.solve_timeslots(carbon, refined, model, options, None, blocked)
+        if solution is None:
+            # the coarse schedule is a schedule on the refined timeslots as well, so only a time limit on
+            # timeslots with too many states for the dynamic program gets here
+            refined, solution, timeline = coarse, coarse_solution, np.arange(len(edges) - 1)
+
+        # blocks begin with their startup, which may directly follow the work of the previous block
+        blocks: List[Tuple[int, int, int]] = []
+        for t in np.flatnonzero(solution["starting"] | solution["work"]).tolist():
+            startup = bool(solution["starting"][t])
+            if len(blocks) == 0 or timeline[t] != blocks[-1][0] + blocks[-1][1] + blocks[-1][2] or (startup and blocks[-1][2] > 0):
+                blocks.append((int(timeline[t]), 0, 0))
+            first, startups, works = blocks[-1]
+            blocks[-1] = (first, startups + startup, works + (not startup))
+
+        # the phases were rounded up to whole timeslots, each block gets the real startup and the remaining work
+        segment_starts, segment_lengths, fine_blocks = [], [], []
+        remaining = work_seconds
+        for first, _, works in blocks:
+            block_work = min(works * refined, remaining)
+            remaining -= block_work
+            if block_work > 0:
+                segment_starts.append(first * refined)
+                segment_lengths.append(startup_seconds + block_work)
+                fine_blocks.append((first * refined // seconds_per_timeslot, startup_seconds // seconds_per_timeslot, block_work // seconds_per_timeslot))
+        schedule = IntervalSchedule.from_segments(np.array(segment_starts), np.array(segment_lengths), DEADLINE)
+
+        cost = blocks_cost(fine_blocks, fine_carbon, work_power, startup_power)
+        gap = (cost - lower_bound) / cost if cost > 0 else 0.0
+        print(f"Multi-resolution: {len(edges) - 1} timeslots of {coarse}s, then {len(carbon)} of {refined}s instead of {len(fine_carbon)} of {seconds_per_timeslot}s, gap to the fine model at most {gap:.2%}")
+        PROFILER.observe("lp.gap", gap)
+
+        if cache_key is not None and coarse_solution["optimal"] and solution["optimal"]:
+            self.schedule_cache.put(cache_key, schedule)
+        return schedule
+
+    def set_initial_values(self, lp: LpModel, arrival_time: int | None, seconds_per_timeslot: int) -> bool:
+        """Start the solver from the previous solution of the LP. If the previous job did not run before this
+        job arrived, its schedule is shifted to the window of this job, so both run at the same times.
+        Otherwise the previous schedule itself is used, it is feasible as the constraints are the same.
+
+        Args:
+            lp (LpModel): LP with the previous solution
+            arrival_time (int | None): arrival time of this job, None if unknown
+            seconds_per_timeslot (int): seconds per timeslot
+
+        Returns:
+            bool: whether initial values were set
+        """
+        solution = lp["solution"]
+        if solution is None:
+            return False
+
+        shift = 0
+        if arrival_time is not None and lp["solution_arrival_time"] is not None:
+            offset = arrival_time - lp["solution_arrival_time"]
+            if offset > 0 and offset % seconds_per_timeslot == 0:
+                shift = offset // seconds_per_timeslot
+        if (solution["starting"][:shift] + solution["work"][:shift]).any():
+            shift = 0
+
+        for name, (variables, keeps_value) in lp["timeslot_variables"].items():
+            values = solution[name]
+            # after the job finished, nothing is active and the progress stays where it was
+            shifted = np.concatenate((values[shift:], np.full(min(shift, len(values)), values[-1] if keeps_value else 0.0)))
+            for t, value in enumerate(shifted.tolist()):
+                variables[t].setInitialValue(value)
+        return True
+
+    def build_lp(self, SCALED_DEADLINE: int, seconds_per_timeslot: int, model: PowerFunction, options: SchedulerDebugOptions, round_up: bool = False) -> LpModel:
+        """Build the constraints of the LP, they only depend on the phases and the deadline of the job
+
+        Args:
+            SCALED_DEADLINE (int): deadline in timeslots
+            seconds_per_timeslot (int): seconds per timeslot
+            model (PowerFunction): power consumption of the job
+            options (SchedulerDebugOptions): which parts of the problem are modelled
+
+        Returns:
+            LpModel: LP without an objective
+        """
+        WORK_LENGTH = phases_timeslots(model.phases['work'], seconds_per_timeslot, round_up)
+        STARTUP_LENGTH = phases_timeslots(model.phases['startup'], seconds_per_timeslot, round_up)
 
         # print(f"WORK_LENGTH={WORK_LENGTH}, STARTUP_LENGTH={STARTUP_LENGTH}")
 
+        # Define the problem, the objective is set for each job
+        prob = pulp.LpProblem("StopResumeCarbonAwareScheduling", pulp.LpMinimize)
+
         # This just needs to be a big number that otherwise won't occur during the LP process
         M = SCALED_DEADLINE * 2 
 
-        carbon_cost_at_time = seconds_carbon_trace['carbon_intensity_avg'].head(SCALED_DEADLINE).to_dict()
+        # the constraints are added for all timeslots at once, variables are referred to by their index
+        constraints = SparseConstraints()
+        variables: List[pulp.LpVariable] = []
+
+        def indices(timeslot_variable: Dict[int, pulp.LpVariable]) -> np.ndarray:
+            variables.extend(timeslot_variable[t] for t in range(SCALED_DEADLINE))
+            return np.arange(len(variables) - SCALED_DEADLINE, len(variables))
+
+        LE, EQ, GE = pulp.LpConstraintLE, pulp.LpConstraintEQ, pulp.LpConstraintGE
 
         starting = pulp.LpVariable.dicts("starting", (t for t in range(SCALED_DEADLINE)), cat="Binary")
         startup_finished = pulp.LpVariable.dicts("start", (t for t in range(SCALED_DEADLINE)), cat="Binary")
@@ -172,31 +508,52 @@ class SuspendSchedulingDynamicPowerPolicy:
 
         # This one will count up the seconds since each start, so we can calculate how which phase we are in
         startup_time_progressed = pulp.LpVariable.dict("startup_time_progressed", (t for t in range(SCALED_DEADLINE)), lowBound=0, upBound=STARTUP_LENGTH, cat=pulp.LpInteger)
-        if options["use_progress"]:
-            # set time_progressed to 0, whenever we start
-            for t in range(SCALED_DEADLINE-1):
-                #https://download.aimms.com/aimms/download/manuals/AIMMS3OM_IntegerProgrammingTricks.pdf 
-                if (STARTUP_LENGTH > 0):
-                    if (t>0):
-                        # be bigger than the previous value IF starting
-                        prob += startup_time_progressed[t] >= startup_time_progressed[t-1] + 1 - (1 - starting[t]) * M
-                        prob += startup_time_progressed[t] <= startup_time_progressed[t-1] + 1 + (1 - starting[t]) * M
-
-                    # IF not starting, be 0
-                    prob += startup_time_progressed[t] <= starting[t] * M 
 
-                    # the general startup_progress needs the previous value, so we need to handle the first timeslot individually
-                    prob += startup_time_progressed[0] == starting[0]
-
-            prob += work_time_progressed[0] == work[0]
-            for t in range(1, SCALED_DEADLINE):
-                if (t > 0):
-                    prob += work_time_progressed[t] == work_time_progressed[t-1] + work[t]
+        starting_index = indices(starting)
+        startup_finished_index = indices(startup_finished)
+        work_index = indices(work)
+        work_time_progressed_index = indices(work_time_progressed)
+        startup_time_progressed_index = indices(startup_time_progressed)
 
+        if options["use_progress"]:
+            # set time_progressed to 0, whenever we start
+            #https://download.aimms.com/aimms/download/manuals/AIMMS3OM_IntegerProgrammingTricks.pdf 
+            if (STARTUP_LENGTH > 0):
+                t = np.arange(1, SCALED_DEADLINE - 1)
+                # be bigger than the previous value IF starting: progressed[t] >= progressed[t-1] + 1 - (1 - starting[t]) * M
+                constraints.add([(startup_time_progressed_index[t], 1), (startup_time_progressed_index[t - 1], -1), (starting_index[t], -M)], GE, 1 - M)
+                constraints.add([(startup_time_progressed_index[t], 1), (startup_time_progressed_index[t - 1], -1), (starting_index[t], M)], LE, 1 + M)
+
+                # IF not starting, be 0
+                t = np.arange(SCALED_DEADLINE - 1)
+                constraints.add([(startup_time_progressed_index[t], 1), (starting_index[t], -M)], LE, 0)
+
+                # the general startup_progress needs the previous value, so we need to handle the first timeslot individually
+                t = np.arange(min(SCALED_DEADLINE - 1, 1))
+                constraints.add([(startup_time_progressed_index[t], 1), (starting_index[t], -1)], EQ, 0)
+
+            t = np.arange(1, SCALED_DEADLINE)
+            constraints.add([(work_time_progressed_index[:1], 1), (work_index[:1], -1)], EQ, 0)
+            constraints.add([(work_time_progressed_index[t], 1), (work_time_progressed_index[t - 1], -1), (work_index[t], -1)], EQ, 0)
+
+        # variables per timeslot and whether they keep their value after the job finished, to shift a solution
+        timeslot_variables: Dict[str, Tuple[Dict[int, pulp.LpVariable], bool]] = {
+            "starting": (starting, False),
+            "startup_finished": (startup_finished, False),
+            "work": (work, False),
+            "work_time_progressed": (work_time_progressed, True),
+            "startup_time_progressed": (startup_time_progressed, False),
+        }
 
         # avert your eyes, for this is cringe
         lin_function_dicts: Dict[str, Dict[str, Dict[str, pulp.LpVariable | float]]] = { }
 
+        # variables that draw power, the carbon cost of each timeslot is their power * the carbon intensity
+        if not options["linearize"] and options["use_startup"]:
+            cost: List[Tuple[Dict[int, pulp.LpVariable], float]] = [(starting, 1), (work, 1)]
+        else:
+            cost = [(work, 1)]
+
         if options["linearize"]:
 
             # we need to linearize our phases.
@@ -211,8 +568,8 @@ class SuspendSchedulingDynamicPowerPolicy:
 
                 lin_function_dicts[phase_key] = { }
 
-                progress_variable = startup_time_progressed if phase_key == 'startup' else work_time_progressed
-                state_variable = starting if phase_key == 'startup' else work
+                progress_index = startup_time_progressed_index if phase_key == 'startup' else work_time_progressed_index
+                state_index = starting_index if phase_key == 'startup' else work_index
 
                 for phase in phases_of_key:
                     if (phase['duration'] == 0):
@@ -228,102 +585,179 @@ class SuspendSchedulingDynamicPowerPolicy:
                     lin_function_dicts[phase_key][phase_name]['upper'] = phase_variable_upper
                     lin_function_dicts[phase_key][phase_name]['lower'] = phase_variable_lower
                     lin_function_dicts[phase_key][phase_name]['power'] = phase['power']
+                    timeslot_variables[phase_name] = (phase_variable, False)
+                    timeslot_variables[phase_name + "_lower"] = (phase_variable_lower, True)
+                    timeslot_variables[phase_name + "_upper"] = (phase_variable_upper, True)
+
+                    lower_index = indices(phase_variable_lower)
+                    upper_index = indices(phase_variable_upper)
+                    phase_index = indices(phase_variable)
 
                     # bounds are [lower, upper) for each phase
                     lower_bound = max(duration, 0) 
                     upper_bound = duration + 1 + (int(phase["duration"]) / seconds_per_timeslot)
 
-                    for t in range(SCALED_DEADLINE):
-
-                        #https://math.stackexchange.com/a/3260529 this is basically magic
-                        # this activates the phase_variable within (lower, upper)
+                    #https://math.stackexchange.com/a/3260529 this is basically magic
+                    # this activates the phase_variable within (lower, upper)
 
-                        prob += progress_variable[t] - lower_bound <= M*phase_variable_lower[t]
-                        prob += lower_bound - progress_variable[t] <= M*(1-phase_variable_lower[t])
+                    # progress - lower_bound <= M * lower and lower_bound - progress <= M * (1 - lower)
+                    constraints.add([(progress_index, 1), (lower_index, -M)], LE, lower_bound)
+                    constraints.add([(progress_index, -1), (lower_index, M)], LE, M - lower_bound)
 
-                        prob += upper_bound - progress_variable[t] <= M*phase_variable_upper[t]
-                        prob += progress_variable[t] - upper_bound <= M*(1-phase_variable_upper[t])
+                    # upper_bound - progress <= M * upper and progress - upper_bound <= M * (1 - upper)
+                    constraints.add([(progress_index, -1), (upper_index, -M)], LE, -upper_bound)
+                    constraints.add([(progress_index, 1), (upper_index, M)], LE, M + upper_bound)
 
-                        prob += phase_variable[t] >= phase_variable_lower[t] + phase_variable_upper[t] + state_variable[t] - 2
-                        prob += phase_variable[t] <= phase_variable_lower[t]
-                        prob += phase_variable[t] <= phase_variable_upper[t]
-                        prob += phase_variable[t] <= state_variable[t]
+                    # the phase is active if and only if lower, upper and the state are
+                    constraints.add([(phase_index, 1), (lower_index, -1), (upper_index, -1), (state_index, -1)], GE, -2)
+                    constraints.add([(phase_index, 1), (lower_index, -1)], LE, 0)
+                    constraints.add([(phase_index, 1), (upper_index, -1)], LE, 0)
+                    constraints.add([(phase_index, 1), (state_index, -1)], LE, 0)
                     
-                    duration += int(phase["duration"]) // seconds_per_timeslot
+                    duration += timeslots(phase["duration"], seconds_per_timeslot, round_up)
 
             # our carbon cost is equal to each phase being active * its power * the amount of carbon per timeslot
-            all_phase_variables_with_power = []
-
+            cost = []
             for overarching_phase in lin_function_dicts.values():
                 for phase_entry in overarching_phase.values():
-                    all_phase_variables_with_power.append((phase_entry['variable'], phase_entry['power']))
-
-            def carbon_cost_at_timeslot(t: int) -> pulp.LpProblem:
-                return reduce(lambda problem, phase_tuple: problem + phase_tuple[0][t] * phase_tuple[1] * carbon_cost_at_time[t], all_phase_variables_with_power, pulp.LpAffineExpression())
-
-        if options["linearize"]:
-            prob += pulp.lpSum([carbon_cost_at_timeslot(t) for t in range(SCALED_DEADLINE)]) 
-        else:
-            if options["use_startup"]:
-                prob += pulp.lpSum([starting[t] * carbon_cost_at_time[t] + work[t] * carbon_cost_at_time[t] for t in range(SCALED_DEADLINE)]) 
-            else: 
-                prob += pulp.lpSum([work[t] * carbon_cost_at_time[t] for t in range(SCALED_DEADLINE)]) 
-
+                    cost.append((phase_entry['variable'], phase_entry['power']))
 
         # spend enough time processing
-        prob += pulp.lpSum(work[t] for t in range(STARTUP_LENGTH, SCALED_DEADLINE)) == WORK_LENGTH
-        prob += pulp.lpSum(work[t] for t in range(STARTUP_LENGTH)) == 0
+        constraints.add_row(work_index[STARTUP_LENGTH:], 1, EQ, WORK_LENGTH)
+        constraints.add_row(work_index[:STARTUP_LENGTH], 1, EQ, 0)
 
         if options["use_startup"]:
-            for t in range(SCALED_DEADLINE - 1):
-                # Ensure the job undergoes the startup phase whenever it resumes
-                # if [0 , 1], this will be 1
-                # t1   t2
-                # 0     0 => 0
-                # 0     1 => 1 
-                # 1     0 => -1 / 0
-                prob += startup_finished[t] >= work[t + 1] - work[t]
-
-                # we can not be in startup and work at the same time
-                prob += startup_finished[t] + work[t] <= 1
-                prob += starting[t] + work[t] <= 1
+            t = np.arange(SCALED_DEADLINE - 1)
+            # Ensure the job undergoes the startup phase whenever it resumes
+            # if [0 , 1], this will be 1
+            # t1   t2
+            # 0     0 => 0
+            # 0     1 => 1 
+            # 1     0 => -1 / 0
+            constraints.add([(startup_finished_index[t], 1), (work_index[t + 1], -1), (work_index[t], 1)], GE, 0)
+
+            # we can not be in startup and work at the same time
+            constraints.add([(startup_finished_index[t], 1), (work_index[t], 1)], LE, 1)
+            constraints.add([(starting_index[t], 1), (work_index[t], 1)], LE, 1)
 
             if (STARTUP_LENGTH > 0):
-                for i in range(STARTUP_LENGTH-1, SCALED_DEADLINE):
-                    prob += pulp.lpSum([starting[i - j] for j in range(STARTUP_LENGTH)]) >= STARTUP_LENGTH * startup_finished[i], f"Contiguity_{i}"
+                i = np.arange(STARTUP_LENGTH - 1, SCALED_DEADLINE)
+                constraints.add(
+                    [(starting_index[i - j], 1) for j in range(STARTUP_LENGTH)] + [(startup_finished_index[i], -STARTUP_LENGTH)],
+                    GE, 0, names=[f"Contiguity_{k}" for k in i.tolist()],
+                )
 
 
         # The solution so far seems to take a really long time, let's also add a maximum amount of startups to hopefully reduce the search space
-        prob += pulp.lpSum([startup_finished[j] for j in range(SCALED_DEADLINE)]) <= 5, f"Max_starts"
-
-        solver = pulp.GUROBI_CMD(timeLimit=options["timelimit"], threads=4)
+        constraints.add_row(startup_finished_index, 1, LE, MAX_STARTS, "Max_starts")
+
+        constraints.add_to(prob, variables)
+
+        return LpModel(
+            prob=prob,
+            starting=starting,
+            startup_finished=startup_finished,
+            work=work,
+            work_time_progressed=work_time_progressed,
+            startup_time_progressed=startup_time_progressed,
+            lin_function_dicts=lin_function_dicts,
+            cost=cost,
+            timeslot_variables=timeslot_variables,
+            solution=None,
+            solution_arrival_time=None,
+        )
 
-        prob.solve(solver)
+    def find_execution_times_dp(self, carbon_cost_at_time: np.ndarray, seconds_per_timeslot: int, model: PowerFunction, options: SchedulerDebugOptions, cache_key: str | None) -> IntervalSchedule | SchedulerDebug:
+        """Solve the same problem as the LP exactly by dynamic programming, without a solver
 
-        print(f"Status: {pulp.LpStatus[prob.status]}")
-
-        schedule = []
+        Args:
+            carbon_cost_at_time (np.ndarray): carbon intensity per timeslot
+            seconds_per_timeslot (int): seconds per timeslot
+            model (PowerFunction): power consumption of the job
+            options (SchedulerDebugOptions): which parts of the LP are modelled
+            cache_key (str | None): key to cache the schedule with, None for debug runs which return the debugging metrics instead
+
+        Returns:
+            IntervalSchedule | SchedulerDebug: execution schedule or debugging metrics
+        """
+        solution = self.solve_dp(carbon_cost_at_time, seconds_per_timeslot, model, options)
 
-        for t in range(SCALED_DEADLINE):
-            is_in_startup = pulp.value(starting[t]) is not None and pulp.value(starting[t])  > 0
-            is_working = pulp.value(work[t]) is not None and pulp.value(work[t])  > 0
+        print(f"Status: {'Optimal' if solution['feasible'] else 'Infeasible'}")
 
-            if (is_in_startup or is_working):
-                # need to scale it back to the seconds-timescale
-                schedule += [1] * seconds_per_timeslot
-            else:
-                schedule += [0] * seconds_per_timeslot
-                # schedule[t*seconds_per_timeslot : ((t+1)*seconds_per_timeslot) + 1] = ([1] * seconds_per_timeslot) -1
+        schedule = IntervalSchedule.from_mask(solution['starting'] | solution['work']).scale(seconds_per_timeslot)
 
-        if (debugOptions is not None):
+        if cache_key is None:
+            lin_function_dicts: Dict[str, Dict[str, Dict[str, Any]]] = {}
+            if options["linearize"]:
+                running_index = 0
+                for phase_key, progress, state in [
+                    ('startup', solution['startup_time_progressed'], solution['starting']),
+                    ('work', solution['work_time_progressed'], solution['work']),
+                ]:
+                    if len(model.phases[phase_key]) == 0:
+                        continue
+                    phases = linearized_phases(model.phases[phase_key], progress, state == 1, seconds_per_timeslot, running_index)
+                    running_index += len(phases)
+                    lin_function_dicts[phase_key] = {
+                        phase_name: {'variable': dict(enumerate(phase['variable'].tolist())), 'power': phase['power']}
+                        for phase_name, phase in phases.items()
+                    }
             return SchedulerDebug(
-                carbon_trace = carbon_cost_at_time,
-                starting = starting,
-                startup_finished = startup_finished,
-                work = work,
-                work_time_progressed = work_time_progressed,
-                startup_time_progressed = startup_time_progressed,
+                carbon_trace = dict(enumerate(carbon_cost_at_time.tolist())),
+                starting = dict(enumerate(solution['starting'].tolist())),
+                startup_finished = dict(enumerate(solution['startup_finished'].tolist())),
+                work = dict(enumerate(solution['work'].tolist())),
+                work_time_progressed = dict(enumerate(solution['work_time_progressed'].tolist())),
+                startup_time_progressed = dict(enumerate(solution['startup_time_progressed'].tolist())),
                 lin_function_dicts = lin_function_dicts
             )
 
+        if solution['feasible']:
+            self.schedule_cache.put(cache_key, schedule)
         return schedule
+
+    def phase_powers(self, model: PowerFunction, seconds_per_timeslot: int, options: SchedulerDebugOptions, round_up: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Power per timeslot of work and startup progress
+
+        Args:
+            model (PowerFunction): power consumption of the job
+            seconds_per_timeslot (int): seconds per timeslot
+            options (SchedulerDebugOptions): which parts of the problem are modelled
+            round_up (bool): round up phases that do not fill their last timeslot, for the coarser timeslots of multi-resolution solves
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: work power and startup power, the startup power is empty without startups
+        """
+        WORK_LENGTH = phases_timeslots(model.phases['work'], seconds_per_timeslot, round_up)
+        STARTUP_LENGTH = phases_timeslots(model.phases['startup'], seconds_per_timeslot, round_up)
+
+        if options["linearize"]:
+            work_power = power_by_progress(model.phases['work'], WORK_LENGTH, seconds_per_timeslot, round_up)
+            startup_power = power_by_progress(model.phases['startup'], STARTUP_LENGTH, seconds_per_timeslot, round_up)
+        else:
+            work_power = np.ones(WORK_LENGTH)
+            startup_power = np.ones(STARTUP_LENGTH)
+        return work_power, startup_power if options["use_startup"] else np.zeros(0)
+
+    def solve_dp(self, carbon: np.ndarray, seconds_per_timeslot: int, model: PowerFunction, options: SchedulerDebugOptions, blocked: np.ndarray | None = None, round_up: bool = False) -> DynamicProgrammingSchedule:
+        """Schedule of a job by dynamic programming
+
+        Args:
+            carbon (np.ndarray): carbon intensity per timeslot
+            seconds_per_timeslot (int): seconds per timeslot
+            model (PowerFunction): power consumption of the job
+            options (SchedulerDebugOptions): which parts of the problem are modelled
+            blocked (np.ndarray | None): timeslots in which the job can neither start up nor work
+            round_up (bool): round up phases that do not fill their last timeslot, for the coarser timeslots of multi-resolution solves
+
+        Returns:
+            DynamicProgrammingSchedule: schedule per timeslot
+        """
+        work_power, startup_power = self.phase_powers(model, seconds_per_timeslot, options, round_up)
+        STARTUP_LENGTH = phases_timeslots(model.phases['startup'], seconds_per_timeslot, round_up)
+
+        with PROFILER.timer("dp.solve"):
+            if options["use_startup"]:
+                return schedule_dynamic_programming(carbon, work_power, startup_power, STARTUP_LENGTH, MAX_STARTS, blocked)
+            # without startups the LP neither has to start up nor limits the amount of starts
+            return schedule_dynamic_programming(carbon, work_power, np.zeros(0), STARTUP_LENGTH, None, blocked)
@@ -1,23 +1,12 @@
 from __future__ import annotations
 from carbon import CarbonModel
-from task import TIME_FACTOR, Task
-from queue import PriorityQueue
+from task import TIME_FACTOR, SubTask, Task
 from cluster import BaseCluster
-from pandas import DataFrame
+from scheduling.interval_schedule import IntervalSchedule
+from scheduling.scheduler_queue import QueueObject, SchedulerQueue
+from scheduling.schedule_cache import ScheduleCache, carbon_window
 from typing import List
-
-
-class QueueObject:
-    def __init__(self, task: Task, max_start_time: int, priority: int):
-        self.task = task
-        self.max_start_time = max_start_time
-        self.priority = priority
-
-    def __lt__(self, other: QueueObject) -> bool:
-        return self.priority < other.priority
-
-    # def __str__(self) -> str:
-    #     return str(self.x)
+import numpy as np
 
 
 class SuspendSchedulingPolicy:
@@ -25,13 +14,14 @@ class SuspendSchedulingPolicy:
     We refer to this policy in the paper as WaitAwhile.
     """
 
-    def __init__(self, cluster: BaseCluster, carbon_model: CarbonModel, optimal: bool) -> None:
+    def __init__(self, cluster: BaseCluster, carbon_model: CarbonModel, optimal: bool, schedule_cache: ScheduleCache | None = None) -> None:
         self.cluster: BaseCluster = cluster
         self.carbon_model: CarbonModel = carbon_model
-        self.queue: PriorityQueue[QueueObject] = PriorityQueue()
+        self.queue = SchedulerQueue()
         self.optimal: bool = optimal
+        self.schedule_cache: ScheduleCache = schedule_cache if schedule_cache is not None else ScheduleCache()
 
-    def compute_schedule_optimal(self, carbon_trace: DataFrame, task: Task) -> List[int]:
+    def compute_schedule_optimal(self, carbon_trace: CarbonModel, task: Task) -> IntervalSchedule:
         """Compute Suspend Resume Schedule WaitAwhile Optimal
 
         Args:
@@ -39,26 +29,20 @@ class SuspendSchedulingPolicy:
             task (Task): current task
 
         Returns:
-            List: execution schedule
+            IntervalSchedule: execution schedule
         """
-        job_length = task.task_length
-        task_schedule = [0] * (task.task_length + task.waiting_time)
-        assert len(task_schedule) == carbon_trace.shape[0]
-        carbon_trace.sort_values(
-            by=[
-                "carbon_intensity_avg",
-                "index",
-            ],
-            inplace=True,
-        )
-        for i, row in carbon_trace.iterrows():
-            if job_length <= 0:
-                break
-            task_schedule[i] = 1
-            job_length -= 1
-        return task_schedule
-
-    def compute_schedule_threshold(self, df: DataFrame, task: Task, mean_value: float) -> List[int]:
+        assert task.task_length + task.waiting_time == len(carbon_trace)
+        # the cheapest seconds are whole blocks of the (hourly) trace, filled in order of their carbon intensity.
+        # A stable sort keeps the earlier block first between equal carbon intensities and the last block is
+        # only used from its beginning, which is the same as sorting the seconds stably
+        starts, lengths, intensity = carbon_trace.blocks()
+        order = np.argsort(intensity, kind="stable")
+        used_before = np.cumsum(lengths[order]) - lengths[order]
+        used = np.zeros(len(lengths), dtype=np.int64)
+        used[order] = np.clip(task.task_length - used_before, 0, lengths[order])
+        return IntervalSchedule.from_segments(starts, used, len(carbon_trace))
+
+    def compute_schedule_threshold(self, carbon_trace: CarbonModel, task: Task, mean_value: float) -> IntervalSchedule:
         """Compute Suspend Resume Schedule WaitAwhile Threshold - Ecovisor
 
         Args:
@@ -66,23 +50,29 @@ class SuspendSchedulingPolicy:
             task (Task): current task
 
         Returns:
-            List: execution schedule
+            IntervalSchedule: execution schedule
         """
+        assert task.task_length + task.waiting_time == len(carbon_trace)
         job_length = task.task_length
-        task_schedule = [0] * (task.task_length + task.waiting_time)
-        
-        assert len(task_schedule) == df.shape[0]
         remaining_waiting = task.waiting_time
-        for i in range(0, len(task_schedule)):
+        segment_starts = []
+        segment_lengths = []
+        # the job runs in every second below the threshold and once it has waited long enough,
+        # all seconds of a block of the (hourly) trace share their carbon intensity
+        for start, length, intensity in zip(*carbon_trace.blocks()):
             if job_length <= 0:
                 break
-            if df["carbon_intensity_avg"][i] < mean_value or remaining_waiting <= 0:
-                task_schedule[i] = 1
-                job_length -= 1
-            else:
-                remaining_waiting -= 1
+            if intensity >= mean_value:
+                waiting = min(remaining_waiting, length)
+                remaining_waiting -= waiting
+                start += waiting
+                length -= waiting
+            running = min(length, job_length)
+            segment_starts.append(start)
+            segment_lengths.append(running)
+            job_length -= running
         assert job_length == 0
-        return task_schedule
+        return IntervalSchedule.from_segments(np.array(segment_starts), np.array(segment_lengths), len(carbon_trace))
 
     def submit(self, current_time: int, task: Task) -> None:
         """Split Task to multiple jobs (suspend-resume) and submit them to GAIA Queue
@@ -96,64 +86,72 @@ class SuspendSchedulingPolicy:
                 current_time, current_time + task.task_length + task.waiting_time
             )
             if self.optimal:
-                schedule = self.compute_schedule_optimal(c_model.df, task)
-            else:
-                mean_value = self.carbon_model.df[
-                    current_time : current_time + int(3600 / TIME_FACTOR * 24)
-                ]["carbon_intensity_avg"].quantile(0.3)
-                schedule = self.compute_schedule_threshold(c_model.df, task, mean_value)
-
-            sub_tasks = []
-            start_times = []
-            tasks = 0
-            i = 0
-            total_execution_time = 0
-            while i < len(schedule):
-                if schedule[i] == 0:
-                    i += 1
-                    continue
-                start = i
-                while i < len(schedule) and schedule[i] == 1:
-                    i = i + 1
-                
-                task_length = i - start
-                subtask = Task(task.ID, current_time, task_length, task.CPUs, total_execution_time, task.power_consumption_function)
-                
-                # we need to keep track of how long each task has run so far, so we can properly call the power consumption
-                total_execution_time += task_length
-                if not self.optimal:
-                    subtask.task_length_class = task.task_length_class
-                sub_tasks.append(subtask)
-                start_times.append(start)
-                tasks += 1
-            assert tasks >= 1 and tasks == len(sub_tasks)
-            if tasks == 1:
-                self.queue.put(
-                    QueueObject(task, current_time + start_times[0], task.arrival_time)
+                schedule = self.schedule_cache.get_or_compute(
+                    ScheduleCache.key(["optimal", task.task_length, task.waiting_time], carbon_window(c_model)),
+                    lambda: self.compute_schedule_optimal(c_model, task),
                 )
             else:
-                for i, subtask in enumerate(sub_tasks):
-                    self.queue.put(
-                        QueueObject(
-                            subtask, current_time + start_times[i], task.arrival_time
-                        )
-                    )
+                mean_value = self.carbon_model.quantile(
+                    0.3, current_time, current_time + int(3600 / TIME_FACTOR * 24)
+                )
+                schedule = self.schedule_cache.get_or_compute(
+                    ScheduleCache.key(["threshold", task.task_length, task.waiting_time, mean_value], carbon_window(c_model)),
+                    lambda: self.compute_schedule_threshold(c_model, task, mean_value),
+                )
+            self.put_schedule(current_time, task, schedule)
         except:
             print("RealClusterCost: Submit Error")
             raise
 
+    def put_schedule(self, current_time: int, task: Task, schedule: IntervalSchedule) -> None:
+        """Queue the executions of a suspend-resume schedule, a task that runs without interruption is queued as is
+
+        Args:
+            current_time (int): time index the schedule starts at
+            task (Task): Task
+            schedule (IntervalSchedule): execution schedule relative to current_time
+        """
+        sub_tasks = []
+        start_times = []
+        tasks = 0
+        total_execution_time = 0
+        for start, task_length in schedule:
+            subtask = SubTask(task, current_time, task_length, total_execution_time)
+            
+            # we need to keep track of how long each task has run so far, so we can properly call the power consumption
+            total_execution_time += task_length
+            if not self.optimal:
+                subtask.task_length_class = task.task_length_class
+            sub_tasks.append(subtask)
+            start_times.append(start)
+            tasks += 1
+        assert tasks >= 1 and tasks == len(sub_tasks)
+        if tasks == 1:
+            self.queue.put(
+                QueueObject(task, current_time + start_times[0], task.arrival_time)
+            )
+        else:
+            for i, subtask in enumerate(sub_tasks):
+                self.queue.put(
+                    QueueObject(
+                        subtask, current_time + start_times[i], task.arrival_time
+                    )
+                )
+
     def execute(self, current_time: int) -> None:
         """Submit ready job/subjob to the simulated or real cluster queue
 
         Args:
             current_time (int): time index
         """
-        queue: PriorityQueue[QueueObject] = PriorityQueue()
-        while not self.queue.empty():
-            queue_object = self.queue.get()
-            if current_time >= queue_object.max_start_time:
-                self.cluster.submit(current_time, queue_object.task)
-            else:
-                queue.put(queue_object)
-        self.queue = queue
+        for queue_object in self.queue.pop_due(current_time):
+            self.cluster.submit(current_time, queue_object.task)
         self.cluster.refresh_data(current_time)
+
+    def next_start_time(self) -> int | None:
+        """Earliest time at which a queued job/subjob becomes due, used by the event-driven simulation
+
+        Returns:
+            int | None: time index or None if the queue is empty
+        """
+        return self.queue.next_start_time()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+import argparse
+from functools import partial
+import itertools
+import os
+import sys
+from typing import Dict, List, Tuple, TypedDict
+
+import pandas as pd
+from carbon import get_carbon_models, CarbonModel
+from task import read_task_trace
+from run import START_INDICES, prepare_experiment, run_parallel
+from profiler import PROFILER
+from scheduling import ScheduleCache, SOLVERS, default_solver_options, default_batch_options
+from cluster import RESULT_FORMATS
+
+LONG = 60 * 60
+SHORT = 30 * 60
+
+# the evaluation grid, previously expanded by generate_evaluation_jobs.sh
+WORK_TYPES = ["periodic-phases", "constant-from-periodic-phases"]
+WORK_PHASES = [
+    # balanced
+    f"[{{'name': 'high', 'power': 200, 'duration': {LONG}}}, {{'name': 'low', 'power': 100, 'duration': {LONG}}}]",
+    # long high
+    f"[{{'name': 'high', 'power': 200, 'duration': {LONG}}}, {{'name': 'low', 'power': 100, 'duration': {SHORT}}}]",
+    # short high
+    f"[{{'name': 'high', 'power': 200, 'duration': {SHORT}}}, {{'name': 'low', 'power': 100, 'duration': {LONG}}}]",
+]
+STARTUP_LENGTHS = [0, 300, 600, 1800]
+STARTUP_POWER_LEVELS = [100, 200]
+WAITING_TIMES = ["6", "12", "24", "48", "96"]
+SCHEDULING_POLICIES = ["carbon", "suspend-resume"]
+CARBON_POLICIES = ["oracle"]
+
+# loaded once by the parent before the pool is forked, workers share them copy-on-write
+_carbon_models: Dict[Tuple[str, int], CarbonModel] = {}
+_task_traces: Dict[str, pd.DataFrame] = {}
+# each worker keeps the schedules of its experiments in memory, the directory is shared by all workers
+_schedule_cache = ScheduleCache()
+
+
+class SweepPoint(TypedDict):
+    scheduling_policy: str
+    carbon_policy: str
+    work_type: str
+    work_phase_index: int
+    startup_length: int
+    startup_power_level: int
+    waiting_time: str
+    start_index: int
+    phases: str
+    filename: str
+
+
+def expand_grid(
+    task_trace: str,
+    scheduling_policies: List[str],
+    carbon_policies: List[str],
+    work_types: List[str],
+    work_phases: List[str],
+    startup_lengths: List[int],
+    startup_power_levels: List[int],
+    waiting_times: List[str],
+    start_indices: List[int],
+) -> List[SweepPoint]:
+    """Cross product of all sweep parameters
+
+    Args:
+        task_trace (str): task trace name, used for the result directory
+        scheduling_policies (List[str]): scheduling algorithms
+        carbon_policies (List[str]): carbon waiting policies
+        work_types (List[str]): power profile types of the jobs
+        work_phases (List[str]): work phases of the jobs
+        startup_lengths (List[int]): startup durations in seconds
+        startup_power_levels (List[int]): startup power draws
+        waiting_times (List[str]): waiting times per queue `x` separated
+        start_indices (List[int]): carbon start indices
+
+    Returns:
+        List[SweepPoint]: one entry per experiment
+    """
+    points = []
+    for scheduling_policy, carbon_policy, work_type, (work_phase_index, work_phase), startup_length, startup_power_level, waiting_time, start_index in itertools.product(
+        scheduling_policies, carbon_policies, work_types, enumerate(work_phases), startup_lengths, startup_power_levels, waiting_times, start_indices
+    ):
+        filename = f"results/simulation/{task_trace}/{scheduling_policy}_{work_type}_{work_phase_index}_{startup_length}_{startup_power_level}_{waiting_time}"
+        # keep the filenames of the job scripts for the default carbon policy, so existing results are reused
+        if len(carbon_policies) > 1 or carbon_policy != "oracle":
+            filename += f"_{carbon_policy}"
+        if len(start_indices) > 1:
+            filename += f"_{start_index}"
+        points.append(SweepPoint(
+            scheduling_policy=scheduling_policy,
+            carbon_policy=carbon_policy,
+            work_type=work_type,
+            work_phase_index=work_phase_index,
+            startup_length=startup_length,
+            startup_power_level=startup_power_level,
+            waiting_time=waiting_time,
+            start_index=start_index,
+            phases=f"{{'startup':[{{'name': 'startup','duration': {startup_length}, 'power': {startup_power_level}}}],'work':{work_phase}}}",
+            filename=filename,
+        ))
+    return points
+
+
+def run_point(point: SweepPoint, args: argparse.Namespace) -> str:
+    """Run a single experiment of the sweep, called in the worker processes
+
+    Args:
+        point (SweepPoint): sweep parameters of the experiment
+        args (argparse.Namespace): parameters shared by all experiments
+
+    Returns:
+        str: result filename
+    """
+    prepare_experiment(
+        point["start_index"],
+        args.carbon_trace,
+        args.task_trace,
+        point["scheduling_policy"],
+        point["carbon_policy"],
+        args.reserved_instances,
+        point["waiting_time"],
+        args.cluster_partition,
+        True,
+        args.dynamic_power_draw,
+        point["work_type"],
+        point["phases"],
+        point["filename"],
+        args.event_driven,
+        carbon_model=_carbon_models[(args.carbon_trace, point["start_index"])],
+        task_trace_df=_task_traces[args.task_trace],
+        solver_options=default_solver_options(args.solver, args.solver_threads, args.solver_timelimit, args.solver_max_timeslots or None),
+        schedule_cache=_schedule_cache,
+        results_format=args.results_format,
+        batch_options=default_batch_options(args.batch_window, args.on_demand_penalty),
+    )
+    return point["filename"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="GAIA: run a grid of experiments in parallel"
+    )
+    parser.add_argument("-c", "--carbon-trace", default="DE-hourly-start-july", type=str, dest="carbon_trace", help="Carbon Trace")
+    parser.add_argument("-t", "--task-trace", default="evaluation_jobs", type=str, dest="task_trace", help="Task Trace")
+    parser.add_argument("-i", "--start-indices", nargs="+", type=int, default=[0], dest="start_indices", help="carbon start indices, -1 for the ones of run.py --start-index -1")
+    parser.add_argument("-r", "--reserved-instances", type=int, default=0, dest="reserved_instances", help="Reserved Instances")
+    parser.add_argument("-p", "--cluster-partition", default="queue1", dest="cluster_partition")
+    parser.add_argument("--scheduling-policies", nargs="+", default=SCHEDULING_POLICIES, dest="scheduling_policies",
+                        choices=["carbon", "carbon-cost", "cost", "suspend-resume", "suspend-resume-threshold", "suspend-resume-batch"])
+    parser.add_argument("--carbon-policies", nargs="+", default=CARBON_POLICIES, dest="carbon_policies",
+                        choices=["waiting", "lowest", "oracle", "cst_oracle", "cst_average"])
+    parser.add_argument("--work-types", nargs="+", default=WORK_TYPES, dest="work_types", help="Power profile types of the jobs")
+    parser.add_argument("--work-phases", nargs="+", default=WORK_PHASES, dest="work_phases", help="Work phases of the jobs, the index is part of the filename")
+    parser.add_argument("--startup-lengths", nargs="+", type=int, default=STARTUP_LENGTHS, dest="startup_lengths", help="Startup durations in seconds")
+    parser.add_argument("--startup-power-levels", nargs="+", type=int, default=STARTUP_POWER_LEVELS, dest="startup_power_levels", help="Startup power draws")
+    parser.add_argument("-w", "--waiting-times", nargs="+", default=WAITING_TIMES, dest="waiting_times", help="Waiting times per queue `x` separated")
+    parser.add_argument(
+        "--dynamic-power-draw",
+        default=True,
+        dest="dynamic_power_draw",
+        action=argparse.BooleanOptionalAction,
+        help="If executed jobs have a power draw depending on time."
+    )
+    parser.add_argument(
+        "--event-driven",
+        default=False,
+        dest="event_driven",
+        action=argparse.BooleanOptionalAction,
+        help="Jump between task arrivals, job starts and resource releases instead of simulating every second. Gives the same results."
+    )
+    parser.add_argument("--solver", default="cbc", dest="solver", choices=SOLVERS, help="LP solver of the suspend-resume scheduler for dynamic power")
+    parser.add_argument("--solver-threads", type=int, default=None, dest="solver_threads", help="Threads per LP solve, by default 1 for cbc and highs and 4 for gurobi")
+    parser.add_argument("--solver-timelimit", type=int, default=20 * 60, dest="solver_timelimit", help="Time limit per LP solve in seconds")
+    parser.add_argument("--solver-max-timeslots", type=int, default=0, dest="solver_max_timeslots", help="Timeslots per LP or dynamic program, e.g. 2000. Longer jobs are solved on coarse timeslots first and refined around their blocks, their schedules are no longer optimal. 0 always solves on the finest timeslots")
+    parser.add_argument("--batch-window", type=float, default=0.25, dest="batch_window", help="Hours of arrivals that suspend-resume-batch plans together, tasks are planned when the window ends so their starts are delayed by up to that long")
+    parser.add_argument("--on-demand-penalty", type=float, default=0.5, dest="on_demand_penalty", help="Weight of a CPU-second on on-demand instances in suspend-resume-batch, as a multiple of the mean carbon intensity. Higher values keep more work on the reserved instances, 0 ignores them")
+    parser.add_argument("--schedule-cache-dir", default=None, dest="schedule_cache_dir", type=str, help="Also store suspend-resume schedules in this directory, so they are reused by other workers and later runs")
+    parser.add_argument("--results-format", default="csv", dest="results_format", choices=RESULT_FORMATS, help="File format of the per task details and the runtime, parquet and feather need pyarrow")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), dest="workers", help="Number of parallel experiments")
+    parser.add_argument("--profile", default=False, dest="profile", action=argparse.BooleanOptionalAction, help="Write a _profile.json and _profile.csv next to the results of each experiment")
+    parser.add_argument(
+        "--repeat",
+        default=False,
+        dest="repeat",
+        action=argparse.BooleanOptionalAction,
+        help="Repeat experiments that are saved already"
+    )
+    args = parser.parse_args()
+    start_indices = list(START_INDICES) if -1 in args.start_indices else args.start_indices
+
+    points = expand_grid(
+        args.task_trace,
+        args.scheduling_policies,
+        args.carbon_policies,
+        args.work_types,
+        args.work_phases,
+        args.startup_lengths,
+        args.startup_power_levels,
+        args.waiting_times,
+        start_indices,
+    )
+    if not args.repeat:
+        points = [point for point in points if not os.path.exists(point["filename"])]
+    print(f"Running {len(points)} experiments with {args.workers} workers")
+    if len(points) == 0:
+        return
+
+    os.makedirs(f"results/simulation/{args.task_trace}", exist_ok=True)
+    PROFILER.enabled = args.profile
+    # the carbon trace is read once, the models of all start indices share its values
+    for start_index, carbon_model in get_carbon_models(args.carbon_trace, start_indices).items():
+        _carbon_models[(args.carbon_trace, start_index)] = carbon_model
+    _task_traces[args.task_trace] = read_task_trace(args.task_trace)
+    PROFILER.keep()
+    global _schedule_cache
+    _schedule_cache = ScheduleCache(directory=args.schedule_cache_dir)
+
+    failed = run_parallel(partial(run_point, args=args), points, args.workers, lambda point: point["filename"])
+    if len(failed) > 0:
+        print(f"{len(failed)} experiments failed:")
+        for filename in failed:
+            print(f"  {filename}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
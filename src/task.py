@@ -1,8 +1,12 @@
+from __future__ import annotations
 from enum import Enum
-import timeit
-from typing import Any, List, Callable, Tuple
+import ast
+import itertools
+from typing import Any, Dict, Iterator, List, Callable, Tuple
 import pandas as pd
 import power_consumption_profiles as pcp
+from trace_cache import read_trace
+from profiler import PROFILER
 from typing import Literal
 import numpy as np
 
@@ -111,31 +115,162 @@ def classify_resources(cpus: int) -> str:
         return "64+"
 
 
+LENGTH_CLASSES = ("0-2", "2-6", "6-12", "12-24", "24-48", "48+")
+RESOURCE_CLASSES = ("1", "2", "3-4", "5-8", "9-16", "17-32", "33-64", "64+")
+QUEUES = ("Same", TwoQueues.Short.name, TwoQueues.Long.name)
+
+# tasks that stream_tasks creates at once
+TASK_CHUNK_SIZE = 10000
+
+
+class TaskTable:
+    """Columns of all tasks of a trace, in order of arrival. The classes and the queue are stored as codes,
+    the power profiles as index into power_functions, so tasks with the same profile share one PowerFunction.
+    The waiting times and average lengths have to be set before.
+    """
+
+    def __init__(self, ids: np.ndarray, arrival_times: np.ndarray, lengths: np.ndarray, cpus: np.ndarray, power_profiles: np.ndarray, power_functions: List[pcp.PowerFunction]) -> None:
+        """
+        Args:
+            ids (np.ndarray): task IDs
+            arrival_times (np.ndarray): arrival time of each task
+            lengths (np.ndarray): length of each task
+            cpus (np.ndarray): number of CPUs of each task
+            power_profiles (np.ndarray): index of the power function of each task
+            power_functions (List[pcp.PowerFunction]): distinct power functions
+        """
+        lengths = np.asarray(lengths, dtype=float)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.arrival_times = np.asarray(arrival_times, dtype=float).astype(np.int64)
+        self.lengths = np.maximum(lengths.astype(np.int64), 1)
+        self.length_classes = class_codes(lengths, classify_time, LENGTH_CLASSES)
+        self.cpus = np.asarray(cpus).astype(np.int64)
+        self.resource_classes = class_codes(self.cpus, classify_resources, RESOURCE_CLASSES)
+        self.power_profiles = np.asarray(power_profiles, dtype=np.int32)
+        self.power_functions = power_functions
+
+        # the queue only depends on the length, so it is looked up once per distinct length
+        unique_lengths, inverse = np.unique(self.lengths, return_inverse=True)
+        expected = [get_expected_time(length) for length in unique_lengths.tolist()]
+        self.expected_times = np.array([int(e[0]) for e in expected], dtype=np.int64)[inverse]
+        self.waiting_times = np.array([int(e[1]) for e in expected], dtype=np.int64)[inverse]
+        self.queues = np.array([QUEUES.index(e[2]) for e in expected], dtype=np.int8)[inverse]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, row: int) -> Task:
+        return Task(self, row)
+
+    def __iter__(self) -> Iterator[Task]:
+        return (Task(self, row) for row in range(len(self)))
+
+
+def class_codes(values: np.ndarray, classify: Callable[[Any], str], classes: Tuple[str, ...]) -> np.ndarray:
+    """Classify each distinct value once
+
+    Args:
+        values (np.ndarray): values to classify
+        classify (Callable[[Any], str]): classify_time or classify_resources
+        classes (Tuple[str, ...]): all classes classify returns
+
+    Returns:
+        np.ndarray: index of the class of each value
+    """
+    unique_values, inverse = np.unique(values, return_inverse=True)
+    return np.array([classes.index(classify(value)) for value in unique_values.tolist()], dtype=np.int8)[inverse]
+
+
 class Task:
-    def __init__(self, id:int, arrival_time: float, task_length: float, CPUs: int, total_execution_time: int, power_consumption_function: pcp.PowerFunction) -> None:
-        """Task Class
+    """Task of a TaskTable. It is a view of a row of the table and has no state of its own."""
+    __slots__ = ("table", "row")
+
+    def __init__(self, table: TaskTable, row: int) -> None:
+        """
+        Args:
+            table (TaskTable): tasks of the trace
+            row (int): row of the task in the table
+        """
+        self.table = table
+        self.row = row
+
+    @property
+    def ID(self) -> int:
+        return int(self.table.ids[self.row])
+
+    @property
+    def arrival_time(self) -> int:
+        return int(self.table.arrival_times[self.row])
+
+    @property
+    def task_length(self) -> int:
+        return int(self.table.lengths[self.row])
+
+    @property
+    def task_length_class(self) -> str:
+        return LENGTH_CLASSES[self.table.length_classes[self.row]]
+
+    @property
+    def expected_time(self) -> int:
+        return int(self.table.expected_times[self.row])
 
+    @property
+    def waiting_time(self) -> int:
+        return int(self.table.waiting_times[self.row])
+
+    @property
+    def queue(self) -> str:
+        return QUEUES[self.table.queues[self.row]]
+
+    @property
+    def CPUs(self) -> int:
+        return int(self.table.cpus[self.row])
+
+    @property
+    def CPUs_class(self) -> str:
+        return RESOURCE_CLASSES[self.table.resource_classes[self.row]]
+
+    @property
+    def total_execution_time(self) -> int:
+        return 0
+
+    @property
+    def power_consumption_function(self) -> pcp.PowerFunction:
+        """function that takes (seconds since beginning of job) and returns energy usage in W"""
+        return self.table.power_functions[self.table.power_profiles[self.row]]
+
+
+class SubTask(Task):
+    """Part of a task, e.g. one execution of a suspended task or a task with the expected length.
+    It references the row of its parent, only arrival, length and progress are its own.
+    """
+    __slots__ = ("arrival_time", "task_length", "task_length_class", "total_execution_time")
+
+    def __init__(self, parent: Task, arrival_time: float, task_length: float, total_execution_time: int) -> None:
+        """
         Args:
-            id (int): task ID
+            parent (Task): task this is a part of
             arrival_time (float): arrival time
             task_length (float): task length
-            CPUs (int): number of CPUs
-            power_consumption_function: function that takes (seconds since beginning of job) and returns energy usage in W
+            total_execution_time (int): seconds the parent has run before this part
         """
-        self.ID = id
+        super().__init__(parent.table, parent.row)
         self.arrival_time = int(arrival_time)
         self.task_length = max(int(task_length), 1)
-
         self.task_length_class = classify_time(task_length)
-        expected_time, waiting_time, queue = get_expected_time(
-            self.task_length)
-        self.expected_time = int(expected_time)
-        self.CPUs = int(CPUs)
-        self.CPUs_class = classify_resources(self.CPUs)
-        self.queue = queue
-        self.waiting_time = int(waiting_time)
         self.total_execution_time = total_execution_time
-        self.power_consumption_function = power_consumption_function
+
+    @property
+    def expected_time(self) -> int:
+        return int(get_expected_time(self.task_length)[0])
+
+    @property
+    def waiting_time(self) -> int:
+        return int(get_expected_time(self.task_length)[1])
+
+    @property
+    def queue(self) -> str:
+        return get_expected_time(self.task_length)[2]
 
 
 def load_tasks(trace_name:str, use_dynamic_power: bool, default_job_type: str | None = None, default_job_phases: str | None = None) -> List[Task]:
@@ -148,42 +283,198 @@ def load_tasks(trace_name:str, use_dynamic_power: bool, default_job_type: str |
         List[Task]: List of Tasks
     """
     print(f"Started Loading Tasks for {trace_name}")
-    start = timeit.default_timer()
-    tasks = []
-    df = pd.read_csv(
-        f"src/cluster_traces/{trace_name}.csv", delimiter='|')
-    
-    df["arrival_time"]/= TIME_FACTOR
-    df["length"]/= TIME_FACTOR
+    return create_tasks(read_task_trace(trace_name), use_dynamic_power, default_job_type, default_job_phases)
+
+
+@PROFILER.timed("trace.tasks.read")
+def read_task_trace(trace_name: str) -> pd.DataFrame:
+    """Read Task Trace without creating tasks, so it can be shared between experiments
+
+    Args:
+        trace_name (str): trace name
+
+    Returns:
+        pd.DataFrame: one row per task
+    """
+    path = f"src/cluster_traces/{trace_name}.csv"
+    return read_trace(path, sniff_delimiter(path))
+
+
+def sniff_delimiter(path: str) -> str:
+    """The traces are either '|' or comma delimited, the phase specs contain commas themselves
+
+    Args:
+        path (str): path of the task trace
+
+    Returns:
+        str: delimiter of the trace
+    """
+    with open(path) as file:
+        header = file.readline()
+    return '|' if '|' in header else ','
+
+
+def create_tasks(trace: pd.DataFrame, use_dynamic_power: bool, default_job_type: str | None = None, default_job_phases: str | None = None) -> List[Task]:
+    """Create Tasks from a Task Trace. The waiting times have to be set before.
+
+    Args:
+        trace (pd.DataFrame): task trace as read by read_task_trace, it is not modified
+
+    Returns:
+        List[Task]: List of Tasks in order of arrival
+    """
+    return list(stream_tasks(trace, use_dynamic_power, default_job_type, default_job_phases))
+
+
+def stream_tasks(trace: pd.DataFrame, use_dynamic_power: bool, default_job_type: str | None = None, default_job_phases: str | None = None, chunk_size: int = TASK_CHUNK_SIZE) -> Iterator[Task]:
+    """Create Tasks from a Task Trace while they are consumed, in order of arrival. The rows of the next
+    chunk_size tasks are only read from the trace once the previous chunk is used up, so the tasks of a
+    chunk are freed after the simulation finished them. The waiting times have to be set before, the
+    tasks are ordered and the power profiles parsed right away.
+
+    Args:
+        trace (pd.DataFrame): task trace as read by read_task_trace, it is not modified
+        chunk_size (int): tasks that are created at once
+
+    Returns:
+        Iterator[Task]: tasks in order of arrival
+    """
+    return itertools.chain.from_iterable(task_table_chunks(trace, use_dynamic_power, default_job_type, default_job_phases, chunk_size))
+
+
+def task_table_chunks(trace: pd.DataFrame, use_dynamic_power: bool, default_job_type: str | None = None, default_job_phases: str | None = None, chunk_size: int = TASK_CHUNK_SIZE) -> Iterator[TaskTable]:
+    """TaskTables of consecutive chunks of the tasks in order of arrival, they share their power functions.
+    The waiting times have to be set before, the average lengths are set and the tasks ordered right away,
+    the tables are built while they are consumed.
+
+    Args:
+        trace (pd.DataFrame): task trace as read by read_task_trace, it is not modified
+        chunk_size (int): tasks per table
+
+    Returns:
+        Iterator[TaskTable]: tables in order of arrival
+    """
+    order = arrival_order(trace)
+    power_profiles = PowerProfiles(trace, use_dynamic_power, default_job_type, default_job_phases)
+    return _build_chunks(trace, order, power_profiles, chunk_size)
+
+
+def _build_chunks(trace: pd.DataFrame, order: np.ndarray, power_profiles: PowerProfiles, chunk_size: int) -> Iterator[TaskTable]:
+    for start in range(0, len(order), chunk_size):
+        with PROFILER.timer("trace.tasks.create"):
+            table = build_task_table(trace, order[start:start + chunk_size], power_profiles)
+        yield table
+
+
+@PROFILER.timed("trace.tasks.create")
+def create_task_table(trace: pd.DataFrame, use_dynamic_power: bool, default_job_type: str | None = None, default_job_phases: str | None = None) -> TaskTable:
+    """Create the TaskTable of a Task Trace. The waiting times have to be set before, the average lengths are set right away.
+
+    Tasks with the same power profile share one PowerFunction, each phase spec is only parsed once.
+
+    Args:
+        trace (pd.DataFrame): task trace as read by read_task_trace, it is not modified
+
+    Returns:
+        TaskTable: tasks in order of arrival
+    """
+    return build_task_table(trace, arrival_order(trace), PowerProfiles(trace, use_dynamic_power, default_job_type, default_job_phases))
+
+
+def arrival_order(trace: pd.DataFrame) -> np.ndarray:
+    """Set the average lengths of the trace and order its rows by arrival
+
+    Args:
+        trace (pd.DataFrame): task trace as read by read_task_trace
+
+    Returns:
+        np.ndarray: row of each task in order of arrival
+    """
+    length_column = trace["length"] / TIME_FACTOR
     av_l = [
-        df[df["length"] <= TwoQueues.Short.value]["length"].mean(), 
-        df[df["length"] >= TwoQueues.Short.value]["length"].mean()
+        length_column[length_column <= TwoQueues.Short.value].mean(),
+        length_column[length_column >= TwoQueues.Short.value].mean()
     ]
     set_average_length(av_l)
-    #print(f"{trace_name} average {av_l[1]}")
-    # df = df[:10000]
-    #ids = df["id"].unique()        
-
-    for id, row in df.iterrows():
-        if (use_dynamic_power):
-            job_name: str = default_job_type if default_job_type is not None else row.get("name", 'constant')
-            job_args: Tuple[Any] = eval(default_job_phases) if default_job_phases is not None else eval(row.get("args", "None"))
-
-            print(f"job_args: {job_args}")
-
-            if (job_name == 'periodic-phases' or job_name == 'constant-from-periodic-phases'):
-                # stupid hack, but we need the job length to be equal to phases's sum
-                power_consumption = pcp.get_power_policy(job_name, (job_args,row["length"]))
-            else:
-                power_consumption = pcp.get_power_policy(job_name, job_args)
+    return np.argsort(trace["arrival_time"].to_numpy(dtype=float) / TIME_FACTOR, kind='stable')
+
+
+def build_task_table(trace: pd.DataFrame, rows: np.ndarray, power_profiles: PowerProfiles) -> TaskTable:
+    """TaskTable of some rows of a Task Trace
+
+    Args:
+        trace (pd.DataFrame): task trace as read by read_task_trace
+        rows (np.ndarray): rows of the tasks, in order of arrival
+        power_profiles (PowerProfiles): power functions of the trace
+
+    Returns:
+        TaskTable: tasks of the rows
+    """
+    arrival_times = trace["arrival_time"].to_numpy(dtype=float)[rows] / TIME_FACTOR
+    lengths = trace["length"].to_numpy(dtype=float)[rows] / TIME_FACTOR
+    return TaskTable(
+        np.asarray(trace.index[rows]), arrival_times, lengths, trace["cpus"].to_numpy()[rows],
+        power_profiles.indices(rows, lengths), power_profiles.functions,
+    )
+
+
+class PowerProfiles:
+    """Power functions of the tasks of a trace. Tasks with the same power profile share one PowerFunction,
+    each phase spec is only parsed once.
+    """
+
+    def __init__(self, trace: pd.DataFrame, use_dynamic_power: bool, default_job_type: str | None = None, default_job_phases: str | None = None) -> None:
+        """
+        Args:
+            trace (pd.DataFrame): task trace as read by read_task_trace
+            use_dynamic_power (bool): use the power profiles of the trace or the defaults, otherwise all tasks draw constant power
+            default_job_type (str | None): power profile type of all tasks instead of the one in the trace
+            default_job_phases (str | None): phases of all tasks instead of the ones in the trace
+        """
+        self.trace = trace
+        self.use_dynamic_power = use_dynamic_power
+        self.default_job_type = default_job_type
+        self.default_job_phases = default_job_phases
+        self.functions: List[pcp.PowerFunction] = [] if use_dynamic_power else [pcp.get_power_policy('constant', 1)]
+        self.profiles: Dict[Tuple[str, Any, float | None], int] = {}
+        self.job_args: Dict[Any, Any] = {}
+
+    def indices(self, rows: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """Power function of each task, new ones are appended to functions
+
+        Args:
+            rows (np.ndarray): rows of the tasks in the trace
+            lengths (np.ndarray): length of each task
+
+        Returns:
+            np.ndarray: index into functions of each task
+        """
+        n = len(rows)
+        if not self.use_dynamic_power:
+            return np.zeros(n, dtype=np.int32)
+
+        if self.default_job_type is not None or "name" not in self.trace.columns:
+            names = [self.default_job_type if self.default_job_type is not None else 'constant'] * n
+        else:
+            names = self.trace["name"].iloc[rows].tolist()
+        if self.default_job_phases is not None or "args" not in self.trace.columns:
+            specs = [self.default_job_phases] * n
         else:
-            power_consumption = pcp.get_power_policy('constant', 1)
-
-        # currently, only jobs longer than an hour are supported because
-        # the jobs are submitted to the cluster on an hour-basis
-        # assert row["length"] >= 300/TIME_FACTOR, "Too short Job"
-        tasks.append(Task(id ,row["arrival_time"],
-                          row["length"], row["cpus"], total_execution_time=0, power_consumption_function=power_consumption))
-    #assert len(ids) == len(tasks)
-    #print(f"Loading {trace_name} tasks took {timeit.default_timer()-start}")
-    return tasks
+            specs = self.trace["args"].iloc[rows].tolist()
+
+        power_profiles = np.zeros(n, dtype=np.int32)
+        for i, (job_name, spec, length) in enumerate(zip(names, specs, lengths.tolist())):
+            # periodic phases are repeated up to the job length, so the profile depends on it as well
+            periodic = job_name == 'periodic-phases' or job_name == 'constant-from-periodic-phases'
+            key = (job_name, spec, length if periodic else None)
+            if key not in self.profiles:
+                if spec not in self.job_args:
+                    self.job_args[spec] = ast.literal_eval(spec) if isinstance(spec, str) else None
+                if periodic:
+                    # stupid hack, but we need the job length to be equal to phases's sum
+                    self.functions.append(pcp.get_power_policy(job_name, (self.job_args[spec], length)))
+                else:
+                    self.functions.append(pcp.get_power_policy(job_name, self.job_args[spec]))
+                self.profiles[key] = len(self.functions) - 1
+            power_profiles[i] = self.profiles[key]
+        return power_profiles
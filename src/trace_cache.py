@@ -0,0 +1,129 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+# the binary copies of a trace are kept next to it in this directory
+TRACE_CACHE_DIRECTORY = ".trace_cache"
+
+
+def read_trace(path: str, delimiter: str = ',') -> pd.DataFrame:
+    """Read a CSV trace. The first time, each column is converted to a .npy file, afterwards the columns
+    are memory-mapped, so processes reading the same trace share its pages. Text columns are stored
+    dictionary encoded, as codes and categories. The copy is used as long as the trace has the same
+    modification time and size, or else the same content hash.
+
+    The columns are read-only.
+
+    Args:
+        path (str): path of the CSV trace
+        delimiter (str): delimiter of the CSV trace
+
+    Returns:
+        pd.DataFrame: trace
+    """
+    cache_directory = os.path.join(os.path.dirname(path), TRACE_CACHE_DIRECTORY)
+    name = os.path.basename(path)
+    meta_path = os.path.join(cache_directory, f"{name}.json")
+
+    stat = os.stat(path)
+    meta: Dict[str, Any] | None = None
+    previous_directory: str | None = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as file:
+            meta = json.load(file)
+        previous_directory = meta["columns_directory"]
+        if meta["delimiter"] != delimiter:
+            meta = None
+        elif meta["mtime_ns"] != stat.st_mtime_ns or meta["size"] != stat.st_size:
+            # e.g. after a checkout, the trace is only converted again if its content changed
+            if meta["sha256"] != file_hash(path):
+                meta = None
+            else:
+                meta.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+                write_meta(meta_path, meta)
+    if meta is not None and os.path.isdir(os.path.join(cache_directory, meta["columns_directory"])):
+        return load_columns(os.path.join(cache_directory, meta["columns_directory"]), meta)
+
+    df = pd.read_csv(path, delimiter=delimiter)
+    sha256 = file_hash(path)
+    meta = dict(
+        delimiter=delimiter,
+        mtime_ns=stat.st_mtime_ns,
+        size=stat.st_size,
+        sha256=sha256,
+        # the columns of a version of the trace are never changed, so readers never see a partial copy
+        columns_directory=f"{name}-{hashlib.sha256(f'{sha256}{delimiter}'.encode()).hexdigest()[:16]}",
+        columns=[],
+    )
+    try:
+        os.makedirs(cache_directory, exist_ok=True)
+        store_columns(os.path.join(cache_directory, meta["columns_directory"]), df, meta)
+        write_meta(meta_path, meta)
+        if previous_directory is not None and previous_directory != meta["columns_directory"]:
+            # processes that still map the previous version keep their pages
+            shutil.rmtree(os.path.join(cache_directory, previous_directory), ignore_errors=True)
+    except OSError as e:
+        # e.g. a read-only checkout, the trace is parsed every time then
+        print(f"Could not cache {path}: {e}")
+    return df
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_columns(directory: str, df: pd.DataFrame, meta: Dict[str, Any]) -> None:
+    """Write one .npy file per column, text columns as codes and categories
+
+    Args:
+        directory (str): directory of this version of the trace
+        df (pd.DataFrame): trace
+        meta (Dict[str, Any]): metadata, the columns are added to it
+    """
+    tmp_directory = f"{directory}.{os.getpid()}.tmp"
+    os.makedirs(tmp_directory, exist_ok=True)
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if values.dtype == object:
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(tmp_directory, f"{i}.npy"), codes.astype(np.int32))
+            np.save(os.path.join(tmp_directory, f"{i}-categories.npy"), np.asarray(categories, dtype=str))
+            meta["columns"].append(dict(name=column, encoded=True))
+        else:
+            np.save(os.path.join(tmp_directory, f"{i}.npy"), values.to_numpy())
+            meta["columns"].append(dict(name=column, encoded=False))
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # another process converted the same version first
+        shutil.rmtree(tmp_directory, ignore_errors=True)
+        if not os.path.isdir(directory):
+            raise
+
+
+def load_columns(directory: str, meta: Dict[str, Any]) -> pd.DataFrame:
+    columns = {}
+    for i, column in enumerate(meta["columns"]):
+        values = np.load(os.path.join(directory, f"{i}.npy"), mmap_mode="r")
+        if column["encoded"]:
+            categories = np.load(os.path.join(directory, f"{i}-categories.npy"))
+            values = pd.Categorical.from_codes(values, categories.astype(object))
+        columns[column["name"]] = values
+    return pd.DataFrame(columns, copy=False)
+
+
+def write_meta(meta_path: str, meta: Dict[str, Any]) -> None:
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(meta, file)
+    os.replace(tmp_path, meta_path)